@@ -0,0 +1,37 @@
+"""
+Shared bootstrap for the benchmark scripts.
+
+Benchmarks run against a scratch SQLite file so they never touch
+db.sqlite3; pass the same path again to reuse an already generated dataset.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup(db_path):
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+
+    from django.conf import settings
+    settings.DATABASES["default"]["NAME"] = str(db_path)
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+
+
+def timed(fn, repeat=20):
+    """Run `fn` `repeat` times and return the median wall time in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
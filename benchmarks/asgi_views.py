@@ -0,0 +1,160 @@
+"""
+Compare the sync views under WSGI with the async views under ASGI.
+
+    python -m benchmarks.asgi_views --concurrency 200 --requests 5000
+
+Each mode runs in its own process, with POLLS_ASYNC_VIEWS off for WSGI and
+on for ASGI as mysite/asgi.py sets it, and drives Django's handler
+in-process: WSGI with a pool of `--concurrency` threads, ASGI with
+`--concurrency` coroutines on one event loop. Requests cycle through the
+index, category, details and results pages. Reports requests per second and
+the p50 and p99 latency. No server is involved, so the numbers measure the
+request handling of the two stacks only.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import _django
+
+
+def populate(questions):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Category, Question, Choice
+
+    if Question.objects.exists():
+        return
+    user = User.objects.create(username="benchmark")
+    category = Category.objects.create(category_name="Benchmark")
+    now = timezone.now()
+    created = Question.objects.bulk_create(
+        Question(category=category, created_by=user, question_text=f"Question {index}",
+                 pub_date=now - timezone.timedelta(minutes=index))
+        for index in range(questions)
+    )
+    Choice.objects.bulk_create(
+        Choice(question=question, choice_text=text) for question in created for text in ("Yes", "No")
+    )
+
+
+def paths(sample=20):
+    from polls.models import Question
+
+    ids = list(Question.objects.order_by("-pub_date").values_list("pk", flat=True)[:sample])
+    return ["/polls/", "/polls/category/Benchmark"] + [
+        path for pk in ids for path in (f"/polls/{pk}/", f"/polls/results/{pk}")
+    ]
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+
+def run_wsgi(urls, concurrency, requests):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    handler = WSGIHandler()
+    errors = []
+
+    def request(index):
+        environ = {
+            "REQUEST_METHOD": "GET", "PATH_INFO": urls[index % len(urls)], "QUERY_STRING": "",
+            "SERVER_NAME": "localhost", "SERVER_PORT": "80", "HTTP_HOST": "localhost",
+            "wsgi.input": sys.stdin.buffer, "wsgi.url_scheme": "http",
+        }
+        start = time.perf_counter()
+        response = handler(environ, lambda status, headers: status.startswith("200") or errors.append(status))
+        b"".join(response)
+        response.close()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(request, range(requests))), len(errors)
+
+
+def run_asgi(urls, concurrency, requests):
+    from django.core.handlers.asgi import ASGIHandler
+
+    handler = ASGIHandler()
+    latencies = []
+    errors = []
+
+    async def request(index):
+        scope = {
+            "type": "http", "method": "GET", "path": urls[index % len(urls)], "query_string": b"",
+            "headers": [(b"host", b"localhost")], "server": ("localhost", 80), "client": ("127.0.0.1", 0),
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start" and message["status"] != 200:
+                errors.append(message["status"])
+
+        start = time.perf_counter()
+        await handler(scope, receive, send)
+        latencies.append(time.perf_counter() - start)
+
+    async def worker(indexes):
+        for index in indexes:
+            await request(index)
+
+    async def main():
+        await asyncio.gather(*(worker(range(start, requests, concurrency)) for start in range(concurrency)))
+
+    asyncio.run(main())
+    return latencies, len(errors)
+
+
+def child(args):
+    _django.setup(args.db)
+    from django.conf import settings
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ["localhost"]
+    urls = paths()
+    runner = run_asgi if args.child == "asgi" else run_wsgi
+    runner(urls, args.concurrency, len(urls))  # warm the caches
+    start = time.perf_counter()
+    latencies, errors = runner(urls, args.concurrency, args.requests)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{args.child}: {len(latencies) / elapsed:,.0f} req/s, p50 {percentile(latencies, 0.5):.1f} ms, "
+        f"p99 {percentile(latencies, 0.99):.1f} ms, {errors} non-200 responses"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--questions", type=int, default=1000)
+    parser.add_argument("--db", type=Path, default=Path(tempfile.gettempdir()) / "polls_asgi_bench.sqlite3")
+    parser.add_argument("--child", choices=["wsgi", "asgi"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    _django.setup(args.db)
+    populate(args.questions)
+    for mode in ("wsgi", "asgi"):
+        env = dict(os.environ, POLLS_ASYNC_VIEWS="1" if mode == "asgi" else "0")
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.asgi_views", "--child", mode, "--db", str(args.db),
+             "--concurrency", str(args.concurrency), "--requests", str(args.requests)],
+            env=env, check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compare logged-in requests with database sessions and with cached sessions and users.
+
+    python -m benchmarks.cached_sessions --repeat 200
+
+Logs a user in with Django's test client and requests the about, index and
+details pages, first with the database session engine and ModelBackend, as
+before, then with the cached_db engine and login.backends.CachedModelBackend
+caching users, as the settings have it with a shared cache. Reports the
+queries per request and the median latency, with the default local memory
+cache, which one process can use as if it were shared.
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+from . import _django
+
+MODES = {
+    "db sessions": {
+        "SESSION_ENGINE": "django.contrib.sessions.backends.db",
+        "AUTHENTICATION_BACKENDS": ["django.contrib.auth.backends.ModelBackend"],
+    },
+    "cached": {
+        "SESSION_ENGINE": "django.contrib.sessions.backends.cached_db",
+        "AUTHENTICATION_BACKENDS": ["login.backends.CachedModelBackend"],
+        "LOGIN_USER_CACHE_TIMEOUT": 300,
+    },
+}
+
+
+def populate():
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Category, Question
+
+    if User.objects.filter(username="benchmark").exists():
+        return
+    user = User.objects.create_user("benchmark", password="benchmark password")
+    category = Category.objects.create(category_name="Benchmark")
+    question = Question.objects.create(
+        category=category, created_by=user, question_text="Question", pub_date=timezone.now()
+    )
+    question.choice_set.create(choice_text="Yes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--db", type=Path, default=Path(tempfile.gettempdir()) / "polls_sessions_bench.sqlite3")
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    populate()
+
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.urls import reverse
+    from polls.models import Question
+
+    settings.ALLOWED_HOSTS = ["*"]
+    user = User.objects.get(username="benchmark")
+    urls = {
+        "about": reverse("polls:about"),
+        "index": reverse("polls:index"),
+        "details": reverse("polls:details", args=(Question.objects.first().pk, )),
+    }
+    print(f"{'mode':>12}  {'page':>8}  {'queries':>7}  {'ms':>6}")
+    for mode, overrides in MODES.items():
+        with override_settings(**overrides):
+            client = Client()
+            client.force_login(user)
+            for page, url in urls.items():
+                client.get(url)
+                # Not CaptureQueriesContext: every request resets connection.queries
+                queries = []
+
+                def count(execute, sql, *rest):
+                    queries.append(sql)
+                    return execute(sql, *rest)
+
+                with connection.execute_wrapper(count):
+                    client.get(url)
+                ms = _django.timed(lambda: client.get(url), args.repeat)
+                print(f"{mode:>12}  {page:>8}  {len(queries):>7}  {ms:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
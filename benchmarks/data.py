@@ -0,0 +1,118 @@
+"""
+Generate a reproducible poll site dataset for the benchmark suite.
+
+    python -m benchmarks.data --users 1000 --categories 10 --polls 2000 --votes-per-poll 50
+
+Creates `--users` users (all with the password PASSWORD), and `--polls` polls
+of 2 to 4 choices spread over `--categories` categories and the last 30
+days, with on average `--votes-per-poll` votes each from random users. The
+polls go through the bulk importer (polls.importer), so the vote counters
+and category stats come out consistent. The same arguments and `--seed`
+always produce the same data. Does nothing if the database already has
+polls.
+"""
+import argparse
+import datetime
+import json
+import random
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from . import _django
+
+PASSWORD = "benchmark password"
+
+
+def generate(users, categories, polls, votes_per_poll, seed=1):
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from polls.importer import PollImporter
+    from polls.models import Question
+
+    if Question.objects.exists():
+        return
+    rng = random.Random(seed)
+    usernames = [f"user{index}" for index in range(users)]
+    password = make_password(PASSWORD)
+    User.objects.bulk_create((User(username=username, password=password) for username in usernames), batch_size=1000)
+
+    now = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+    with tempfile.TemporaryDirectory() as directory:
+        source = Path(directory) / "polls.jsonl"
+        with open(source, "w") as output:
+            for index in range(polls):
+                texts = [f"Choice {number}" for number in range(rng.randint(2, 4))]
+                voters = rng.sample(usernames, min(users, rng.randint(0, 2 * votes_per_poll)))
+                output.write(json.dumps({
+                    "question_text": f"Question {index} about {rng.choice(texts).lower()}",
+                    "pub_date": (now - datetime.timedelta(seconds=rng.randrange(30 * 86400))).isoformat(),
+                    "category": f"Category {rng.randrange(categories)}",
+                    "created_by": rng.choice(usernames),
+                    "choices": [
+                        {"choice_text": text, "votes": voters[number::len(texts)]}
+                        for number, text in enumerate(texts)
+                    ],
+                }) + "\n")
+        PollImporter(str(source)).run()
+
+
+@dataclass
+class Dataset:
+    """What the scenarios need to know about the data they run against"""
+    questions: list = field(default_factory=list)
+    choices: dict = field(default_factory=dict)
+    categories: list = field(default_factory=list)
+
+    @classmethod
+    def load(cls, sample=500):
+        """The `sample` newest published polls with their choices, and every category"""
+        from django.utils import timezone
+        from polls.models import Category, Choice, Question
+
+        questions = list(
+            Question.objects.filter(pub_date__lte=timezone.now())
+            .order_by("-pub_date", "-id").values_list("pk", flat=True)[:sample]
+        )
+        choices = {}
+        for question_id, choice_id in Choice.objects.filter(question_id__in=questions).values_list(
+            "question_id", "pk"
+        ).order_by("pk"):
+            choices.setdefault(question_id, []).append(choice_id)
+        return cls(questions, choices, list(Category.objects.order_by("pk").values_list("category_name", flat=True)))
+
+
+def client_users(count):
+    """`count` users who have not voted yet, one per benchmark client, created if missing"""
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+
+    usernames = [f"client{index}" for index in range(count)]
+    existing = set(User.objects.filter(username__in=usernames).values_list("username", flat=True))
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(User(username=username, password=password) for username in usernames
+                             if username not in existing)
+    users = User.objects.in_bulk(usernames, field_name="username")
+    return [users[username] for username in usernames]
+
+
+def add_arguments(parser):
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--categories", type=int, default=10)
+    parser.add_argument("--polls", type=int, default=2000)
+    parser.add_argument("--votes-per-poll", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_arguments(parser)
+    parser.add_argument("--db", type=Path, required=True)
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    generate(args.users, args.categories, args.polls, args.votes_per_poll, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measure the streaming export on a large vote table.
+
+    python -m benchmarks.export_throughput --votes 10000000
+
+Generates `--questions` polls with two choices each and `--votes` votes
+(only on the first run), then streams every export format to /dev/null and
+reports rows per second, bytes per second and the peak resident memory.
+"""
+import argparse
+import datetime
+import os
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+from . import _django
+
+
+def populate(questions, votes):
+    from django.db import connection, transaction
+    from polls.models import Vote
+
+    if Vote.objects.exists():
+        return
+    users = -(-votes // questions)
+    now = str(datetime.datetime(2024, 1, 1))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("INSERT INTO polls_category (category_name, img, pub_date) VALUES ('Benchmark', '', %s)", [now])
+        category_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO auth_user (password, is_superuser, username, first_name, last_name, email, is_staff,"
+            " is_active, date_joined) VALUES ('!', 0, %s, '', '', '', 0, 1, %s)",
+            [(f"user{index}", now) for index in range(users)],
+        )
+        cursor.execute("SELECT MIN(id) FROM auth_user WHERE username LIKE 'user%%'")
+        first_user = cursor.fetchone()[0]
+        cursor.executemany(
+            "INSERT INTO polls_question (category_id, created_by_id, question_text, pub_date, total_votes,"
+            " vote_shards) VALUES (%s, %s, %s, %s, 0, 1)",
+            [(category_id, first_user, f"Question {index}", now) for index in range(questions)],
+        )
+        cursor.execute("SELECT MIN(id) FROM polls_question")
+        first_question = cursor.fetchone()[0]
+        cursor.executemany(
+            "INSERT INTO polls_choice (question_id, choice_text, votes) VALUES (%s, %s, 0)",
+            [(first_question + index, text) for index in range(questions) for text in ("Yes", "No")],
+        )
+        cursor.execute("SELECT MIN(id) FROM polls_choice")
+        first_choice = cursor.fetchone()[0]
+        for start in range(0, votes, 100_000):
+            cursor.executemany(
+                "INSERT INTO polls_vote (question_id, voted_on_id, voted_by_id, voted_at) VALUES (%s, %s, %s, %s)",
+                [
+                    (first_question + index % questions, first_choice + 2 * (index % questions) + index % 2,
+                     first_user + index // questions, now)
+                    for index in range(start, min(votes, start + 100_000))
+                ],
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--votes", type=int, default=10_000_000)
+    parser.add_argument("--questions", type=int, default=10_000)
+    parser.add_argument("--db", type=Path, default=Path(tempfile.gettempdir()) / "polls_export_bench.sqlite3")
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    populate(args.questions, args.votes)
+
+    from polls.export import export_lines
+
+    with open(os.devnull, "w") as sink:
+        for output_format in ("ndjson", "csv"):
+            rows = size = 0
+            start = time.perf_counter()
+            for line in export_lines(["votes"], output_format):
+                sink.write(line)
+                rows += 1
+                size += len(line)
+            elapsed = time.perf_counter() - start
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(
+                f"{output_format:>6}: {rows} rows in {elapsed:.1f}s, {rows / elapsed:,.0f} rows/s, "
+                f"{size / elapsed / 2 ** 20:.1f} MiB/s, peak RSS {peak:.0f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
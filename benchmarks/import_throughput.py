@@ -0,0 +1,62 @@
+"""
+Measure the bulk importer.
+
+    python -m benchmarks.import_throughput --polls 20000 --votes-per-poll 100
+
+Writes a JSON lines file with `--polls` polls of two choices each and
+`--votes-per-poll` votes per poll from a pool of `--users` voters, imports
+it into a fresh scratch database and reports polls and votes per second.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from . import _django
+
+
+def write_input(path, polls, votes_per_poll, users):
+    with open(path, "w") as output:
+        for index in range(polls):
+            voters = [f"voter{(index + offset) % users}" for offset in range(votes_per_poll)]
+            output.write(json.dumps({
+                "question_text": f"Question {index}",
+                "pub_date": "2020-01-01T10:00:00Z",
+                "category": f"Category {index % 10}",
+                "created_by": "importer",
+                "choices": [
+                    {"choice_text": "Yes", "votes": voters[::2]},
+                    {"choice_text": "No", "votes": voters[1::2]},
+                ],
+            }) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--polls", type=int, default=20_000)
+    parser.add_argument("--votes-per-poll", type=int, default=100)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    directory = Path(tempfile.mkdtemp())
+    source = directory / "polls.jsonl"
+    write_input(source, args.polls, args.votes_per_poll, args.users)
+    _django.setup(directory / "polls_import_bench.sqlite3")
+
+    from polls.importer import PollImporter
+
+    start = time.perf_counter()
+    state = PollImporter(str(source), batch_size=args.batch_size).run()
+    elapsed = time.perf_counter() - start
+    print(
+        f"{state.polls} polls, {state.votes} votes in {elapsed:.1f}s: "
+        f"{state.polls / elapsed:,.0f} polls/s, {state.votes / elapsed:,.0f} votes/s "
+        f"({os.path.getsize(source) / 2 ** 20:.0f} MiB input)"
+    )
+
+
+if __name__ == "__main__":
+    main()
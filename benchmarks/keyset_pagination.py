@@ -0,0 +1,73 @@
+"""
+Compare keyset and OFFSET pagination of the index feed.
+
+    python -m benchmarks.keyset_pagination --rows 1000000
+
+Fills a scratch database with `--rows` published questions (only on the
+first run) and reports the median time to fetch one page at increasing
+depths with both strategies.
+"""
+import argparse
+import datetime
+import tempfile
+from pathlib import Path
+
+from . import _django
+
+
+def populate(rows):
+    from django.contrib.auth.models import User
+    from django.db import connection, transaction
+    from polls.models import Category, Question
+
+    if Question.objects.exists():
+        return
+    user = User.objects.create(username="benchmark")
+    category = Category.objects.create(category_name="Benchmark")
+    start = datetime.datetime(2020, 1, 1)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(0, rows, 50_000):
+            batch = [
+                (category.id, user.id, f"Question {i}", str(start + datetime.timedelta(seconds=i // 3)), 0)
+                for i in range(offset, min(rows, offset + 50_000))
+            ]
+            cursor.executemany(
+                "INSERT INTO polls_question (category_id, created_by_id, question_text, pub_date, total_votes) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                batch,
+            )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--db", type=Path, default=Path(tempfile.gettempdir()) / "polls_keyset_bench.sqlite3")
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    populate(args.rows)
+
+    from django.utils import timezone
+    from polls.models import Question
+    from polls.pagination import encode_cursor, paginate_by_pub_date
+
+    published = Question.objects.filter(pub_date__lte=timezone.now())
+    total = published.count()
+    print(f"{total} questions, page size {args.page_size}")
+    print(f"{'depth':>10} {'offset ms':>12} {'keyset ms':>12}")
+    depths = [0, 100, 1_000, 10_000, 100_000, total // 2, total - args.page_size]
+    for depth in sorted({depth for depth in depths if 0 <= depth < total}):
+        edge = published.order_by("-pub_date", "-pk")[depth - 1] if depth else None
+        cursor = encode_cursor(edge.pub_date, edge.pk, "next") if edge else None
+        offset_ms = _django.timed(
+            lambda: list(published.order_by("-pub_date", "-pk")[depth:depth + args.page_size])
+        )
+        keyset_ms = _django.timed(lambda: paginate_by_pub_date(Question.objects.all(), cursor, args.page_size))
+        print(f"{depth:>10} {offset_ms:>12.3f} {keyset_ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
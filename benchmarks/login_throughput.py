@@ -0,0 +1,102 @@
+"""
+Measure logins per second, and the latency of other pages during a login burst.
+
+    python -m benchmarks.login_throughput --clients 16 --seconds 10
+
+`--clients` threads log in as fast as they can through Django's test client
+for `--seconds`, while one more thread keeps requesting the about page.
+Three setups are compared: PBKDF2 hashed in the request thread (Django's
+default), bcrypt hashed in the request thread, and bcrypt hashed in the
+login.hashing process pool with `--workers` processes. Reports logins per
+second, the p50/p99 login latency, the logins refused with 503 because the
+pool was full, and the p50/p99 latency of the about page. Throttling is off.
+"""
+import argparse
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from . import _django
+
+PASSWORD = "benchmark password"
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000 if samples else 0.0
+
+
+def burst(clients, seconds):
+    from django.test import Client
+    from django.urls import reverse
+
+    login_url, about_url = reverse("login:logging"), reverse("polls:about")
+    logins, refused, pages = [], [], []
+    deadline = time.perf_counter() + seconds
+
+    def log_in():
+        client = Client()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = client.post(login_url, {"username": "benchmark", "password": PASSWORD})
+            (refused if response.status_code == 503 else logins).append(time.perf_counter() - start)
+
+    def browse():
+        client = Client()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.get(about_url)
+            pages.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=log_in) for _ in range(clients)] + [threading.Thread(target=browse)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return logins, refused, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--db", type=Path, default=Path(tempfile.gettempdir()) / "polls_login_bench.sqlite3")
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+
+    from django.conf import settings
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.test import override_settings
+    from login import hashing
+
+    settings.ALLOWED_HOSTS = ["*"]
+    setups = {
+        "inline pbkdf2": {
+            "LOGIN_HASH_WORKERS": 0, "PASSWORD_HASHERS": ["django.contrib.auth.hashers.PBKDF2PasswordHasher"],
+        },
+        "inline bcrypt": {"LOGIN_HASH_WORKERS": 0},
+        "pool bcrypt": {"LOGIN_HASH_WORKERS": args.workers},
+    }
+    print(
+        f"{'setup':>14}  {'logins/s':>8}  {'p50 ms':>7}  {'p99 ms':>7}  {'503s':>5}  {'page p50':>8}  {'page p99':>8}"
+    )
+    for label, overrides in setups.items():
+        with override_settings(THROTTLE_RULES={}, THROTTLE_SHED_AT={}, **overrides):
+            User.objects.update_or_create(username="benchmark", defaults={"password": make_password(PASSWORD)})
+            # Start the pool before the clock does
+            if hashing.get_pool():
+                hashing.check_password(PASSWORD, make_password(PASSWORD))
+            logins, refused, pages = burst(args.clients, args.seconds)
+        print(
+            f"{label:>14}  {len(logins) / args.seconds:>8.1f}  {percentile(logins, 0.5):>7.0f}"
+            f"  {percentile(logins, 0.99):>7.0f}  {len(refused):>5}"
+            f"  {percentile(pages, 0.5):>8.1f}  {percentile(pages, 0.99):>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Measure how long rendering a page of poll cards takes with and without the card cache.
+
+    python -m benchmarks.poll_cards --polls 100
+
+Renders polls/index.html with `--polls` questions (POLLS_PAGE_SIZE is raised
+to match) three ways: every card rendered inline as before the cache, with
+an empty card cache (every card rendered and stored) and with a warm cache
+(one multi-get, nothing rendered). The questions are loaded once, so only
+template rendering and the cache are measured, with the default local
+memory cache.
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+from . import _django
+
+INLINE = """{% extends 'polls/base.html' %}
+{% block main-content %}
+    <div class="polls">
+    {% for question in latest_question_list %}
+        {% include 'polls/poll_card.html' with voted=False %}
+    {% endfor %}
+    </div>
+{% endblock %}"""
+
+
+def populate(polls):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Category, Question
+
+    if Question.objects.count() >= polls:
+        return
+    user = User.objects.create(username="benchmark")
+    category = Category.objects.create(category_name="Benchmark")
+    now = timezone.now()
+    Question.objects.bulk_create(
+        Question(category=category, created_by=user, question_text=f"Question {index}", total_votes=index,
+                 pub_date=now - timezone.timedelta(minutes=index))
+        for index in range(polls)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--polls", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--db", type=Path, default=Path(tempfile.gettempdir()) / "polls_cards_bench.sqlite3")
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    populate(args.polls)
+
+    from django.contrib.auth.models import AnonymousUser
+    from django.core.cache import cache
+    from django.template import engines
+    from django.template.loader import render_to_string
+    from django.test import RequestFactory
+    from polls.models import Question
+
+    request = RequestFactory().get("/polls/")
+    request.user = AnonymousUser()
+    questions = list(Question.objects.select_related("created_by").order_by("-pub_date")[:args.polls])
+    context = {"latest_question_list": questions, "voted_ids": frozenset()}
+    inline = engines["django"].from_string(INLINE)
+
+    def cold():
+        cache.clear()
+        render_to_string("polls/index.html", context, request)
+
+    results = {
+        "inline": _django.timed(lambda: inline.render(context, request), args.repeat),
+        "cold cache": _django.timed(cold, args.repeat),
+    }
+    render_to_string("polls/index.html", context, request)
+    results["warm cache"] = _django.timed(lambda: render_to_string("polls/index.html", context, request), args.repeat)
+    for label, ms in results.items():
+        print(f"{label:>10}: {ms:7.2f} ms per {args.polls}-poll page")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Measure full-text search on a large poll table.
+
+    python -m benchmarks.search --rows 1000000
+
+Fills a scratch database with `--rows` questions of six words, drawn from a
+vocabulary of `--words` words with a Zipf-like distribution, and two choices
+each (only on the first run; the FTS triggers index them as they are
+inserted). Reports the median time of the first result page for rare,
+common and prefix queries, against an icontains scan.
+"""
+import argparse
+import datetime
+import random
+import tempfile
+from pathlib import Path
+
+from . import _django
+
+
+def vocabulary(size):
+    rng = random.Random(1)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(4, 9))))
+    return sorted(words)
+
+
+def populate(rows, words):
+    from django.contrib.auth.models import User
+    from django.db import connection, transaction
+    from polls.models import Category, Question
+
+    if Question.objects.exists():
+        return
+    rng = random.Random(2)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    user = User.objects.create(username="benchmark")
+    category = Category.objects.create(category_name="Benchmark")
+    start = datetime.datetime(2020, 1, 1)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(0, rows, 50_000):
+            count = min(rows, offset + 50_000) - offset
+            texts = rng.choices(words, weights, k=count * 8)
+            cursor.executemany(
+                "INSERT INTO polls_question (id, category_id, created_by_id, question_text, pub_date, total_votes,"
+                " vote_shards) VALUES (%s, %s, %s, %s, %s, 0, 1)",
+                [
+                    (offset + i + 1, category.id, user.id, " ".join(texts[i * 8:i * 8 + 6]),
+                     str(start + datetime.timedelta(seconds=offset + i)))
+                    for i in range(count)
+                ],
+            )
+            cursor.executemany(
+                "INSERT INTO polls_choice (question_id, choice_text, votes) VALUES (%s, %s, 0)",
+                [(offset + i + 1, texts[i * 8 + 6 + j]) for i in range(count) for j in range(2)],
+            )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--words", type=int, default=20_000)
+    parser.add_argument("--db", type=Path, default=Path(tempfile.gettempdir()) / "polls_search_bench.sqlite3")
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    words = vocabulary(args.words)
+    populate(args.rows, words)
+
+    from polls.models import Question
+    from polls.search import search
+
+    queries = {
+        "rare word": words[-1],
+        "two rare words": f"{words[-1]} {words[-2]}",
+        "mid word": words[len(words) // 10],
+        "common word": words[0],
+        "prefix": words[len(words) // 10][:3],
+    }
+    print(f"{'query':>16}  {'matches':>8}  {'fts ms':>8}  {'icontains ms':>12}")
+    for label, text in queries.items():
+        matches = Question.objects.filter(question_text__icontains=text.split()[0]).count()
+        fts = _django.timed(lambda: search(text), repeat=10)
+        scan = _django.timed(lambda: list(Question.objects.filter(question_text__icontains=text)[:20]), repeat=3)
+        print(f"{label:>16}  {matches:>8}  {fts:>8.2f}  {scan:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compare vote write throughput on a single counter row and on sharded counters.
+
+    python -m benchmarks.sharded_votes --threads 16 --votes 4000 --shards 16
+
+Every run creates a fresh poll with one choice and has `--threads` workers
+record `--votes` votes in total through polls.voting.record_vote.
+"""
+import argparse
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from . import _django
+
+
+def run(shards, threads, votes):
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.utils import timezone
+    from polls.models import Category, Question
+    from polls.voting import record_vote
+
+    category, _ = Category.objects.get_or_create(category_name="Benchmark")
+    author, _ = User.objects.get_or_create(username="benchmark")
+    question = Question.objects.create(
+        question_text=f"{shards} shards", pub_date=timezone.now(), category=category,
+        created_by=author, vote_shards=shards,
+    )
+    choice = question.choice_set.create(choice_text="Yes")
+    voters = User.objects.bulk_create(User(username=f"q{question.pk}-{index}") for index in range(votes))
+
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(batch):
+        barrier.wait()
+        for voter in batch:
+            record_vote(question, choice, voter)
+        connection.close()
+
+    workers = [threading.Thread(target=worker, args=(voters[index::threads], )) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return votes / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--votes", type=int, default=4000)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--db", type=Path, default=Path(tempfile.gettempdir()) / "polls_shard_bench.sqlite3")
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from django.conf import settings
+    settings.DATABASES["default"].setdefault("OPTIONS", {})["timeout"] = 60
+
+    for shards in (1, args.shards):
+        rate = run(shards, args.threads, args.votes)
+        print(f"{shards:>3} shard(s): {rate:>10.0f} votes/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""
+Load the poll site's hot paths and compare the numbers with a stored baseline.
+
+    python -m benchmarks.suite                      # in process, test client
+    python -m benchmarks.suite --server             # through a local runserver
+    python -m benchmarks.suite --url http://host:8000
+    python -m benchmarks.suite --save-baseline      # store the results as the baseline
+
+The dataset comes from benchmarks.data, generated once per set of data
+arguments into a template database that every run copies, so runs start
+from the same rows however many votes and polls the last one added. Each
+scenario sends `--requests` requests from `--concurrency` threads, one
+client (and one user, for the logged-in scenarios) per thread, and reports
+requests per second, p50/p95/p99 latency and queries per request.
+
+In process, requests go through Django's test client with throttling off,
+and every query is counted. With `--server` the suite starts `runserver`
+(throttling off too) on a copy of the dataset and sends real HTTP requests;
+with `--url` it targets a server you started, which must hold the same
+dataset and not throttle the benchmark clients. Queries cannot be counted
+over HTTP.
+
+With a baseline for the same arguments (`--baseline`, benchmarks/baseline.json
+by default), the run fails when a scenario's median latency grows or its
+throughput drops by more than `--threshold`, or it makes more queries per
+request. Timings only compare on the machine that recorded the baseline;
+regenerate it there with --save-baseline.
+"""
+import argparse
+import http.cookiejar
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+from . import _django, data
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+# The settings a shared cache turns on; the benchmarked process is the only
+# one, so its local memory cache will do
+SHARED_CACHE_SETTINGS = {
+    "SESSION_ENGINE": "django.contrib.sessions.backends.cached_db",
+    "LOGIN_USER_CACHE_TIMEOUT": 300,
+}
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    # (dataset, client number, iteration) -> path, and the POST data
+    path: object
+    data: object = None
+    login: bool = False
+
+    def request(self, dataset, client, iteration):
+        args = (dataset, client, iteration)
+        return self.path(*args), self.data(*args) if self.data else None
+
+
+def _question(dataset, client, iteration):
+    return dataset.questions[(client * 7 + iteration) % len(dataset.questions)]
+
+
+def _vote_question(dataset, client, iteration):
+    # Every client votes in each poll at most once while iterations last
+    return dataset.questions[iteration % len(dataset.questions)]
+
+
+SCENARIOS = [
+    Scenario("index", "GET", lambda dataset, client, iteration: "/polls/", login=True),
+    Scenario(
+        "category", "GET",
+        lambda dataset, client, iteration: "/polls/category/" + urllib.parse.quote(
+            dataset.categories[(client + iteration) % len(dataset.categories)]
+        ),
+    ),
+    Scenario("detail_view", "GET", lambda *args: f"/polls/{_question(*args)}/"),
+    Scenario("results", "GET", lambda *args: f"/polls/results/{_question(*args)}"),
+    Scenario(
+        "vote", "POST", lambda *args: f"/polls/{_vote_question(*args)}/vote",
+        lambda dataset, *args: {"choice": dataset.choices[_vote_question(dataset, *args)][0]},
+        login=True,
+    ),
+    Scenario(
+        "new_poll", "POST", lambda *args: "/polls/new_poll/",
+        lambda dataset, client, iteration: {
+            "question_text": f"Benchmark poll {client}-{iteration}",
+            "category": dataset.categories[iteration % len(dataset.categories)],
+            "choice_text_1": "Yes",
+            "choice_text_2": "No",
+        },
+        login=True,
+    ),
+    Scenario("category_list", "GET", lambda *args: "/polls/category_list/"),
+]
+
+
+@dataclass
+class Result:
+    scenario: str
+    requests: int
+    errors: int
+    rps: float
+    p50: float
+    p95: float
+    p99: float
+    queries: float = None
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+
+class TestClient:
+    """One thread's Django test client, counting the queries of each request"""
+
+    def __init__(self, user):
+        from django.test import Client
+
+        # Server errors count as unexpected responses rather than end the thread
+        self.client = Client(raise_request_exception=False)
+        if user is not None:
+            self.client.force_login(user)
+
+    def send(self, method, path, post_data):
+        from django.db import connection
+
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            if method == "POST":
+                response = self.client.post(path, post_data)
+            else:
+                response = self.client.get(path)
+        return response.status_code, queries
+
+
+class HttpClient:
+    """One thread's HTTP client, with its own cookies and CSRF token"""
+
+    def __init__(self, base_url, user):
+        self.base_url = base_url.rstrip("/")
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect()
+        )
+        self.send("GET", "/login/", None)
+        if user is not None:
+            status, _ = self.send("POST", "/login/logging", {"username": user.username, "password": data.PASSWORD})
+            if status != 302:
+                raise RuntimeError(f"Logging in as {user.username} failed with {status}")
+
+    def send(self, method, path, post_data):
+        body = None
+        if method == "POST":
+            token = next((cookie.value for cookie in self.cookies if cookie.name == "csrftoken"), "")
+            body = urllib.parse.urlencode({**post_data, "csrfmiddlewaretoken": token}).encode()
+        request = urllib.request.Request(self.base_url + path, body, method=method)
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code, None
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def run(scenario, dataset, make_client, users, requests, concurrency, warmup):
+    expected = 302 if scenario.method == "POST" else 200
+    clients = [make_client(users[index] if scenario.login else None) for index in range(concurrency)]
+    latencies, queries, errors = [], [], []
+    # Not measured: loads the code paths, the category registry and the like.
+    # The measured iterations come after these, so no poll is voted in twice
+    for iteration in range(warmup):
+        clients[0].send(scenario.method, *scenario.request(dataset, 0, iteration))
+
+    def worker(number):
+        for iteration in range(number, requests, concurrency):
+            path, post_data = scenario.request(dataset, number, warmup + iteration // concurrency)
+            start = time.perf_counter()
+            status, count = clients[number].send(scenario.method, path, post_data)
+            latencies.append(time.perf_counter() - start)
+            if count is not None:
+                queries.append(count)
+            if status != expected:
+                errors.append(status)
+
+    threads = [threading.Thread(target=worker, args=(number, )) for number in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return Result(
+        scenario=scenario.name, requests=requests, errors=len(errors), rps=requests / elapsed,
+        p50=percentile(latencies, 0.5), p95=percentile(latencies, 0.95), p99=percentile(latencies, 0.99),
+        queries=sum(queries) / len(queries) if queries else None,
+    )
+
+
+def compare(results, baseline, threshold):
+    """The regressions of `results` against the `baseline` results, as messages"""
+    regressions = []
+    for result in results:
+        base = baseline.get(result.scenario)
+        if base is None:
+            continue
+        # The tail percentiles of a few hundred requests are too noisy to gate on
+        if result.p50 > base["p50"] * (1 + threshold):
+            regressions.append(f"{result.scenario}: p50 {base['p50']:.1f} -> {result.p50:.1f} ms")
+        if result.rps < base["rps"] * (1 - threshold):
+            regressions.append(f"{result.scenario}: {base['rps']:.0f} -> {result.rps:.0f} requests/s")
+        # Half a query per request on average: a new query in most requests
+        if result.queries is not None and base.get("queries") is not None \
+                and result.queries > base["queries"] + 0.5:
+            regressions.append(f"{result.scenario}: {base['queries']:.1f} -> {result.queries:.1f} queries/request")
+        if result.errors > base.get("errors", 0):
+            regressions.append(f"{result.scenario}: {result.errors} unexpected responses")
+    return regressions
+
+
+def serve(port):
+    """Run the development server on the dataset copy set up by main(), without throttling"""
+    from django.conf import settings
+    from django.core.management import call_command
+
+    settings.THROTTLE_RULES = {}
+    settings.THROTTLE_SHED_AT = {}
+    for name, value in SHARED_CACHE_SETTINGS.items():
+        setattr(settings, name, value)
+    call_command("runserver", f"127.0.0.1:{port}", use_reloader=False, skip_checks=True)
+
+
+def start_server(db, port):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.suite", "--run-db", str(db), "--serve", str(port)],
+        cwd=_django.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + "/polls/about/", timeout=1).read()
+            return server, url
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("The benchmark server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    data.add_arguments(parser)
+    parser.add_argument("--scenarios", default=",".join(scenario.name for scenario in SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests before each scenario")
+    parser.add_argument("--server", action="store_true", help="Start runserver and send it HTTP requests")
+    parser.add_argument("--url", help="Send HTTP requests to this running server")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--run-db", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        _django.setup(args.run_db)
+        serve(args.serve)
+        return
+
+    scenarios = [scenario for scenario in SCENARIOS if scenario.name in args.scenarios.split(",")]
+    dataset_args = [args.users, args.categories, args.polls, args.votes_per_poll, args.seed]
+    directory = Path(tempfile.gettempdir())
+    template = directory / f"polls_suite_{'_'.join(map(str, dataset_args))}.sqlite3"
+    if not template.exists():
+        building = template.with_suffix(".building")
+        building.unlink(missing_ok=True)
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.data", "--db", str(building), "--users", str(args.users),
+             "--categories", str(args.categories), "--polls", str(args.polls),
+             "--votes-per-poll", str(args.votes_per_poll), "--seed", str(args.seed)],
+            cwd=_django.BASE_DIR, check=True,
+        )
+        building.rename(template)
+    run_db = directory / "polls_suite_run.sqlite3"
+    shutil.copyfile(template, run_db)
+
+    _django.setup(run_db)
+    from django.conf import settings
+    from django.test.utils import override_settings
+
+    settings.ALLOWED_HOSTS = ["*"]
+    dataset = data.Dataset.load()
+    users = data.client_users(args.concurrency)
+
+    mode = "url" if args.url else "server" if args.server else "in-process"
+    server = None
+    if args.server:
+        server, args.url = start_server(run_db, 8765)
+    try:
+        with override_settings(THROTTLE_RULES={}, THROTTLE_SHED_AT={}, **SHARED_CACHE_SETTINGS):
+            if args.url:
+                def make_client(user):
+                    return HttpClient(args.url, user)
+            else:
+                make_client = TestClient
+            results = [
+                run(scenario, dataset, make_client, users, args.requests, args.concurrency, args.warmup)
+                for scenario in scenarios
+            ]
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(f"{'scenario':>14}  {'req/s':>7}  {'p50 ms':>7}  {'p95 ms':>7}  {'p99 ms':>7}  {'queries':>7}  {'errors':>6}")
+    for result in results:
+        queries = "-" if result.queries is None else f"{result.queries:.1f}"
+        print(
+            f"{result.scenario:>14}  {result.rps:>7.1f}  {result.p50:>7.1f}  {result.p95:>7.1f}"
+            f"  {result.p99:>7.1f}  {queries:>7}  {result.errors:>6}"
+        )
+
+    arguments = {
+        "mode": mode, "dataset": dataset_args, "requests": args.requests, "concurrency": args.concurrency,
+        "warmup": args.warmup,
+    }
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({
+            "arguments": arguments, "results": {result.scenario: asdict(result) for result in results},
+        }, indent=2) + "\n")
+        print(f"Saved the baseline to {args.baseline}")
+        return
+    if not args.baseline.exists():
+        return
+    baseline = json.loads(args.baseline.read_text())
+    if baseline["arguments"] != arguments:
+        print(f"Not compared: {args.baseline} was recorded with {baseline['arguments']}")
+        return
+    regressions = compare(results, baseline["results"], args.threshold)
+    if regressions:
+        sys.exit("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+    print(f"No regressions against {args.baseline} (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
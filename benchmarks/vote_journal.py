@@ -0,0 +1,86 @@
+"""
+Compare direct vote writes with journalled votes.
+
+    python -m benchmarks.vote_journal --threads 16 --votes 4000
+
+Reports the rate at which request threads can accept votes through
+record_vote and through the journal, and the rate at which the applier
+then writes the journalled votes to the database.
+"""
+import argparse
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from . import _django
+
+
+def make_poll(votes):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from polls.models import Category, Question
+
+    category, _ = Category.objects.get_or_create(category_name="Benchmark")
+    author, _ = User.objects.get_or_create(username="benchmark")
+    question = Question.objects.create(
+        question_text="Journal", pub_date=timezone.now(), category=category, created_by=author
+    )
+    choice = question.choice_set.create(choice_text="Yes")
+    voters = User.objects.bulk_create(User(username=f"q{question.pk}-{index}") for index in range(votes))
+    return question, choice, voters
+
+
+def run_threads(threads, voters, vote):
+    from django.db import connection
+
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(batch):
+        barrier.wait()
+        for voter in batch:
+            vote(voter)
+        connection.close()
+
+    workers = [threading.Thread(target=worker, args=(voters[index::threads], )) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return len(voters) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--votes", type=int, default=4000)
+    parser.add_argument("--db", type=Path, default=Path(tempfile.gettempdir()) / "polls_journal_bench.sqlite3")
+    args = parser.parse_args()
+
+    _django.setup(args.db)
+    from django.conf import settings
+    settings.DATABASES["default"].setdefault("OPTIONS", {})["timeout"] = 60
+    settings.VOTE_JOURNAL_PATH = args.db.with_suffix(".journal")
+
+    from polls.journal import apply_journal, get_journal
+    from polls.voting import record_vote
+
+    question, choice, voters = make_poll(args.votes)
+    rate = run_threads(args.threads, voters, lambda voter: record_vote(question, choice, voter))
+    print(f"record_vote:      {rate:>10.0f} votes/s")
+
+    question, choice, voters = make_poll(args.votes)
+    journal = get_journal()
+    rate = run_threads(args.threads, voters, lambda voter: journal.append(question.pk, choice.pk, voter.pk))
+    print(f"journal append:   {rate:>10.0f} votes/s")
+
+    start = time.perf_counter()
+    while apply_journal():
+        pass
+    print(f"journal applier:  {args.votes / (time.perf_counter() - start):>10.0f} votes/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from . import hashing
+
+
+def _user_key(user_id):
+    return f"login:user:{user_id}"
+
+
+def forget_user(user_id):
+    """Drop the cached copy of a user; call whenever the user row changes"""
+    cache.delete(_user_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+        ModelBackend that keeps the users it loads for sessions in the cache.
+
+        AuthenticationMiddleware loads the logged-in user on every request;
+        with this backend that is a cache read. The copy is dropped when the
+        user is saved (a password change included) or deleted and on logout,
+        and it expires after LOGIN_USER_CACHE_TIMEOUT seconds in case the row
+        was changed behind the ORM's back, e.g. by QuerySet.update(). With a
+        timeout of 0, the default when the cache is not shared between
+        processes, users are not cached at all.
+
+        Passwords are checked in the hashing pool (see login.hashing), which
+        raises HashingBusy when it is full.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash anyway, so unknown usernames take as long as wrong passwords
+            hashing.make_password(password)
+            return None
+        matches, must_update = hashing.check_password(password, user.password)
+        if not matches or not self.user_can_authenticate(user):
+            return None
+        if must_update:
+            user.password = hashing.make_password(password)
+            user.save(update_fields=["password"])
+        return user
+
+    def get_user(self, user_id):
+        if not settings.LOGIN_USER_CACHE_TIMEOUT:
+            return super().get_user(user_id)
+        key = _user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, settings.LOGIN_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
@@ -1,3 +1,6 @@
 class WrongPassword(Exception):
     """ wrong password exception class """
 
+
+class HashingBusy(Exception):
+    """ the password hashing pool is full, too slow or broken """
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.contrib.auth.hashers import BCryptSHA256PasswordHasher as BaseBCryptSHA256PasswordHasher
+
+
+class BCryptSHA256PasswordHasher(BaseBCryptSHA256PasswordHasher):
+    """
+        Django's bcrypt hasher with its cost taken from LOGIN_BCRYPT_ROUNDS.
+        Hashes keep the bcrypt_sha256 algorithm name, so they stay readable by
+        Django's own hasher, and hashes made with another cost are redone at
+        the next login.
+    """
+
+    @property
+    def rounds(self):
+        return settings.LOGIN_BCRYPT_ROUNDS
@@ -0,0 +1,130 @@
+"""
+Password hashing off the request thread.
+
+Hashing a password is deliberately slow: with PBKDF2 or bcrypt it holds a
+core for a good fraction of a second, and done inside the request it stalls
+every other request of the worker (or of the event loop, under ASGI). Here
+it runs in a pool of LOGIN_HASH_WORKERS processes instead. At most
+LOGIN_HASH_QUEUE requests wait for a free process on top of the ones being
+served; any more wait up to LOGIN_HASH_WAIT seconds for room and then get
+HashingBusy, which the views (and login.middleware.HashingBusyMiddleware,
+for the admin login) turn into a 503, so a login burst is refused early
+instead of piling up. A hash that has not come back after LOGIN_HASH_TIMEOUT
+seconds gets HashingBusy too, and so do the hashes in flight when a worker
+process dies; the broken pool is then replaced by the next get_pool(). With
+LOGIN_HASH_WORKERS = 0 passwords are hashed in the calling thread.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from .exceptions import HashingBusy
+
+
+def _setup_django(settings_module):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    import django
+    django.setup()
+
+
+def _check(password, encoded):
+    """(password matches, hash should be redone with the preferred hasher)"""
+    if not hashers.check_password(password, encoded):
+        return False, False
+    preferred = hashers.get_hasher("default")
+    hasher = hashers.identify_hasher(encoded)
+    return True, hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def _make(password):
+    return hashers.make_password(password)
+
+
+class HashPool:
+    def __init__(self, workers, queue, wait, timeout=None):
+        # Spawned rather than forked: forking a threaded web worker can copy
+        # locks held by other threads into the child
+        self._executor = ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_setup_django,
+            initargs=(os.environ.get("DJANGO_SETTINGS_MODULE", "mysite.settings"), ),
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self.wait = wait
+        self.timeout = timeout
+        # Set once a worker died; the executor then fails every call
+        self.broken = False
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) and return its Future, or raise HashingBusy when there is no room"""
+        if not self._slots.acquire(timeout=self.wait):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self.broken = True
+            raise HashingBusy()
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        """fn(*args) from the pool; HashingBusy when it has no room, takes too long or broke"""
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy()
+        except BrokenProcessPool:
+            self.broken = True
+            raise HashingBusy()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The process's HashPool, a new one if the last broke, or None when LOGIN_HASH_WORKERS is 0"""
+    global _pool
+    if not settings.LOGIN_HASH_WORKERS:
+        return None
+    with _pool_lock:
+        if _pool is not None and _pool.broken:
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            _pool = HashPool(
+                settings.LOGIN_HASH_WORKERS, settings.LOGIN_HASH_QUEUE, settings.LOGIN_HASH_WAIT,
+                settings.LOGIN_HASH_TIMEOUT,
+            )
+        return _pool
+
+
+def check_password(password, encoded):
+    """
+        Check `password` against the `encoded` hash in the pool and return
+        (matches, must_update), where must_update means the hash should be
+        redone because the preferred hasher or its cost changed.
+    """
+    pool = get_pool()
+    return _check(password, encoded) if pool is None else pool.run(_check, password, encoded)
+
+
+def make_password(password):
+    """Hash `password` with the preferred hasher in the pool"""
+    pool = get_pool()
+    return _make(password) if pool is None else pool.run(_make, password)
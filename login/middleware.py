@@ -0,0 +1,13 @@
+from django.utils.deprecation import MiddlewareMixin
+
+from .exceptions import HashingBusy
+from .views import busy
+
+
+class HashingBusyMiddleware(MiddlewareMixin):
+    """Answers 503 to logins outside login.views, such as the admin's, that found the hashing pool full"""
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, HashingBusy):
+            return busy()
+        return None
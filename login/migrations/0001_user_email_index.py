@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+        auth.User has no index on email, which registration looks up. The
+        table belongs to django.contrib.auth, so the index is added with SQL.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS login_user_email_idx ON auth_user (email)',
+            'DROP INDEX IF EXISTS login_user_email_idx',
+        ),
+    ]
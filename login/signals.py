@@ -0,0 +1,20 @@
+from django.contrib.auth import user_logged_out
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .backends import forget_user
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Again after the commit, in case a request cached the old row in between
+    forget_user(instance.pk)
+    transaction.on_commit(lambda: forget_user(instance.pk))
+
+
+@receiver(user_logged_out)
+def user_logged_out_forget(sender, user, **kwargs):
+    if user is not None:
+        forget_user(user.pk)
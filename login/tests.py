@@ -1,3 +1,180 @@
-from django.test import TestCase
+import os
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password as django_make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import hashing
+from .backends import _user_key
+from .exceptions import HashingBusy
+
+
+@override_settings(
+    LOGIN_HASH_WORKERS=0, LOGIN_BCRYPT_ROUNDS=4,
+    SESSION_ENGINE="django.contrib.sessions.backends.cached_db", LOGIN_USER_CACHE_TIMEOUT=300,
+)
+class CachedSessionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("kirill", "kirill@example.com", "old password")
+        self.client.force_login(self.user)
+
+    def assertLoggedIn(self, logged_in=True):
+        response = self.client.get(reverse("polls:about"))
+        self.assertEqual(response.context["user"].is_authenticated, logged_in)
+
+    def test_logged_in_requests_make_no_query(self):
+        """Once the session and the user are cached, a logged-in page view makes no query"""
+        # Saving the session at login cached it; only the user is loaded
+        with self.assertNumQueries(1):
+            self.assertLoggedIn()
+        with self.assertNumQueries(0):
+            self.assertLoggedIn()
+
+    def test_login_form(self):
+        self.client.logout()
+        response = self.client.post(reverse("login:logging"), {"username": "kirill", "password": "old password"})
+        self.assertRedirects(response, reverse("polls:index"))
+        self.assertLoggedIn()
+
+    def test_password_change_ends_other_sessions(self):
+        self.assertLoggedIn()
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password("new password")
+        user.save()
+        self.assertLoggedIn(False)
+
+    def test_deactivated_user_is_logged_out(self):
+        self.assertLoggedIn()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        # Updates bypass the signals, so the cached user is still used...
+        self.assertLoggedIn()
+        user = User.objects.get(pk=self.user.pk)
+        user.save()
+        # ...until the user is saved
+        self.assertLoggedIn(False)
+
+    @override_settings(LOGIN_USER_CACHE_TIMEOUT=0)
+    def test_users_are_not_cached_without_a_shared_cache(self):
+        self.assertLoggedIn()
+        self.assertIsNone(cache.get(_user_key(self.user.pk)))
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertLoggedIn(False)
+
+    def test_logout_drops_the_session_and_the_user(self):
+        self.assertLoggedIn()
+        session_cookie = self.client.cookies["sessionid"].value
+        self.client.get(reverse("login:logout"))
+        self.assertIsNone(cache.get(_user_key(self.user.pk)))
+        self.client.cookies["sessionid"] = session_cookie
+        self.assertLoggedIn(False)
+
+
+@override_settings(LOGIN_HASH_WORKERS=0, LOGIN_BCRYPT_ROUNDS=4, THROTTLE_RULES={})
+class PasswordHashingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def register(self, username="kirill_b", email="kirill@example.com", password="long password"):
+        return self.client.post(reverse("login:reg_new_user"), {
+            "username": username, "email": email, "password1": password, "password2": password,
+        })
+
+    def login(self, username="kirill_b", password="long password"):
+        return self.client.post(reverse("login:logging"), {"username": username, "password": password})
+
+    def test_registration_checks_username_and_email_in_one_query(self):
+        self.assertRedirects(self.register(), reverse("login:index"))
+        user = User.objects.get(username="kirill_b")
+        self.assertTrue(user.password.startswith("bcrypt_sha256$$2b$04$"))
+        with self.assertNumQueries(1):
+            response = self.register()
+        self.assertContains(response, "User with this username is already registered")
+        self.assertContains(self.register(username="someone"), "User with this login is already registered")
+        self.assertRedirects(self.register(username="someone", email="someone@example.com"), reverse("login:index"))
+
+    def test_login_rehashes_outdated_passwords(self):
+        """PBKDF2 hashes, and bcrypt hashes of another cost, are redone at login"""
+        user = User.objects.create(
+            username="kirill_b", password=django_make_password("long password", hasher="pbkdf2_sha256")
+        )
+        self.assertRedirects(self.login(), reverse("polls:index"))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("bcrypt_sha256$$2b$04$"))
+        with override_settings(LOGIN_BCRYPT_ROUNDS=5):
+            self.client.logout()
+            self.assertRedirects(self.login(), reverse("polls:index"))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("bcrypt_sha256$$2b$05$"))
+
+    def test_wrong_password_and_unknown_user(self):
+        User.objects.create(username="kirill_b", password=django_make_password("long password"))
+        self.assertContains(self.login(password="wrong password"), "Wrong username or password!")
+        with mock.patch("login.hashing._make", wraps=hashing._make) as make:
+            self.assertContains(self.login(username="nobody"), "Wrong username or password!")
+        # Unknown usernames still cost a hash
+        make.assert_called_once_with("long password")
+
+    def test_busy_pool_refuses_logins(self):
+        User.objects.create(username="kirill_b", password=django_make_password("long password"))
+        with mock.patch("login.hashing.check_password", side_effect=HashingBusy):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+        with mock.patch("login.views.make_password", side_effect=HashingBusy):
+            self.assertEqual(self.register(username="someone").status_code, 503)
+        self.assertFalse(User.objects.filter(username="someone").exists())
+
+    def test_busy_pool_refuses_admin_logins(self):
+        User.objects.create(username="kirill_b", password=django_make_password("long password"), is_staff=True)
+        with mock.patch("login.hashing.check_password", side_effect=HashingBusy):
+            response = self.client.post(
+                reverse("admin:login"), {"username": "kirill_b", "password": "long password"}
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+
+
+@override_settings(LOGIN_BCRYPT_ROUNDS=4)
+class HashPoolTest(TestCase):
+    def setUp(self):
+        self.pool = hashing.HashPool(workers=1, queue=1, wait=0.01)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_hashes_in_another_process(self):
+        encoded = self.pool.run(hashing._make, "long password")
+        self.assertTrue(encoded.startswith("bcrypt_sha256$"))
+        self.assertEqual(self.pool.run(hashing._check, "long password", encoded), (True, False))
+        self.assertEqual(self.pool.run(hashing._check, "wrong password", encoded), (False, False))
+
+    def test_full_pool_raises_busy(self):
+        """Beyond the workers and the queue, callers wait LOGIN_HASH_WAIT and then get HashingBusy"""
+        self.pool._slots.acquire()
+        self.pool._slots.acquire()
+        with self.assertRaises(HashingBusy):
+            self.pool.submit(hashing._make, "long password")
+        self.pool._slots.release()
+        self.assertTrue(self.pool.run(hashing._make, "long password"))
+
+    def test_slow_hash_raises_busy(self):
+        self.pool.timeout = 0.01
+        with self.assertRaises(HashingBusy):
+            self.pool.run(time.sleep, 1)
+
+    @override_settings(LOGIN_HASH_WORKERS=1, LOGIN_HASH_QUEUE=1, LOGIN_HASH_WAIT=0.01, LOGIN_HASH_TIMEOUT=30)
+    def test_broken_pool_is_replaced(self):
+        """A dead worker answers the callers with HashingBusy, and the next caller gets a new pool"""
+        with mock.patch.object(hashing, "_pool", None):
+            pool = hashing.get_pool()
+            try:
+                with self.assertRaises(HashingBusy):
+                    pool.run(os._exit, 1)
+                self.assertTrue(pool.broken)
+                self.assertIsNot(hashing.get_pool(), pool)
+                self.assertTrue(hashing.make_password("long password").startswith("bcrypt_sha256$"))
+            finally:
+                hashing.get_pool().shutdown()
@@ -1,11 +1,14 @@
-import bcrypt
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
+from django.db.models import Q
 from django.shortcuts import render
 from django.urls import reverse
 from django.http import HttpResponse, HttpResponseRedirect
 from django.contrib.auth.models import User
 
+from .exceptions import HashingBusy
 from .forms import UserLoginForm, UserRegisterForm
+from .hashing import make_password
 
 
 def index(request):
@@ -17,7 +20,10 @@ def logging(request):
     if request.method == "POST":
         username = request.POST["username"]
         password = request.POST["password"]
-        user = authenticate(request, username=username, password=password)
+        try:
+            user = authenticate(request, username=username, password=password)
+        except HashingBusy:
+            return busy()
         if user is not None:
             login(request, user)
             return HttpResponseRedirect(reverse("polls:index"))
@@ -38,15 +44,12 @@ def reg_new_user(request):
     rep_password = request.POST["password2"]
 
     error_message = []
-    try:
-        User.objects.get(username=username)
+    # One query, through the username and email indexes
+    taken = list(User.objects.filter(Q(username=username) | Q(email=email)).values_list("username", flat=True)[:2])
+    if username in taken:
         error_message.append("User with this username is already registered")
-    except User.DoesNotExist:
-        try:
-            User.objects.get(email=email)
-            error_message.append("User with this login is already registered")
-        except User.DoesNotExist:
-            pass
+    elif taken:
+        error_message.append("User with this login is already registered")
 
     if len(username) < 6:
         error_message.append("Username should be at least 6 characters")
@@ -58,11 +61,23 @@ def reg_new_user(request):
     if len(error_message):
         return render(request, "login/register.html", {"error_message": error_message})
 
-    User.objects.create_user(username, email, password)
+    try:
+        hashed = make_password(password)
+    except HashingBusy:
+        return busy()
+    User.objects.create(
+        username=User.normalize_username(username), email=User.objects.normalize_email(email), password=hashed
+    )
 
     return HttpResponseRedirect(reverse("login:index"))
 
 
+def busy():
+    response = HttpResponse("Too many logins at once, please try again shortly", status=503)
+    response["Retry-After"] = str(settings.THROTTLE_SHED_RETRY_AFTER)
+    return response
+
+
 def logout_view(request):
     if not request.user.is_authenticated:
         return HttpResponseRedirect(reverse("polls:index"))
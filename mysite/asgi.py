@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+# Serve the hot read views with their async versions (polls/async_views.py)
+os.environ.setdefault('POLLS_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,235 @@
+"""
+Per-view request metrics in the Prometheus text format.
+
+MetricsMiddleware times every request and records it under the URL name
+the request resolved to (polls:index, polls:vote, ...; "unresolved" for
+paths that match no URL, so random paths cannot blow up the number of
+series). Per view it keeps a latency histogram, the requests by method
+and status, and the SQL queries run and the time spent in them. Methods
+outside METHODS are counted as "other", for the same reason.
+
+Queries are counted by a wrapper that is put on every database connection
+as it is opened and that adds to the stats of the request being served,
+found through a context variable. sync_to_async copies the context, so the
+queries that async views run in worker threads are counted too. Requests
+slower than METRICS_SLOW_REQUEST seconds are logged to "mysite.metrics"
+with their slowest queries.
+
+The numbers are kept per process; scrape every process (or sum them) to
+see the whole site. For streaming responses the latency is the time until
+the response starts.
+"""
+import bisect
+import contextvars
+import heapq
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .throttling import client_ip
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_PREVIEW = 300
+# Methods recorded under their own name; any other is recorded as "other"
+METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("queries", "sql_time", "slowest")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        # Min-heap of (duration, sql) holding the slowest queries
+        self.slowest = []
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.sql_time += duration
+        keep = settings.METRICS_SLOW_QUERIES
+        if len(self.slowest) < keep:
+            heapq.heappush(self.slowest, (duration, sql))
+        elif keep and duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (duration, sql))
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - start)
+
+
+def instrument(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(instrument)
+
+
+def _label(value):
+    """`value` escaped for a label value in the text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class ViewMetrics:
+    __slots__ = ("buckets", "duration", "count", "queries", "sql_time", "responses")
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.duration = 0.0
+        self.count = 0
+        self.queries = 0
+        self.sql_time = 0.0
+        # {(method, status): requests}
+        self.responses = defaultdict(int)
+
+
+class Metrics:
+    """The metrics of this process, per view"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(ViewMetrics)
+
+    def record(self, view, method, status, duration, stats):
+        # Cumulative buckets are summed at export, so only one is bumped here
+        index = bisect.bisect_left(BUCKETS, duration)
+        if method not in METHODS:
+            method = "other"
+        with self._lock:
+            metrics = self._views[view]
+            if index < len(BUCKETS):
+                metrics.buckets[index] += 1
+            metrics.duration += duration
+            metrics.count += 1
+            metrics.queries += stats.queries
+            metrics.sql_time += stats.sql_time
+            metrics.responses[method, status] += 1
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def export(self):
+        """All the metrics in the Prometheus text exposition format"""
+        with self._lock:
+            views = [(_label(view), metrics) for view, metrics in sorted(self._views.items())]
+            lines = [
+                "# HELP mysite_http_requests_total Requests by view, method and status.",
+                "# TYPE mysite_http_requests_total counter",
+            ]
+            for view, metrics in views:
+                for (method, status), count in sorted(metrics.responses.items()):
+                    labels = f'view="{view}",method="{_label(method)}",status="{status}"'
+                    lines.append(f"mysite_http_requests_total{{{labels}}} {count}")
+            lines += [
+                "# HELP mysite_http_request_duration_seconds Request latency by view.",
+                "# TYPE mysite_http_request_duration_seconds histogram",
+            ]
+            for view, metrics in views:
+                cumulative = 0
+                bucket = f'mysite_http_request_duration_seconds_bucket{{view="{view}",le='
+                for bound, count in zip(BUCKETS, metrics.buckets):
+                    cumulative += count
+                    lines.append(f'{bucket}"{bound}"}} {cumulative}')
+                lines += [
+                    f'{bucket}"+Inf"}} {metrics.count}',
+                    f'mysite_http_request_duration_seconds_sum{{view="{view}"}} {metrics.duration:.6f}',
+                    f'mysite_http_request_duration_seconds_count{{view="{view}"}} {metrics.count}',
+                ]
+            lines += [
+                "# HELP mysite_sql_queries_total SQL queries run by requests, by view.",
+                "# TYPE mysite_sql_queries_total counter",
+            ]
+            lines += [f'mysite_sql_queries_total{{view="{view}"}} {metrics.queries}' for view, metrics in views]
+            lines += [
+                "# HELP mysite_sql_duration_seconds_total Time requests spent in SQL queries, by view.",
+                "# TYPE mysite_sql_duration_seconds_total counter",
+            ]
+            lines += [
+                f'mysite_sql_duration_seconds_total{{view="{view}"}} {metrics.sql_time:.6f}' for view, metrics in views
+            ]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """Records the latency and the SQL queries of every request; put it first in MIDDLEWARE"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            instrument(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, time.perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, time.perf_counter() - start, stats)
+        return response
+
+    def _finish(self, request, response, duration, stats):
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unresolved"
+        metrics.record(view, request.method, response.status_code, duration, stats)
+        if duration >= settings.METRICS_SLOW_REQUEST:
+            logger.warning(
+                "Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms%s",
+                request.method, request.path, view, duration * 1000, stats.queries, stats.sql_time * 1000,
+                "".join(
+                    f"\n  {query_time * 1000:.1f} ms: {sql[:SQL_PREVIEW]}"
+                    for query_time, sql in sorted(stats.slowest, reverse=True)
+                ),
+            )
+
+
+def metrics_view(request):
+    """
+    The metrics of this process for Prometheus, for the addresses in METRICS_ALLOWED_IPS and staff.
+    """
+    if client_ip(request) not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+        return HttpResponseForbidden("Forbidden")
+    return HttpResponse(metrics.export(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,312 @@
+"""
+On-demand profiling of live requests.
+
+ProfilingMiddleware profiles a request when
+
+* it carries an X-Profile header with a token from make_token() (shown on
+  the admin page, valid for PROFILING_TOKEN_MAX_AGE seconds), or
+* the switch set on the admin page (/admin/profiling/) is on and the
+  request is drawn at its sample rate, optionally only for some views.
+
+The switch lives in the shared cache with the time it turns itself off;
+each process reads it again at most every PROFILING_SWITCH_REFRESH seconds,
+so while it is off a request costs a header lookup and a clock check.
+
+With PROFILING_MODE = "sample" a thread samples the request's stack every
+PROFILING_INTERVAL seconds and the capture is written as folded stacks
+(flamegraph.pl, inferno, speedscope); with "cprofile" it is a cProfile
+dump (snakeviz, flameprof, pstats). Captures cover the rest of the
+middleware, the view, template rendering and the ORM, and are written to
+PROFILING_DIR, where only the newest PROFILING_KEEP are kept. Under ASGI
+only the event loop thread is profiled, so the ORM calls that async views
+make through sync_to_async show up as waits.
+"""
+import cProfile
+import datetime
+import functools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django import forms
+from django.conf import settings
+from django.contrib import admin
+from django.core import signing
+from django.core.cache import cache
+from django.http import FileResponse, Http404, HttpResponseRedirect
+from django.shortcuts import render
+from django.urls import Resolver404, resolve, reverse
+
+SWITCH_KEY = "profiling:switch"
+TOKEN_SALT = "mysite.profiling"
+CAPTURE_NAME = re.compile(r"^(\d{8}T\d{6}\.\d{6})-([\w.-]+)-([A-Z]+)-(\d+)ms\.(folded|prof)$")
+
+
+@dataclass(frozen=True)
+class SwitchState:
+    rate: float = 0.0
+    # URL names to profile; empty for all
+    views: tuple = ()
+    # time.time() at which the switch turns itself off
+    until: float = 0.0
+
+
+OFF = SwitchState()
+
+
+class Switch:
+    """This process's copy of the profiling switch kept in the cache"""
+
+    def __init__(self):
+        self._state = OFF
+        self._expires = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if now >= self._expires:
+            self._state = cache.get(SWITCH_KEY) or OFF
+            self._expires = now + settings.PROFILING_SWITCH_REFRESH
+        state = self._state
+        return state if state.rate and state.until > time.time() else OFF
+
+    def set(self, state):
+        cache.set(SWITCH_KEY, state, max(1, int(state.until - time.time())))
+        self._state = state
+        self._expires = time.monotonic() + settings.PROFILING_SWITCH_REFRESH
+
+
+switch = Switch()
+
+
+def make_token():
+    """A value for the X-Profile header that profiles the request it is sent with"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign("profile")
+
+
+def _valid_token(value):
+    try:
+        return signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            value, max_age=settings.PROFILING_TOKEN_MAX_AGE
+        ) == "profile"
+    except signing.BadSignature:
+        return False
+
+
+def should_profile(request):
+    token = request.META.get("HTTP_X_PROFILE")
+    if token is not None:
+        return _valid_token(token)
+    state = switch.get()
+    if not state.rate or random.random() >= state.rate:
+        return False
+    if not state.views:
+        return True
+    try:
+        return resolve(request.path_info).view_name in state.views
+    except Resolver404:
+        return False
+
+
+@functools.lru_cache(maxsize=4096)
+def _frame_name(code):
+    filename = code.co_filename
+    for path in sorted(sys.path, key=len, reverse=True):
+        if path and filename.startswith(path + os.sep):
+            filename = filename[len(path) + 1:]
+            break
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Counts the stacks of one thread, sampled every `interval` seconds, from below the frame of `root`"""
+
+    def __init__(self, thread_id, interval, root=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root = root
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None and frame.f_code is not self.root:
+                frames.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+@dataclass
+class Capture:
+    name: str
+    taken: datetime.datetime
+    view: str
+    method: str
+    ms: int
+    format: str
+    size: int
+
+
+def captures():
+    """The captures in PROFILING_DIR, newest first"""
+    directory = Path(settings.PROFILING_DIR)
+    if not directory.is_dir():
+        return []
+    found = []
+    for entry in os.scandir(directory):
+        match = CAPTURE_NAME.match(entry.name)
+        if not match:
+            continue
+        try:
+            size = entry.stat().st_size
+        except FileNotFoundError:
+            # Rotated away by another request meanwhile
+            continue
+        taken, view, method, ms, capture_format = match.groups()
+        found.append(Capture(
+            entry.name,
+            datetime.datetime.strptime(taken, "%Y%m%dT%H%M%S.%f").replace(tzinfo=datetime.timezone.utc),
+            view, method, int(ms), capture_format, size,
+        ))
+    return sorted(found, key=lambda capture: capture.name, reverse=True)
+
+
+def _save(request, duration, suffix, write):
+    directory = Path(settings.PROFILING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    match = request.resolver_match
+    view = (match.view_name if match is not None else "unresolved").replace(":", ".")
+    taken = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S.%f")
+    write(directory / f"{taken}-{view}-{request.method}-{round(duration * 1000)}ms.{suffix}")
+    for capture in captures()[settings.PROFILING_KEEP:]:
+        (directory / capture.name).unlink(missing_ok=True)
+
+
+def _save_samples(request, duration, sampler):
+    # A request faster than the sampling interval leaves nothing to look at,
+    # and an empty file would push a real capture out of PROFILING_KEEP
+    if sampler.stacks:
+        _save(request, duration, "folded", lambda path: path.write_text(sampler.folded()))
+
+
+class ProfilingMiddleware:
+    """Profiles the requests picked by should_profile(); put it right after MetricsMiddleware"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not should_profile(request):
+            return self.get_response(request)
+        return self._profiled(request)
+
+    async def __acall__(self, request):
+        if not should_profile(request):
+            return await self.get_response(request)
+        return await self._aprofiled(request)
+
+    def _profiled(self, request):
+        start = time.perf_counter()
+        if settings.PROFILING_MODE == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            _save(request, time.perf_counter() - start, "prof", profiler.dump_stats)
+            return response
+        sampler = StackSampler(threading.get_ident(), settings.PROFILING_INTERVAL, root=self._profiled.__code__)
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        _save_samples(request, time.perf_counter() - start, sampler)
+        return response
+
+    async def _aprofiled(self, request):
+        # Always sampled: cProfile would follow the event loop into other requests
+        start = time.perf_counter()
+        sampler = StackSampler(threading.get_ident(), settings.PROFILING_INTERVAL)
+        sampler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            sampler.stop()
+        _save_samples(request, time.perf_counter() - start, sampler)
+        return response
+
+
+class SwitchForm(forms.Form):
+    rate = forms.FloatField(label="Sample rate", min_value=0, max_value=1, initial=0.01)
+    views = forms.CharField(
+        label="URL names", required=False, help_text="Comma separated, e.g. polls:index; empty for every view"
+    )
+    minutes = forms.IntegerField(label="Turn off after (minutes)", min_value=1, max_value=24 * 60, initial=15)
+
+
+def profiling_admin(request):
+    """
+    Admin page listing the captures, with the switch and a token for the X-Profile header.
+    """
+    if request.method == "POST":
+        form = SwitchForm(request.POST)
+        if form.is_valid():
+            if "turn_off" in request.POST:
+                switch.set(SwitchState(until=time.time() + 1))
+            else:
+                switch.set(SwitchState(
+                    rate=form.cleaned_data["rate"],
+                    views=tuple(view.strip() for view in form.cleaned_data["views"].split(",") if view.strip()),
+                    until=time.time() + form.cleaned_data["minutes"] * 60,
+                ))
+            return HttpResponseRedirect(reverse("profiling"))
+    else:
+        form = SwitchForm()
+    state = switch.get()
+    return render(request, "admin/profiling.html", {
+        **admin.site.each_context(request),
+        "title": "Profiling",
+        "form": form,
+        "state": state,
+        "until": datetime.datetime.fromtimestamp(state.until, datetime.timezone.utc) if state.rate else None,
+        "token": make_token(),
+        "captures": captures(),
+    })
+
+
+def profiling_capture(request, name):
+    if not CAPTURE_NAME.match(name):
+        raise Http404()
+    path = Path(settings.PROFILING_DIR) / name
+    if not path.is_file():
+        raise Http404()
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=name)
@@ -43,11 +43,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mysite.metrics.MetricsMiddleware',
+    'mysite.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'mysite.throttling.ThrottleMiddleware',
+    'login.middleware.HashingBusyMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -57,7 +61,7 @@ ROOT_URLCONF = 'mysite.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [BASE_DIR / 'mysite' / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -80,10 +84,55 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {
+            # A file rather than the shared-cache in-memory database, so tests
+            # see the same locking behaviour as the real site.
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# Running more than one process needs a cache they share, e.g. Redis
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CACHE_REDIS_URL'],
+    }
+# LocMemCache is private to each process
+SHARED_CACHE = CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+
+# With a shared cache sessions are read from it and written through to the
+# database, and the logged-in user is cached too (login/backends.py). A
+# per-process cache would keep serving sessions and users to the other
+# processes after a logout or a password change, so they are read from the
+# database instead
+SESSION_ENGINE = (
+    'django.contrib.sessions.backends.cached_db' if SHARED_CACHE else 'django.contrib.sessions.backends.db'
+)
+
+AUTHENTICATION_BACKENDS = ['login.backends.CachedModelBackend']
+
+
+# bcrypt is preferred; hashes made by the other hashers are redone with it at
+# the next login
+PASSWORD_HASHERS = [
+    'login.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -130,3 +179,137 @@ STATICFILES_FINDERS = (
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Polls
+
+# Number of questions shown per page on the index and category feeds
+POLLS_PAGE_SIZE = 20
+
+# Seconds after which a vote counts half as much towards a poll's trending
+# score; run `manage.py decay_trending` every few minutes to apply the decay
+POLLS_TRENDING_HALF_LIFE = 6 * 3600
+# Number of polls on the trending pages
+POLLS_TRENDING_SIZE = 20
+
+# Route the index, details, results and category pages to the async views.
+# mysite/asgi.py turns this on; under WSGI the sync views are faster
+POLLS_ASYNC_VIEWS = os.environ.get('POLLS_ASYNC_VIEWS') == '1'
+
+# Most polls one request to the poll creation API may create
+POLLS_CREATE_MAX_BATCH = 500
+
+# Seconds a cached results snapshot is kept; snapshots are versioned, so this
+# only bounds memory use, never staleness
+POLLS_RESULTS_CACHE_TIMEOUT = 3600
+# Seconds a rendered poll card is cached; cards are keyed by the values they
+# show, so this only bounds memory use, never staleness
+POLLS_CARD_CACHE_TIMEOUT = 3600
+# Seconds the per-category poll and vote counts are cached; they may lag by this
+POLLS_CATEGORY_STATS_TIMEOUT = 10
+# Seconds a user's set of voted polls is cached
+POLLS_VOTED_CACHE_TIMEOUT = 24 * 3600
+
+# Live results (polls:results_stream, ASGI only). The broker carries change
+# notifications to the web processes; LocalBroker only reaches its own process
+POLLS_LIVE_BROKER = 'polls.live.LocalBroker'
+# Seconds between two updates of the same poll; votes in between are coalesced
+POLLS_LIVE_INTERVAL = 1.0
+# Seconds of silence after which a keepalive comment is sent
+POLLS_LIVE_KEEPALIVE = 15
+
+# Resized copies of category images (polls/images.py): built off the request
+# path in a pool of POLLS_IMAGE_WORKERS threads (0 builds them inline), as WebP
+# and JPEG at each of POLLS_IMAGE_WIDTHS, under content-hashed names
+POLLS_IMAGE_VARIANTS_ROOT = BASE_DIR / 'media' / 'variants'
+POLLS_IMAGE_VARIANTS_URL = '/media/variants/'
+POLLS_IMAGE_WIDTHS = (402, 804, 1206)
+POLLS_IMAGE_WORKERS = 2
+
+# Append votes to a local journal and apply them to the database in batches
+# with `manage.py apply_vote_journal` instead of writing them in the request
+VOTE_JOURNAL_ENABLED = False
+VOTE_JOURNAL_PATH = BASE_DIR / 'vote_journal.log'
+# How long the first writer of an fsync group waits for others to join it
+VOTE_JOURNAL_COMMIT_DELAY = 0.002
+
+
+# Login
+
+# Seconds a logged-in user is cached; saves and deletes drop the copy sooner.
+# 0 reads the user from the database on every request, as is needed when the
+# cache is not shared
+LOGIN_USER_CACHE_TIMEOUT = 300 if SHARED_CACHE else 0
+# Cost of new bcrypt hashes (2 ** rounds iterations); older hashes are redone
+# with it at the next login
+LOGIN_BCRYPT_ROUNDS = 12
+# Processes hashing passwords off the request thread (login/hashing.py); 0
+# hashes in the request thread
+LOGIN_HASH_WORKERS = 2
+# Hashes that may wait for a free process, and seconds a request waits for
+# room before it gets a 503
+LOGIN_HASH_QUEUE = 32
+LOGIN_HASH_WAIT = 1.0
+# Seconds a request waits for its hash, queueing included, before it gets a
+# 503; well above LOGIN_HASH_QUEUE hashes shared by the workers
+LOGIN_HASH_TIMEOUT = 10.0
+
+
+# Throttling (mysite/throttling.py)
+
+# Token buckets per URL name: `burst` requests at once, refilled at `rate` per
+# second, counted per user (`"key": "user"`, per IP when anonymous) or per IP,
+# for the listed methods (POST by default)
+THROTTLE_RULES = {
+    'polls:vote': {'rate': 1.0, 'burst': 10, 'key': 'user'},
+    'polls:new_poll': {'rate': 0.2, 'burst': 5, 'key': 'user'},
+    'polls:create_polls_api': {'rate': 0.2, 'burst': 5, 'key': 'user'},
+    'login:logging': {'rate': 0.2, 'burst': 5, 'key': 'ip'},
+    'login:reg_new_user': {'rate': 0.05, 'burst': 3, 'key': 'ip'},
+}
+# Where the buckets are kept: 'mysite.throttling.LocalStore' (per process) or
+# 'mysite.throttling.CacheStore' (the default cache, shared by all processes)
+THROTTLE_STORE = 'mysite.throttling.LocalStore'
+# Priority of each URL name; unlisted routes are 'normal'
+THROTTLE_PRIORITIES = {
+    'polls:vote': 'low',
+    'polls:new_poll': 'low',
+    'polls:create_polls_api': 'low',
+    'polls:export': 'low',
+    'login:logging': 'low',
+    'login:reg_new_user': 'low',
+    'polls:results': 'high',
+    'polls:results_stream': 'high',
+}
+# Requests in flight in one process above which routes of a priority are shed
+# with 503; priorities not listed are never shed. The count is per process, so
+# this only takes effect with threaded (runserver, gunicorn --threads) or ASGI
+# workers: a sync worker serving one request at a time never exceeds 1
+THROTTLE_SHED_AT = {'low': 16, 'normal': 48}
+# Retry-After of a shed request, in seconds
+THROTTLE_SHED_RETRY_AFTER = 5
+
+
+# Metrics (mysite/metrics.py)
+
+# Requests taking at least this many seconds are logged with their slowest
+# METRICS_SLOW_QUERIES queries
+METRICS_SLOW_REQUEST = 1.0
+METRICS_SLOW_QUERIES = 3
+# Addresses allowed to read /metrics (staff users always are)
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+
+# Profiling (mysite/profiling.py)
+
+# "sample" writes folded stacks sampled every PROFILING_INTERVAL seconds,
+# "cprofile" writes cProfile dumps (slower, but counts every call)
+PROFILING_MODE = 'sample'
+PROFILING_INTERVAL = 0.005
+# Where the captures go, and how many of the newest are kept
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_KEEP = 100
+# Seconds a token for the X-Profile header stays valid
+PROFILING_TOKEN_MAX_AGE = 3600
+# Seconds each process goes without checking the admin switch in the cache
+PROFILING_SWITCH_REFRESH = 5
@@ -0,0 +1,295 @@
+import pstats
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import views
+from polls.models import Category, Question
+
+from . import profiling, throttling
+from .metrics import MetricsMiddleware, metrics
+from .throttling import LocalStore, CacheStore, ThrottleMiddleware
+
+
+class TokenBucketTest(TestCase):
+    def check_store(self, store):
+        self.assertEqual(store.consume("k", rate=1, burst=2, now=100), 0)
+        self.assertEqual(store.consume("k", rate=1, burst=2, now=100), 0)
+        self.assertEqual(store.consume("k", rate=1, burst=2, now=100), 1.0)
+        self.assertEqual(store.consume("k", rate=1, burst=2, now=100.5), 0.5)
+        self.assertEqual(store.consume("k", rate=1, burst=2, now=101), 0)
+        self.assertEqual(store.consume("other", rate=1, burst=2, now=101), 0)
+
+    def test_local_store(self):
+        """
+            A bucket allows `burst` requests at once and then one per 1/rate seconds
+        """
+        self.check_store(LocalStore())
+
+    def test_cache_store(self):
+        cache.clear()
+        self.check_store(CacheStore())
+
+    def test_local_store_evicts_least_recently_used(self):
+        store = LocalStore(max_keys=2)
+        store.consume("a", rate=1, burst=1, now=0)
+        store.consume("b", rate=1, burst=1, now=0)
+        store.consume("a", rate=1, burst=1, now=0)
+        store.consume("c", rate=1, burst=1, now=0)
+        self.assertEqual(list(store._buckets), ["a", "c"])
+
+
+@override_settings(
+    THROTTLE_RULES={"polls:vote": {"rate": 0.01, "burst": 2, "key": "user"}},
+    THROTTLE_SHED_AT={"low": 4, "normal": 8},
+)
+class ThrottleMiddlewareTest(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(throttling, "_store", LocalStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        category = Category.objects.create(category_name="Games")
+        self.user = User.objects.create(username="Voter1")
+        self.question = Question.objects.create(
+            question_text="Question", pub_date=timezone.now(), category=category, created_by=self.user
+        )
+
+    def vote(self):
+        return self.client.post(reverse("polls:vote", args=(self.question.id,)))
+
+    def test_votes_over_the_limit_get_429(self):
+        """
+            Each user gets `burst` votes, then 429 with Retry-After
+        """
+        self.client.force_login(self.user)
+        self.assertEqual([self.vote().status_code for _ in range(2)], [200, 200])
+        response = self.vote()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "100")
+
+        self.client.force_login(User.objects.create(username="Voter2"))
+        self.assertEqual(self.vote().status_code, 200)
+
+    def test_anonymous_requests_are_limited_per_ip(self):
+        self.assertEqual([self.vote().status_code for _ in range(3)], [302, 302, 429])
+        self.assertEqual(self.client.post(
+            reverse("polls:vote", args=(self.question.id,)), REMOTE_ADDR="10.0.0.2"
+        ).status_code, 302)
+
+    def test_low_priority_routes_are_shed_first(self):
+        """
+            Under load votes are refused with 503, other pages only under more
+            load, and results keep being served
+        """
+        with mock.patch.object(ThrottleMiddleware, "in_flight", 5):
+            response = self.vote()
+            self.assertEqual(response.status_code, 503)
+            self.assertIn("Retry-After", response)
+            self.assertEqual(self.client.get(reverse("polls:index")).status_code, 200)
+        with mock.patch.object(ThrottleMiddleware, "in_flight", 100):
+            self.assertEqual(self.client.get(reverse("polls:index")).status_code, 503)
+            self.assertEqual(self.client.get(reverse("polls:results", args=(self.question.id,))).status_code, 200)
+        self.assertEqual(ThrottleMiddleware.in_flight, 0)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        category = Category.objects.create(category_name="Games")
+        self.user = User.objects.create(username="Kirill")
+        Question.objects.create(
+            question_text="Question", pub_date=timezone.now(), category=category, created_by=self.user
+        )
+
+    def sample(self, name, **labels):
+        """The value of a sample in the /metrics output"""
+        body = self.client.get(reverse("metrics")).content.decode()
+        selector = ",".join(f'{key}="{value}"' for key, value in labels.items())
+        found = re.search(rf"^{name}{{{re.escape(selector)}}} (\S+)$", body, re.M)
+        return float(found.group(1)) if found else None
+
+    def test_requests_are_recorded_per_view(self):
+        with self.assertNumQueries(1):
+            self.client.get(reverse("polls:index"))
+        self.client.get(reverse("polls:index"))
+        self.client.get("/no/such/page")
+        self.assertEqual(self.sample("mysite_http_requests_total", view="polls:index", method="GET", status=200), 2)
+        self.assertEqual(self.sample("mysite_http_requests_total", view="unresolved", method="GET", status=404), 1)
+        self.assertEqual(self.sample("mysite_http_request_duration_seconds_count", view="polls:index"), 2)
+        self.assertEqual(self.sample("mysite_http_request_duration_seconds_bucket", view="polls:index", le="+Inf"), 2)
+        self.assertEqual(self.sample("mysite_sql_queries_total", view="polls:index"), 2)
+        self.assertGreater(self.sample("mysite_sql_duration_seconds_total", view="polls:index"), 0)
+
+    def test_histogram_buckets_are_cumulative(self):
+        metrics.record("polls:index", "GET", 200, 0.003, mock.Mock(queries=0, sql_time=0))
+        metrics.record("polls:index", "GET", 200, 0.2, mock.Mock(queries=0, sql_time=0))
+        metrics.record("polls:index", "GET", 200, 60, mock.Mock(queries=0, sql_time=0))
+        buckets = [
+            self.sample("mysite_http_request_duration_seconds_bucket", view="polls:index", le=bound)
+            for bound in ("0.005", "0.1", "0.25", "10.0", "+Inf")
+        ]
+        self.assertEqual(buckets, [1, 1, 2, 2, 3])
+
+    def test_unknown_methods_share_a_series_and_labels_are_escaped(self):
+        self.client.generic("BREW", reverse("polls:index"))
+        self.client.generic("WHEN", reverse("polls:index"))
+        self.assertEqual(self.sample("mysite_http_requests_total", view="polls:index", method="other", status=405), 2)
+        metrics.record('odd"view\\\n', "GET", 200, 0.1, mock.Mock(queries=0, sql_time=0))
+        body = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('mysite_sql_queries_total{view="odd\\"view\\\\\\n"} 0\n', body)
+
+    def test_queries_of_async_views_are_counted(self):
+        """Queries run through sync_to_async count towards the request"""
+        async def view(request):
+            await sync_to_async(list)(Question.objects.all())
+            await sync_to_async(list)(Category.objects.all())
+            return HttpResponse()
+
+        request = RequestFactory().get("/")
+        request.resolver_match = mock.Mock(view_name="async_view")
+        async_to_sync(MetricsMiddleware(view))(request)
+        self.assertEqual(self.sample("mysite_sql_queries_total", view="async_view"), 2)
+
+    @override_settings(METRICS_SLOW_REQUEST=0, METRICS_SLOW_QUERIES=1)
+    def test_slow_requests_are_logged_with_their_slowest_queries(self):
+        with self.assertLogs("mysite.metrics", "WARNING") as logs:
+            self.client.get(reverse("polls:index"))
+        self.assertIn("Slow request GET /polls/ (polls:index)", logs.output[0])
+        self.assertIn('ms: SELECT "polls_question"."id"', logs.output[0])
+        self.assertEqual(logs.output[0].count(" ms: "), 1)
+
+    def test_metrics_are_only_shown_to_allowed_addresses_and_staff(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.2").status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.2").status_code, 200)
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(PROFILING_DIR=self.directory, PROFILING_INTERVAL=0.001)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        profiling.switch.__init__()
+        self.addCleanup(profiling.switch.__init__)
+        self.addCleanup(cache.delete, profiling.SWITCH_KEY)
+        self.admin = User.objects.create(username="admin", is_staff=True, is_superuser=True)
+
+    def captures(self):
+        return sorted(path.name for path in self.directory.iterdir()) if self.directory.exists() else []
+
+    def test_off_by_default(self):
+        self.client.get(reverse("polls:index"))
+        self.client.get(reverse("polls:about"), HTTP_X_PROFILE="not a token")
+        self.assertEqual(self.captures(), [])
+
+    def test_signed_header_profiles_the_request(self):
+        published_page = views.published_page
+
+        def slow_page(*args):
+            time.sleep(0.02)
+            return published_page(*args)
+
+        with mock.patch("polls.views.published_page", slow_page):
+            self.client.get(reverse("polls:index"), HTTP_X_PROFILE=profiling.make_token())
+        [name] = self.captures()
+        self.assertRegex(name, r"-polls\.index-GET-\d+ms\.folded$")
+        self.assertIn("slow_page (mysite/tests.py:", (self.directory / name).read_text())
+
+    @override_settings(PROFILING_INTERVAL=10)
+    def test_request_without_samples_writes_nothing(self):
+        self.client.get(reverse("polls:about"), HTTP_X_PROFILE=profiling.make_token())
+        self.assertEqual(self.captures(), [])
+
+    @override_settings(PROFILING_TOKEN_MAX_AGE=60)
+    def test_expired_token_is_refused(self):
+        token = profiling.make_token()
+        with mock.patch("time.time", return_value=time.time() + 120):
+            self.client.get(reverse("polls:index"), HTTP_X_PROFILE=token)
+        self.assertEqual(self.captures(), [])
+
+    @override_settings(PROFILING_MODE="cprofile")
+    def test_cprofile_mode_covers_view_templates_and_orm(self):
+        self.client.get(reverse("polls:index"), HTTP_X_PROFILE=profiling.make_token())
+        [name] = self.captures()
+        self.assertTrue(name.endswith(".prof"))
+        functions = {(Path(filename).name, function) for filename, _, function in pstats.Stats(
+            str(self.directory / name)
+        ).stats}
+        self.assertIn(("views.py", "get_queryset"), functions)
+        self.assertIn(("base.py", "render"), functions)
+        self.assertIn(("compiler.py", "execute_sql"), functions)
+
+    def test_sampler_writes_folded_stacks(self):
+        def busy_view():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+
+        sampler = profiling.StackSampler(threading.get_ident(), 0.001)
+        sampler.start()
+        busy_view()
+        sampler.stop()
+        folded = sampler.folded()
+        self.assertRegex(folded, r"busy_view \(mysite/tests\.py:\d+\) \d+\n")
+        for line in folded.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+
+    @override_settings(PROFILING_MODE="cprofile")
+    def test_admin_switch_samples_selected_views(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse("profiling"), {"rate": 1, "views": "polls:about", "minutes": 5})
+        self.assertRedirects(response, reverse("profiling"))
+        self.client.get(reverse("polls:index"))
+        self.client.get(reverse("polls:about"))
+        [name] = self.captures()
+        self.assertIn("-polls.about-GET-", name)
+
+        self.client.post(reverse("profiling"), {"rate": 1, "views": "", "minutes": 5, "turn_off": "1"})
+        self.client.get(reverse("polls:about"))
+        self.assertEqual(len(self.captures()), 1)
+
+    def test_switch_turns_itself_off(self):
+        profiling.switch.set(profiling.SwitchState(rate=1, until=time.time() + 60))
+        self.assertEqual(profiling.switch.get().rate, 1)
+        with mock.patch("time.time", return_value=time.time() + 120):
+            self.assertEqual(profiling.switch.get(), profiling.OFF)
+
+    @override_settings(PROFILING_KEEP=2, PROFILING_MODE="cprofile")
+    def test_only_the_newest_captures_are_kept(self):
+        for _ in range(3):
+            self.client.get(reverse("polls:about"), HTTP_X_PROFILE=profiling.make_token())
+        self.assertEqual(len(self.captures()), 2)
+
+    @override_settings(PROFILING_MODE="cprofile")
+    def test_admin_lists_and_serves_captures(self):
+        self.client.get(reverse("polls:about"), HTTP_X_PROFILE=profiling.make_token())
+        [name] = self.captures()
+        self.assertEqual(self.client.get(reverse("profiling")).status_code, 302)
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("profiling"))
+        self.assertContains(response, reverse("profiling_capture", args=[name]))
+        self.assertContains(response, "X-Profile: ")
+        response = self.client.get(reverse("profiling_capture", args=[name]))
+        self.assertEqual(b"".join(response.streaming_content), (self.directory / name).read_bytes())
+        self.assertEqual(self.client.get(reverse("profiling_capture", args=["..settings.py"])).status_code, 404)
+
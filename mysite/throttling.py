@@ -0,0 +1,147 @@
+"""
+Rate limiting and load shedding for the write-heavy routes.
+
+ThrottleMiddleware runs every request through two checks once its URL is
+resolved:
+
+* Load shedding. The middleware counts the requests this process is
+  handling. When the database slows down they pile up, and once the count
+  exceeds the limit for the route's priority in THROTTLE_SHED_AT the request
+  is refused with 503 before it reaches the database. Low priority routes
+  (votes, logins, poll creation) have the lowest limit, so they are shed
+  first, and "high" routes such as polls:results are never shed. The count
+  only grows past 1 in processes that serve requests concurrently (threaded
+  or ASGI workers); behind single-threaded sync workers nothing is shed.
+* Token buckets. Each route in THROTTLE_RULES has a bucket per user (or per
+  client IP for anonymous requests, or always per IP) that holds `burst`
+  tokens and refills at `rate` tokens per second. A request that finds the
+  bucket empty gets 429 with the number of seconds until the next token in
+  Retry-After.
+
+Buckets live in the store named by THROTTLE_STORE: LocalStore keeps them in
+this process, CacheStore in the Django cache, shared by all processes.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.module_loading import import_string
+
+
+def _refill(tokens, updated, rate, burst, now):
+    return min(burst, tokens + (now - updated) * rate)
+
+
+def _take(tokens, rate):
+    """Return the tokens left after taking one, and the seconds to wait if there was none"""
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class LocalStore:
+    """
+        Token buckets in a dict of this process, evicting the least recently
+        used buckets beyond `max_keys`. Each process limits on its own, so
+        with N workers a client can get up to N times the configured rate.
+    """
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def consume(self, key, rate, burst, now=None):
+        """Take a token from the bucket `key`; return 0 or the seconds until one is available"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens, wait = _take(_refill(tokens, updated, rate, burst, now), rate)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class CacheStore:
+    """
+        Token buckets in the Django cache, shared by every process using it.
+        Reading and writing a bucket are two cache calls, so concurrent
+        requests can occasionally spend the same token.
+    """
+
+    def consume(self, key, rate, burst, now=None):
+        now = time.time() if now is None else now
+        cache_key = f"throttle:{key}"
+        tokens, updated = cache.get(cache_key, (burst, now))
+        tokens, wait = _take(_refill(tokens, updated, rate, burst, now), rate)
+        # Keep the bucket until it would be full again anyway
+        cache.set(cache_key, (tokens, now), math.ceil((burst - tokens) / rate) + 1)
+        return wait
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = import_string(settings.THROTTLE_STORE)()
+        return _store
+
+
+def client_ip(request):
+    # Behind a proxy REMOTE_ADDR must be set from the forwarded address by
+    # the server; client supplied headers are not trusted here.
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _retry_after(response, seconds):
+    response["Retry-After"] = str(max(1, math.ceil(seconds)))
+    return response
+
+
+class ThrottleMiddleware(MiddlewareMixin):
+    _lock = threading.Lock()
+    in_flight = 0
+
+    def process_request(self, request):
+        with self._lock:
+            ThrottleMiddleware.in_flight += 1
+        request._throttle_counted = True
+
+    def process_response(self, request, response):
+        if getattr(request, "_throttle_counted", False):
+            request._throttle_counted = False
+            with self._lock:
+                ThrottleMiddleware.in_flight -= 1
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = request.resolver_match.view_name
+
+        limit = settings.THROTTLE_SHED_AT.get(settings.THROTTLE_PRIORITIES.get(route, "normal"))
+        if limit is not None and self.in_flight > limit:
+            return _retry_after(
+                HttpResponse("The site is busy, please try again shortly", status=503),
+                settings.THROTTLE_SHED_RETRY_AFTER,
+            )
+
+        rule = settings.THROTTLE_RULES.get(route)
+        if rule is None or request.method not in rule.get("methods", ("POST",)):
+            return None
+        if rule.get("key") == "user" and request.user.is_authenticated:
+            key = f"{route}:user:{request.user.pk}"
+        else:
+            key = f"{route}:ip:{client_ip(request)}"
+        wait = get_store().consume(key, rule["rate"], rule["burst"])
+        if wait:
+            return _retry_after(HttpResponse("Too many requests", status=429), wait)
+        return None
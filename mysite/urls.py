@@ -19,10 +19,17 @@ from django.urls import path, include
 from django.contrib.staticfiles.urls import static
 from django.conf import settings
 
+from .metrics import metrics_view
+from .profiling import profiling_admin, profiling_capture
+
 urlpatterns = [
+    path('admin/profiling/', admin.site.admin_view(profiling_admin), name="profiling"),
+    path('admin/profiling/<str:name>', admin.site.admin_view(profiling_capture), name="profiling_capture"),
     path('admin/', admin.site.urls),
     path('polls/', include("polls.urls")),
-    path('login/', include("login.urls"))
+    path('login/', include("login.urls")),
+    path('metrics', metrics_view, name="metrics"),
 ]
 
-urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
+urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+urlpatterns += static(settings.POLLS_IMAGE_VARIANTS_URL, document_root=settings.POLLS_IMAGE_VARIANTS_ROOT)
\ No newline at end of file
@@ -1,6 +1,7 @@
 from .models import Question, Choice, Category
 from django.contrib import admin
 from .forms import CategoryForm
+from .search import filter_questions
 
 # Register your models here.
 
@@ -17,6 +18,12 @@ class QuestionAdmin(admin.ModelAdmin):
     list_display = ["question_text", "pub_date", "was_published_recently"]
     inlines = [ChoiceInLine]
 
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of an icontains scan
+        if not search_term:
+            return queryset, False
+        return filter_questions(queryset, search_term), False
+
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -0,0 +1,85 @@
+"""
+Async versions of the hot read views, used when the site is served by
+mysite/asgi.py. They render the same templates with the same context as
+their counterparts in views.py, but wait on the database and the cache
+without holding a thread.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponseRedirect
+from django.shortcuts import render
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import aget_results, avoted_question_ids
+from .models import Question
+from .pagination import apaginate_by_pub_date, InvalidCursor, KeysetPage
+from .registry import category_registry
+
+
+async def authenticated(request):
+    # Evaluate the lazy request.user here, in a thread: templates read it
+    # later, and looking up the session from the event loop is not allowed.
+    return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+async def voted_ids(request):
+    if not await authenticated(request):
+        return frozenset()
+    return await avoted_question_ids(request.user)
+
+
+async def published_page(queryset, cursor):
+    try:
+        return await apaginate_by_pub_date(queryset, cursor, settings.POLLS_PAGE_SIZE)
+    except InvalidCursor:
+        return await apaginate_by_pub_date(queryset, None, settings.POLLS_PAGE_SIZE)
+
+
+async def published_results_or_404(pk):
+    results = await aget_results(pk)
+    if results is None or results.pub_date > timezone.now():
+        raise Http404()
+    return results
+
+
+async def index(request):
+    page = await published_page(Question.objects.select_related("created_by"), request.GET.get("cursor"))
+    return render(request, "polls/index.html", {
+        "latest_question_list": page.object_list,
+        "page": page,
+        "voted_ids": await voted_ids(request),
+    })
+
+
+async def detail_view(request, pk):
+    question = await published_results_or_404(pk)
+    if await authenticated(request):
+        if question.created_by_id == request.user.id:
+            return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
+        if question.id in await avoted_question_ids(request.user):
+            return render(request, "polls/results.html", {"question": question})
+    return render(request, "polls/details.html", {"question": question})
+
+
+async def results(request, pk):
+    question = await published_results_or_404(pk)
+    await authenticated(request)
+    return render(request, "polls/results.html", {"question": question})
+
+
+async def category(request, cat):
+    found = await category_registry.aget(cat)
+    if found is None:
+        page = KeysetPage()
+    else:
+        page = await published_page(
+            Question.objects.select_related("created_by").filter(category_id=found.pk),
+            request.GET.get("cursor"),
+        )
+    return render(request, "polls/category.html", {
+        "polls": page.object_list,
+        "page": page,
+        "category": cat,
+        "voted_ids": await voted_ids(request),
+    })
@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Question, Vote
+
+
+@dataclass
+class ChoiceResult:
+    id: int
+    choice_text: str
+    vote_count: int
+
+
+@dataclass
+class QuestionResults:
+    """Everything the details and results pages show about a question"""
+    id: int
+    question_text: str
+    pub_date: datetime
+    created_by_id: int
+    created_by: str
+    choices: list = field(default_factory=list)
+
+    def __str__(self):
+        return self.question_text
+
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def results_cache_stats():
+    with _stats_lock:
+        return {"hits": _stats["hits"], "misses": _stats["misses"]}
+
+
+def _version_key(question_id):
+    return f"polls:question:{question_id}:version"
+
+
+def question_version(question_id):
+    key = _version_key(question_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1, so a version key that was
+        # evicted never comes back with a number already used for old data.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def aquestion_version(question_id):
+    key = _version_key(question_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_question_version(question_id):
+    """Invalidate everything cached for the question; call after a vote, edit or delete"""
+    cache.set(_version_key(question_id), time.time_ns(), None)
+
+
+def load_results(question_id):
+    question = Question.objects.select_related("created_by").filter(pk=question_id).first()
+    if question is None:
+        return None
+    return _results(question, list(question.choices_with_votes()))
+
+
+async def aload_results(question_id):
+    question = await Question.objects.select_related("created_by").filter(pk=question_id).afirst()
+    if question is None:
+        return None
+    return _results(question, [choice async for choice in question.choices_with_votes()])
+
+
+def _results(question, choices):
+    return QuestionResults(
+        id=question.id,
+        question_text=question.question_text,
+        pub_date=question.pub_date,
+        created_by_id=question.created_by_id,
+        created_by=question.created_by.username,
+        choices=[
+            ChoiceResult(id=choice.id, choice_text=choice.choice_text, vote_count=choice.vote_count)
+            for choice in choices
+        ],
+    )
+
+
+def get_results(question_id):
+    """
+        Return the QuestionResults of a question, or None if it does not exist.
+
+        Snapshots are cached under the question's current version, so a bump
+        makes the next request rebuild it and old snapshots simply expire.
+    """
+    key = f"polls:results:{question_id}:{question_version(question_id)}"
+    results = cache.get(key)
+    if results is not None:
+        _count("hits")
+        return results
+    _count("misses")
+    results = load_results(question_id)
+    if results is not None:
+        cache.set(key, results, settings.POLLS_RESULTS_CACHE_TIMEOUT)
+    return results
+
+
+async def aget_results(question_id):
+    """get_results() for async views"""
+    key = f"polls:results:{question_id}:{await aquestion_version(question_id)}"
+    results = await cache.aget(key)
+    if results is not None:
+        _count("hits")
+        return results
+    _count("misses")
+    results = await aload_results(question_id)
+    if results is not None:
+        await cache.aset(key, results, settings.POLLS_RESULTS_CACHE_TIMEOUT)
+    return results
+
+
+def _voted_key(user_id):
+    return f"polls:user:{user_id}:voted"
+
+
+def voted_question_ids(user):
+    """
+        Frozenset of the ids of the questions `user` has voted in.
+
+        Loaded from the database on first use and kept in the cache, where
+        mark_voted() adds to it, so deciding whether a user has voted costs
+        no query once the set is warm.
+    """
+    key = _voted_key(user.pk)
+    question_ids = cache.get(key)
+    if question_ids is None:
+        question_ids = frozenset(Vote.objects.filter(voted_by_id=user.pk).values_list("question_id", flat=True))
+        cache.set(key, question_ids, settings.POLLS_VOTED_CACHE_TIMEOUT)
+    return question_ids
+
+
+async def avoted_question_ids(user):
+    """voted_question_ids() for async views"""
+    key = _voted_key(user.pk)
+    question_ids = await cache.aget(key)
+    if question_ids is None:
+        question_ids = frozenset([
+            question_id async for question_id in
+            Vote.objects.filter(voted_by_id=user.pk).values_list("question_id", flat=True)
+        ])
+        await cache.aset(key, question_ids, settings.POLLS_VOTED_CACHE_TIMEOUT)
+    return question_ids
+
+
+def mark_voted(user, question_id):
+    key = _voted_key(user.pk)
+    question_ids = cache.get(key)
+    if question_ids is not None and question_id not in question_ids:
+        cache.set(key, question_ids | {question_id}, settings.POLLS_VOTED_CACHE_TIMEOUT)
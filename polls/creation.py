@@ -0,0 +1,49 @@
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .locking import lock_for_writing
+from .models import Question, Choice, Category
+from .registry import category_registry
+from .stats import add_to_category_stats
+
+MIN_CHOICES = 2
+TOO_FEW_CHOICES = "A poll needs at least two choices."
+
+
+def create_polls(user, polls):
+    """
+        Create polls by `user` in one transaction and return their questions.
+
+        Every poll is a dict with `question_text`, `category` (a category
+        name, created if it does not exist yet), `choices` (a list of choice
+        texts) and an optional `pub_date`, which defaults to now. All
+        questions go in one bulk INSERT and all choices in another, however
+        many polls there are.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        lock_for_writing()
+        categories = {}
+        for name in {poll["category"] for poll in polls}:
+            found = category_registry.get(name)
+            categories[name] = found.pk if found else Category.objects.get_or_create(category_name=name)[0].pk
+
+        questions = Question.objects.bulk_create([
+            Question(
+                question_text=poll["question_text"],
+                pub_date=poll.get("pub_date") or now,
+                category_id=categories[poll["category"]],
+                created_by=user,
+            )
+            for poll in polls
+        ])
+        Choice.objects.bulk_create([
+            Choice(question_id=question.pk, choice_text=text)
+            for question, poll in zip(questions, polls)
+            for text in poll["choices"]
+        ])
+        for category_id, count in Counter(question.category_id for question in questions).items():
+            add_to_category_stats(category_id, polls=count)
+    return questions
@@ -0,0 +1,97 @@
+import csv
+import json
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Question, Choice, Vote
+
+# kind -> (model, exported fields, field compared with the `since` timestamp)
+EXPORTS = {
+    "questions": (
+        Question,
+        ["id", "category_id", "created_by_id", "question_text", "pub_date", "total_votes"],
+        "pub_date",
+    ),
+    # Choices carry no timestamp of their own, so they follow their question's
+    "choices": (Choice, ["id", "question_id", "choice_text", "votes"], "question__pub_date"),
+    "votes": (Vote, ["id", "question_id", "voted_on_id", "voted_by_id", "voted_at"], "voted_at"),
+}
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CHUNK_SIZE = 2000
+
+
+class ExportError(Exception):
+    """ invalid export parameters """
+
+
+def _rows(kind, since_id=None, since=None):
+    model, fields, timestamp_field = EXPORTS[kind]
+    queryset = model.objects.order_by("pk")
+    if since_id is not None:
+        queryset = queryset.filter(pk__gt=since_id)
+    if since is not None:
+        queryset = queryset.filter(**{f"{timestamp_field}__gte": since})
+    for row in queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE):
+        yield fields, [value.isoformat() if isinstance(value, datetime) else value for value in row]
+
+
+class _Line:
+    """File-like object for csv.writer that hands back what was written"""
+
+    def write(self, value):
+        return value
+
+
+def export_lines(kinds, output_format="ndjson", since_id=None, since=None):
+    """
+        Return an iterator over the export as lines of text.
+
+        Rows are read with chunked iterator() queries, so memory use does not
+        depend on the size of the tables. NDJSON tags every row with its kind
+        and can mix kinds; CSV has one header, so it takes a single kind.
+        Parameters are checked here, before anything is streamed.
+    """
+    if output_format not in FORMATS:
+        raise ExportError(f"Unknown format {output_format!r}")
+    unknown = set(kinds) - set(EXPORTS)
+    if unknown or not kinds:
+        raise ExportError(f"Unknown kind {', '.join(sorted(unknown)) or '(none)'}")
+    if output_format == "csv" and len(kinds) != 1:
+        raise ExportError("CSV exports take exactly one kind")
+    if output_format == "csv":
+        return _csv_lines(kinds[0], since_id, since)
+    return _ndjson_lines(kinds, since_id, since)
+
+
+def _csv_lines(kind, since_id, since):
+    writer = csv.writer(_Line())
+    yield writer.writerow(EXPORTS[kind][1])
+    for _, values in _rows(kind, since_id, since):
+        yield writer.writerow(values)
+
+
+def _ndjson_lines(kinds, since_id, since):
+    for kind in kinds:
+        for fields, values in _rows(kind, since_id, since):
+            record = dict(zip(fields, values), type=kind)
+            yield json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def parse_since(value):
+    """Parse an ISO 8601 date or datetime; naive values are taken as UTC"""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            date = parse_date(value)
+            if date is None:
+                raise ValueError(value)
+            parsed = datetime.combine(date, time.min)
+    except ValueError:
+        raise ExportError(f"Invalid timestamp {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
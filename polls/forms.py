@@ -1,9 +1,16 @@
 from .models import Question, Choice, Category
+from .images import schedule_variants
 from django import forms
+from django.db import transaction
 
 
 class CreateQuestionForm(forms.Form):
-    question_text = forms.CharField(label="Question text", max_length=300)
+    question_text = forms.CharField(label="Question text", max_length=201)
+    category = forms.ChoiceField(label="Category")
+
+    def __init__(self, *args, categories=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["category"].choices = [(category.category_name, category.category_name) for category in categories]
 
 
 class CreateChoiceForm(forms.Form):
@@ -14,4 +21,25 @@ class CreateChoiceForm(forms.Form):
 class CategoryForm(forms.ModelForm):
     class Meta:
         model = Category
-        fields = ['category_name', 'img']
\ No newline at end of file
+        fields = ['category_name', 'img']
+
+    def save(self, commit=True):
+        category = super().save(commit=False)
+        image_changed = "img" in self.changed_data
+        if image_changed:
+            # The old variants no longer apply; the original is served until
+            # the new ones are built
+            category.img_hash = ""
+            category.img_widths = []
+        if commit:
+            category.save()
+            self._save_m2m()
+        if image_changed:
+            transaction.on_commit(lambda: self._schedule_variants(category))
+        return category
+
+    @staticmethod
+    def _schedule_variants(category):
+        # Runs on commit, by when the admin has saved a category built with commit=False
+        if category.pk and category.img:
+            schedule_variants(category.pk)
@@ -0,0 +1,157 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from PIL import Image, ImageOps
+
+from .models import Category
+from .registry import category_registry
+
+logger = logging.getLogger(__name__)
+
+# Encoder and options per variant extension; browsers without WebP get the JPEG
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def variant_storage():
+    return FileSystemStorage(
+        location=settings.POLLS_IMAGE_VARIANTS_ROOT, base_url=settings.POLLS_IMAGE_VARIANTS_URL
+    )
+
+
+def variant_name(digest, width, extension):
+    return f"{digest[:2]}/{digest}-{width}w.{extension}"
+
+
+def read_source(category):
+    """
+        The bytes of a category's image, from its storage or, for images
+        shipped with the app, from the static files; None if it is missing.
+    """
+    name = category.img.name
+    if not name:
+        return None
+    if category.img.storage.exists(name):
+        with category.img.storage.open(name, "rb") as file:
+            return file.read()
+    path = finders.find(name)
+    if path:
+        with open(path, "rb") as file:
+            return file.read()
+    return None
+
+
+def _encode(image, image_format, options):
+    if image_format == "JPEG" and image.mode == "RGBA":
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    output = io.BytesIO()
+    image.save(output, image_format, **options)
+    return output.getvalue()
+
+
+def make_variants(data, digest):
+    """
+        Write the resized copies of the image `data` and return their widths.
+
+        Every width of POLLS_IMAGE_WIDTHS is built in every format of FORMATS,
+        except that images are never enlarged: widths above the original's
+        are replaced by the original width. Files are named after the content
+        hash, so copies that already exist are reused rather than rebuilt.
+    """
+    storage = variant_storage()
+    with Image.open(io.BytesIO(data)) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+    widths = sorted({min(width, image.width) for width in settings.POLLS_IMAGE_WIDTHS})
+    for width in widths:
+        missing = [
+            extension for extension in FORMATS if not storage.exists(variant_name(digest, width, extension))
+        ]
+        if not missing:
+            continue
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        for extension in missing:
+            image_format, options = FORMATS[extension]
+            storage.save(variant_name(digest, width, extension), ContentFile(_encode(resized, image_format, options)))
+    return widths
+
+
+def build_variants(category_id, force=False):
+    """
+        Build the resized copies of a category's image and record them on the
+        category. Returns their widths, or None when the category has no
+        image (or it cannot be found). Unless `force`, an image whose hash
+        is already recorded is left alone.
+    """
+    category = Category.objects.filter(pk=category_id).first()
+    if category is None:
+        return None
+    data = read_source(category)
+    if data is None:
+        return None
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    if digest == category.img_hash and category.img_widths and not force:
+        return category.img_widths
+    widths = make_variants(data, digest)
+    # Matched on the image name so a newer upload is not given these copies
+    if Category.objects.filter(pk=category_id, img=category.img.name).update(img_hash=digest, img_widths=widths):
+        category_registry.invalidate()
+    return widths
+
+
+def _build_in_worker(category_id, force):
+    try:
+        return build_variants(category_id, force)
+    finally:
+        connection.close()
+
+
+def _finished(future):
+    _pending.discard(future)
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Building image variants failed", exc_info=future.exception())
+
+
+def schedule_variants(category_id, force=False):
+    """
+        Build a category's image variants in the worker pool and return the
+        Future of build_variants(). With POLLS_IMAGE_WORKERS = 0 they are
+        built right away in the calling thread.
+    """
+    global _executor
+    if not settings.POLLS_IMAGE_WORKERS:
+        future = Future()
+        try:
+            future.set_result(build_variants(category_id, force))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.POLLS_IMAGE_WORKERS, thread_name_prefix="polls-images")
+        future = _executor.submit(_build_in_worker, category_id, force)
+        _pending.add(future)
+    future.add_done_callback(_finished)
+    return future
+
+
+def wait_for_variants(timeout=None):
+    """Wait until the variants scheduled so far are built"""
+    wait(list(_pending), timeout)
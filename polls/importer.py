@@ -0,0 +1,194 @@
+import json
+from collections import Counter
+from dataclasses import dataclass
+from datetime import timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .locking import lock_for_writing
+from .models import Question, Choice, Vote, Category, Checkpoint
+from .stats import add_to_category_stats
+
+
+class PollImportError(Exception):
+    """ malformed line in an import file """
+
+
+@dataclass
+class ImportProgress:
+    offset: int = 0
+    lines: int = 0
+    polls: int = 0
+    votes: int = 0
+
+
+def _timestamp(value, default):
+    if not value:
+        return default
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, dt_timezone.utc)
+
+
+class PollImporter:
+    """
+        Bulk loader for polls exported from another system.
+
+        The input is JSON lines, one poll per line:
+
+            {"question_text": "...", "pub_date": "2020-01-01T10:00:00Z",
+             "category": "Games", "created_by": "kirill",
+             "choices": [{"choice_text": "Yes",
+                          "votes": ["bob", {"user": "ann", "voted_at": "..."}]}]}
+
+        Users and categories are resolved through in-memory name -> id maps,
+        creating the missing ones. Rows are written with bulk_create, one
+        transaction per batch of at most `batch_size` polls or `max_votes`
+        votes. Each transaction also recounts the votes of its polls in one
+        aggregate UPDATE and saves the byte offset reached in a Checkpoint, so
+        an interrupted import resumes after the last committed batch.
+    """
+
+    def __init__(self, path, batch_size=500, max_votes=50_000):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_votes = max_votes
+        self.checkpoint_name = f"import_polls:{path}"
+        self.categories = dict(Category.objects.values_list("category_name", "pk"))
+        self.users = dict(User.objects.values_list("username", "pk").iterator())
+
+    def resume_offset(self):
+        checkpoint = Checkpoint.objects.filter(name=self.checkpoint_name).first()
+        return checkpoint.offset if checkpoint else 0
+
+    def reset(self):
+        Checkpoint.objects.filter(name=self.checkpoint_name).delete()
+
+    def run(self, progress=None):
+        """Import the file from the last checkpoint, calling `progress` after every batch"""
+        state = ImportProgress(offset=self.resume_offset())
+        batch = []
+        batch_votes = 0
+        with open(self.path, "rb") as source:
+            source.seek(state.offset)
+            for line in source:
+                state.lines += 1
+                if not line.strip():
+                    state.offset += len(line)
+                    continue
+                try:
+                    poll = json.loads(line)
+                except ValueError as error:
+                    raise PollImportError(f"Line at byte {state.offset}: {error}")
+                batch.append(poll)
+                batch_votes += sum(len(choice.get("votes", ())) for choice in poll.get("choices", ()))
+                state.offset += len(line)
+                if len(batch) >= self.batch_size or batch_votes >= self.max_votes:
+                    self._flush(batch, state)
+                    batch, batch_votes = [], 0
+                    if progress:
+                        progress(state)
+        if batch:
+            self._flush(batch, state)
+        if progress:
+            progress(state)
+        return state
+
+    def _category_id(self, name):
+        if name not in self.categories:
+            self.categories[name] = Category.objects.get_or_create(category_name=name)[0].pk
+        return self.categories[name]
+
+    def _create_missing_users(self, usernames):
+        missing = sorted(set(usernames) - self.users.keys())
+        if not missing:
+            return
+        # Imported voters cannot log in until they reset their password
+        password = make_password(None)
+        User.objects.bulk_create(
+            (User(username=username, password=password) for username in missing), batch_size=1000
+        )
+        self.users.update(User.objects.filter(username__in=missing).values_list("username", "pk"))
+
+    def _flush(self, polls, state):
+        now = timezone.now()
+        try:
+            usernames = [poll["created_by"] for poll in polls]
+            for poll in polls:
+                for choice in poll.get("choices", ()):
+                    usernames.extend(
+                        vote["user"] if isinstance(vote, dict) else vote for vote in choice.get("votes", ())
+                    )
+            with transaction.atomic():
+                lock_for_writing()
+                self._create_missing_users(usernames)
+                questions = Question.objects.bulk_create([
+                    Question(
+                        question_text=poll["question_text"],
+                        pub_date=_timestamp(poll.get("pub_date"), now),
+                        category_id=self._category_id(poll["category"]),
+                        created_by_id=self.users[poll["created_by"]],
+                    )
+                    for poll in polls
+                ])
+                choices = Choice.objects.bulk_create([
+                    Choice(question_id=question.pk, choice_text=choice["choice_text"])
+                    for question, poll in zip(questions, polls)
+                    for choice in poll.get("choices", ())
+                ])
+
+                votes = []
+                choice_rows = iter(choices)
+                for question, poll in zip(questions, polls):
+                    voters = set()
+                    for choice in poll.get("choices", ()):
+                        choice_id = next(choice_rows).pk
+                        for vote in choice.get("votes", ()):
+                            username, voted_at = (vote["user"], vote.get("voted_at")) if isinstance(vote, dict) \
+                                else (vote, None)
+                            voter = self.users[username]
+                            # One vote per user and poll, as in the live site
+                            if voter in voters:
+                                continue
+                            voters.add(voter)
+                            votes.append(Vote(
+                                question_id=question.pk, voted_on_id=choice_id, voted_by_id=voter,
+                                voted_at=_timestamp(voted_at, now),
+                            ))
+                Vote.objects.bulk_create(votes, batch_size=5000)
+                recount_votes([question.pk for question in questions])
+                categories = {question.pk: question.category_id for question in questions}
+                per_category = Counter(question.category_id for question in questions)
+                votes_per_category = Counter(categories[vote.question_id] for vote in votes)
+                for category_id, count in per_category.items():
+                    add_to_category_stats(category_id, polls=count, votes=votes_per_category[category_id])
+
+                Checkpoint.objects.update_or_create(
+                    name=self.checkpoint_name, defaults={"offset": state.offset}
+                )
+        except (KeyError, TypeError, ValueError) as error:
+            raise PollImportError(f"Batch ending at byte {state.offset}: bad or missing value {error}")
+        state.polls += len(questions)
+        state.votes += len(votes)
+
+
+def recount_votes(question_ids):
+    """Set Choice.votes and Question.total_votes from the Vote rows, one UPDATE each"""
+    def count(**outer):
+        return Coalesce(Subquery(
+            Vote.objects.filter(**outer)
+            .order_by()
+            .values(*outer)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ), 0)
+
+    Choice.objects.filter(question_id__in=question_ids).update(votes=count(voted_on=OuterRef("pk")))
+    Question.objects.filter(pk__in=question_ids).update(total_votes=count(question=OuterRef("pk")))
@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+
+from .locking import lock_for_writing
+from .models import Question, Choice, Vote, Checkpoint
+from .signals import invalidate_question
+from .stats import add_votes_by_question
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = "vote_journal"
+RECORD_FIELDS = ("q", "c", "u", "t")
+
+
+class VoteJournal:
+    """
+        Append-only file of votes waiting to be written to the database.
+
+        Every vote is one JSON line. append() only returns once the line has
+        been fsync'd, but writers share fsyncs: the first writer of a group
+        waits `commit_delay` seconds for others to join and then syncs all of
+        their lines at once.
+    """
+
+    def __init__(self, path, commit_delay=0.002):
+        self.path = str(path)
+        self.commit_delay = commit_delay
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # A crash in the middle of append() leaves a last line without its
+        # newline. End it, so the next record starts a line of its own and
+        # only the torn one is lost.
+        size = os.fstat(self._fd).st_size
+        if size:
+            with open(self.path, "rb") as journal:
+                journal.seek(size - 1)
+                if journal.read(1) != b"\n":
+                    os.write(self._fd, b"\n")
+        self._cond = threading.Condition()
+        self._written = 0
+        self._synced = 0
+        self._syncing = False
+
+    def append(self, question_id, choice_id, user_id):
+        line = json.dumps(
+            {"q": question_id, "c": choice_id, "u": user_id, "t": time.time()}, separators=(",", ":")
+        ) + "\n"
+        with self._cond:
+            os.write(self._fd, line.encode())
+            self._written += len(line)
+            end = self._written
+        self._wait_durable(end)
+
+    def _wait_durable(self, end):
+        with self._cond:
+            while self._synced < end:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+                self._syncing = True
+                self._cond.release()
+                try:
+                    time.sleep(self.commit_delay)
+                    target = self._written
+                    os.fsync(self._fd)
+                finally:
+                    self._cond.acquire()
+                    self._syncing = False
+                    self._cond.notify_all()
+                self._synced = max(self._synced, target)
+
+    def close(self):
+        os.close(self._fd)
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    global _journal
+    with _journal_lock:
+        if _journal is None or _journal.path != str(settings.VOTE_JOURNAL_PATH):
+            _journal = VoteJournal(settings.VOTE_JOURNAL_PATH, settings.VOTE_JOURNAL_COMMIT_DELAY)
+        return _journal
+
+
+def _decode(line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or any(name not in record for name in RECORD_FIELDS):
+        return None
+    return record
+
+
+def read_records(path, offset, limit):
+    """
+        Read up to `limit` complete lines starting at byte `offset` and return
+        their records, the offset just past the last line and the number of
+        lines read. A torn line at the end of the file, left by a crash in
+        the middle of a write, is not read. Complete lines that are not a
+        record, such as a torn line that a later write was appended to, are
+        logged and skipped, so they cannot stall the applier.
+    """
+    records = []
+    lines = 0
+    try:
+        with open(path, "rb") as journal:
+            journal.seek(offset)
+            for line in journal:
+                if not line.endswith(b"\n") or lines == limit:
+                    break
+                record = _decode(line)
+                if record is None:
+                    logger.warning("Skipping an unreadable vote journal line at byte %d: %r", offset, line[:200])
+                else:
+                    records.append(record)
+                offset += len(line)
+                lines += 1
+    except FileNotFoundError:
+        pass
+    return records, offset, lines
+
+
+def apply_journal(batch_size=5000):
+    """
+        Write the next `batch_size` journalled votes to the database.
+
+        Votes are bulk inserted and the counters get one aggregated UPDATE per
+        choice and per question. The new journal offset is saved in the same
+        transaction, so after a crash the applier resumes exactly where the
+        last committed batch ended. Returns the number of journal lines
+        consumed, unreadable ones included.
+    """
+    with transaction.atomic():
+        # select_for_update() is a no-op on SQLite, so take its write lock
+        # before reading the checkpoint
+        lock_for_writing()
+        checkpoint, _ = Checkpoint.objects.select_for_update().get_or_create(name=CHECKPOINT_NAME)
+        records, offset, lines = read_records(settings.VOTE_JOURNAL_PATH, checkpoint.offset, batch_size)
+        if not lines:
+            return 0
+
+        choices = dict(
+            Choice.objects.filter(pk__in={record["c"] for record in records}).values_list("pk", "question_id")
+        )
+        users = set(User.objects.filter(pk__in={record["u"] for record in records}).values_list("pk", flat=True))
+        seen = set(
+            Vote.objects.filter(
+                question_id__in={record["q"] for record in records}, voted_by_id__in=users
+            ).values_list("question_id", "voted_by_id")
+        )
+        votes = []
+        for record in records:
+            key = (record["q"], record["u"])
+            # Skip repeated votes and votes for polls or users deleted since
+            if key in seen or choices.get(record["c"]) != record["q"] or record["u"] not in users:
+                continue
+            seen.add(key)
+            votes.append(Vote(
+                question_id=record["q"],
+                voted_on_id=record["c"],
+                voted_by_id=record["u"],
+                voted_at=datetime.fromtimestamp(record["t"], tz=timezone.utc),
+            ))
+        Vote.objects.bulk_create(votes)
+
+        per_choice = Counter(vote.voted_on_id for vote in votes)
+        per_question = Counter(vote.question_id for vote in votes)
+        for choice_id, count in per_choice.items():
+            Choice.objects.filter(pk=choice_id).update(votes=F("votes") + count)
+        for question_id, count in per_question.items():
+            Question.objects.filter(pk=question_id).update(
+                total_votes=F("total_votes") + count, trending_score=F("trending_score") + count
+            )
+            invalidate_question(question_id)
+        add_votes_by_question(per_question)
+
+        checkpoint.offset = offset
+        checkpoint.save(update_fields=["offset", "updated_at"])
+    return lines
+
+
+@dataclass
+class JournalLag:
+    bytes: int
+    seconds: float
+
+
+def journal_lag():
+    """How far the applier is behind: unapplied bytes and the age of the oldest unapplied vote"""
+    checkpoint = Checkpoint.objects.filter(name=CHECKPOINT_NAME).first()
+    offset = checkpoint.offset if checkpoint else 0
+    try:
+        size = os.path.getsize(settings.VOTE_JOURNAL_PATH)
+    except FileNotFoundError:
+        size = 0
+    records, _, _ = read_records(settings.VOTE_JOURNAL_PATH, offset, 1)
+    seconds = time.time() - records[0]["t"] if records else 0.0
+    return JournalLag(bytes=max(size - offset, 0), seconds=seconds)
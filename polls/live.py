@@ -0,0 +1,170 @@
+import asyncio
+import json
+import threading
+import weakref
+from dataclasses import asdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .cache import get_results
+
+
+class LocalBroker:
+    """
+        In-process pub/sub for "the results of a question changed" messages.
+
+        Only reaches listeners in the same process, which is enough for a
+        single ASGI worker and for tests. A broker for several processes
+        (e.g. one on Redis pub/sub) needs the same three methods; it is
+        selected with the POLLS_LIVE_BROKER setting.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def publish(self, question_id):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(question_id)
+
+    def subscribe(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            self._listeners.remove(listener)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.POLLS_LIVE_BROKER)()
+        return _broker
+
+
+def results_changed(question_id):
+    """Tell live subscribers that the question's counts changed; call after the change is committed"""
+    get_broker().publish(question_id)
+
+
+def results_payload(results):
+    return {
+        "id": results.id,
+        "total_votes": sum(choice.vote_count for choice in results.choices),
+        "choices": [asdict(choice) for choice in results.choices],
+    }
+
+
+class Broadcaster:
+    """
+        Fans results updates out to the live subscribers of one event loop.
+
+        A change notification only marks the question as changed. The first
+        one schedules a flush `interval` seconds later, and later ones until
+        then are absorbed by it, so a poll sends at most one update per
+        interval however many votes arrive. A flush loads the results once
+        and hands the same payload to every subscriber of the poll. Each
+        subscriber queue keeps only the latest update, so a slow client skips
+        intermediate counts instead of building a backlog.
+    """
+
+    def __init__(self, loop, broker, interval):
+        self.loop = loop
+        self.broker = broker
+        self.interval = interval
+        self._subscribers = {}
+        self._pending = set()
+        self._subscribed = False
+
+    def _notify(self, question_id):
+        # Called by the broker from whichever thread committed the change
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._changed, question_id)
+
+    def _changed(self, question_id):
+        if question_id not in self._subscribers or question_id in self._pending:
+            return
+        self._pending.add(question_id)
+        self.loop.call_later(self.interval, lambda: self.loop.create_task(self._flush(question_id)))
+
+    async def _flush(self, question_id):
+        self._pending.discard(question_id)
+        queues = self._subscribers.get(question_id)
+        if not queues:
+            return
+        results = await sync_to_async(get_results)(question_id)
+        payload = results_payload(results) if results is not None else None
+        for queue in list(queues):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(payload)
+
+    def subscribe(self, question_id):
+        if not self._subscribed:
+            self.broker.subscribe(self._notify)
+            self._subscribed = True
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(question_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, question_id, queue):
+        queues = self._subscribers.get(question_id, set())
+        queues.discard(queue)
+        if not queues:
+            self._subscribers.pop(question_id, None)
+        if not self._subscribers and self._subscribed:
+            self.broker.unsubscribe(self._notify)
+            self._subscribed = False
+
+    def subscriber_count(self, question_id):
+        return len(self._subscribers.get(question_id, ()))
+
+
+_broadcasters = weakref.WeakKeyDictionary()
+
+
+def get_broadcaster():
+    """The Broadcaster of the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _broadcasters:
+        _broadcasters[loop] = Broadcaster(loop, get_broker(), settings.POLLS_LIVE_INTERVAL)
+    return _broadcasters[loop]
+
+
+def sse_event(payload):
+    return f"event: results\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+
+async def results_events(question_id, first, keepalive=None):
+    """
+        Server-Sent Events for one subscriber: the current results `first`,
+        then every coalesced update, with a comment line every `keepalive`
+        seconds of silence so proxies keep the connection open.
+    """
+    keepalive = settings.POLLS_LIVE_KEEPALIVE if keepalive is None else keepalive
+    broadcaster = get_broadcaster()
+    queue = broadcaster.subscribe(question_id)
+    try:
+        yield sse_event(results_payload(first))
+        while True:
+            try:
+                payload = await asyncio.wait_for(queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if payload is None:
+                # The question was deleted
+                return
+            yield sse_event(payload)
+    finally:
+        broadcaster.unsubscribe(question_id, queue)
@@ -0,0 +1,24 @@
+from django.db import OperationalError, connection
+
+from .models import Checkpoint
+
+
+def lock_for_writing():
+    """
+        Take SQLite's write lock at the start of the current transaction.
+
+        A transaction that reads first and writes later has to upgrade its
+        lock, and SQLite fails that upgrade at once with "database is locked"
+        when another writer holds it, without waiting out the busy timeout.
+        Writing first makes concurrent writers queue on the lock instead.
+        The UPDATE matches no rows, so it changes nothing.
+    """
+    if connection.vendor == "sqlite":
+        table, pk = Checkpoint._meta.db_table, Checkpoint._meta.pk.column
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE "{table}" SET "{pk}" = "{pk}" WHERE 0')
+
+
+def database_locked(error):
+    """Whether `error` is SQLite giving up on its lock after the busy timeout"""
+    return isinstance(error, OperationalError) and "database is locked" in str(error)
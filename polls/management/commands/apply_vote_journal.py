@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+
+from polls.journal import apply_journal, journal_lag
+from polls.locking import database_locked
+
+
+class Command(BaseCommand):
+    help = "Apply journalled votes to the database, continuously or until the journal is drained"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--drain", action="store_true", help="Exit once every journalled vote is applied")
+        parser.add_argument("--interval", type=float, default=0.5, help="Seconds to sleep when caught up")
+
+    def handle(self, *args, **options):
+        applied = 0
+        while True:
+            try:
+                count = apply_journal(options["batch_size"])
+            except OperationalError as error:
+                # Writers held the lock past the busy timeout; the batch was
+                # rolled back, so it is simply tried again
+                if not database_locked(error):
+                    raise
+                self.stderr.write("Database locked, retrying")
+                time.sleep(options["interval"])
+                continue
+            applied += count
+            if count:
+                continue
+            lag = journal_lag()
+            self.stdout.write(f"Applied {applied} votes, lag {lag.bytes} bytes / {lag.seconds:.1f}s")
+            if options["drain"]:
+                return
+            applied = 0
+            time.sleep(options["interval"])
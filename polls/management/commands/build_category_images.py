@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from polls.images import schedule_variants, wait_for_variants
+from polls.models import Category
+
+
+class Command(BaseCommand):
+    help = "Build the resized WebP and JPEG copies of category images that do not have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Rebuild the copies of every category image")
+
+    def handle(self, *args, **options):
+        categories = Category.objects.exclude(img="").exclude(img=None).order_by("pk")
+        if not options["force"]:
+            categories = categories.filter(img_hash="")
+        futures = [(category, schedule_variants(category.pk, force=options["force"])) for category in categories]
+        wait_for_variants()
+        built = 0
+        for category, future in futures:
+            try:
+                widths = future.result()
+            except Exception as error:
+                self.stderr.write(f"{category.category_name}: {error}")
+                continue
+            if widths is None:
+                self.stderr.write(f"{category.category_name}: image {category.img.name} not found")
+            else:
+                built += 1
+                self.stdout.write(f"{category.category_name}: {', '.join(map(str, widths))}")
+        self.stdout.write(f"Built images of {built} categories")
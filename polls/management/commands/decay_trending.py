@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+
+from polls.locking import database_locked
+from polls.trending import decay_trending_scores
+
+
+class Command(BaseCommand):
+    help = "Decay the trending scores of the polls for the time since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, help="Keep running, decaying every INTERVAL seconds, instead of once"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                decayed = decay_trending_scores()
+            except OperationalError as error:
+                # Writers held the lock past the busy timeout; the decay was
+                # rolled back, so the next run covers its time too
+                if not (options["interval"] and database_locked(error)):
+                    raise
+                self.stderr.write("Database locked, retrying")
+            else:
+                self.stdout.write(f"Decayed {decayed} trending scores")
+                if not options["interval"]:
+                    return
+            time.sleep(options["interval"])
@@ -0,0 +1,35 @@
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.export import EXPORTS, FORMATS, ExportError, export_lines, parse_since
+
+
+class Command(BaseCommand):
+    help = "Stream questions, choices and votes as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--kind", action="append", choices=sorted(EXPORTS),
+            help="What to export; repeat for several kinds (NDJSON only). Defaults to everything.",
+        )
+        parser.add_argument("--format", default="ndjson", choices=sorted(FORMATS))
+        parser.add_argument("--since-id", type=int, help="Only rows with a greater id")
+        parser.add_argument("--since", help="Only rows at or after this ISO 8601 timestamp")
+        parser.add_argument("--output", help="File to write to instead of stdout")
+
+    def handle(self, *args, **options):
+        kinds = options["kind"] or list(EXPORTS)
+        try:
+            lines = export_lines(
+                kinds, options["format"], since_id=options["since_id"], since=parse_since(options["since"])
+            )
+        except ExportError as error:
+            raise CommandError(error)
+
+        output = open(options["output"], "w", newline="") if options["output"] else self.stdout
+        try:
+            for line in lines:
+                output.write(line)
+        finally:
+            if output is not self.stdout:
+                output.close()
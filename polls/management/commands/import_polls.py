@@ -0,0 +1,43 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.importer import PollImporter, PollImportError
+
+
+class Command(BaseCommand):
+    help = "Bulk import polls and their votes from a JSON lines file, resuming after the last committed batch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=500, help="Polls per transaction")
+        parser.add_argument("--max-votes", type=int, default=50_000, help="Votes per transaction")
+        parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint and start over")
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options["path"])
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        size = os.path.getsize(path)
+        importer = PollImporter(path, options["batch_size"], options["max_votes"])
+        if options["restart"]:
+            importer.reset()
+        start_offset = importer.resume_offset()
+        if start_offset:
+            self.stdout.write(f"Resuming at byte {start_offset} of {size}")
+        started = time.perf_counter()
+
+        def progress(state):
+            elapsed = time.perf_counter() - started or 1e-9
+            done = state.offset / size * 100 if size else 100
+            self.stdout.write(
+                f"{done:5.1f}%  {state.polls} polls, {state.votes} votes  "
+                f"({state.polls / elapsed:,.0f} polls/s, {state.votes / elapsed:,.0f} votes/s)"
+            )
+
+        try:
+            state = importer.run(progress)
+        except PollImportError as error:
+            raise CommandError(f"{error}. Fix the input and run the command again to resume.")
+        self.stdout.write(f"Imported {state.polls} polls and {state.votes} votes")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from polls.stats import rebuild_category_stats
+
+
+class Command(BaseCommand):
+    help = "Recount the poll and vote counts of every category and report how far they had drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report the drift, change nothing")
+
+    def handle(self, *args, **options):
+        drift = rebuild_category_stats(dry_run=options["dry_run"])
+        for category, stored, counted in drift:
+            before = f"{stored[0]} polls, {stored[1]} votes" if stored else "missing"
+            self.stdout.write(f"{category.category_name}: {before} -> {counted[0]} polls, {counted[1]} votes")
+        action = "found" if options["dry_run"] else "repaired"
+        self.stdout.write(f"{len(drift)} categories {action} with drifted stats")
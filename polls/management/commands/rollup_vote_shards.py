@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from polls.voting import roll_up_vote_shards
+
+
+class Command(BaseCommand):
+    help = "Fold sharded vote counters into Choice.votes and Question.total_votes"
+
+    def handle(self, *args, **options):
+        moved = roll_up_vote_shards()
+        self.stdout.write(f"Rolled up {moved} votes")
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:03
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_votes(apps, schema_editor):
+    Question = apps.get_model("polls", "Question")
+    Vote = apps.get_model("polls", "Vote")
+    votes = (
+        Vote.objects.filter(question=OuterRef("pk"))
+        .order_by()
+        .values("question")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    Question.objects.update(total_votes=Coalesce(Subquery(votes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_category_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='total_votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing_votes, migrations.RunPython.noop),
+    ]
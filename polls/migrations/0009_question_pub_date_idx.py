@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_question_total_votes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['pub_date', 'id'], name='question_pub_date_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:05
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    """Keep each user's first vote per question and recount the affected polls."""
+    Choice = apps.get_model("polls", "Choice")
+    Question = apps.get_model("polls", "Question")
+    Vote = apps.get_model("polls", "Vote")
+
+    duplicates = (
+        Vote.objects.order_by()
+        .values("question", "voted_by")
+        .annotate(count=Count("pk"), first=Min("pk"))
+        .filter(count__gt=1)
+    )
+    affected = set()
+    for group in duplicates:
+        Vote.objects.filter(question=group["question"], voted_by=group["voted_by"]).exclude(
+            pk=group["first"]
+        ).delete()
+        affected.add(group["question"])
+    if not affected:
+        return
+
+    def count_votes(**outer):
+        return Coalesce(Subquery(
+            Vote.objects.filter(**outer)
+            .order_by()
+            .values(*outer)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ), 0)
+
+    Choice.objects.filter(question__in=affected).update(votes=count_votes(voted_on=OuterRef("pk")))
+    Question.objects.filter(pk__in=affected).update(total_votes=count_votes(question=OuterRef("pk")))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_question_pub_date_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('question', 'voted_by'), name='one_vote_per_user'),
+        ),
+    ]
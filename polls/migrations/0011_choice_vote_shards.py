@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:07
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0010_vote_one_vote_per_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='vote_shards',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Counter rows per choice. Use more than one for very popular polls.', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.CreateModel(
+            name='ChoiceVoteShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('votes', models.IntegerField(default=0)),
+                ('choice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_shards', to='polls.choice')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='choicevoteshard',
+            constraint=models.UniqueConstraint(fields=('choice', 'shard'), name='one_row_per_shard'),
+        ),
+    ]
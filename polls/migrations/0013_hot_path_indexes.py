@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0012_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['category', 'pub_date', 'id'], name='question_category_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['voted_by', 'question'], name='vote_voted_by_question_idx'),
+        ),
+    ]
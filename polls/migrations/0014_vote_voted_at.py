@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0013_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='voted_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,85 @@
+from django.db import migrations
+
+# One row per question, with the question's id as rowid. Triggers keep it in
+# sync with every write, including bulk_create and raw SQL, which signals
+# would miss.
+CREATE = [
+    """
+    CREATE VIRTUAL TABLE polls_question_search USING fts5(
+        question_text, choices, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER polls_question_search_insert AFTER INSERT ON polls_question BEGIN
+        INSERT INTO polls_question_search (rowid, question_text, choices) VALUES (new.id, new.question_text, '');
+    END
+    """,
+    """
+    CREATE TRIGGER polls_question_search_update AFTER UPDATE OF question_text ON polls_question BEGIN
+        UPDATE polls_question_search SET question_text = new.question_text WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER polls_question_search_delete AFTER DELETE ON polls_question BEGIN
+        DELETE FROM polls_question_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER polls_choice_search_insert AFTER INSERT ON polls_choice BEGIN
+        UPDATE polls_question_search SET choices = (
+            SELECT group_concat(choice_text, ' ') FROM polls_choice WHERE question_id = new.question_id
+        ) WHERE rowid = new.question_id;
+    END
+    """,
+    """
+    CREATE TRIGGER polls_choice_search_update AFTER UPDATE OF choice_text, question_id ON polls_choice BEGIN
+        UPDATE polls_question_search SET choices = (
+            SELECT group_concat(choice_text, ' ') FROM polls_choice WHERE question_id = polls_question_search.rowid
+        ) WHERE rowid IN (old.question_id, new.question_id);
+    END
+    """,
+    """
+    CREATE TRIGGER polls_choice_search_delete AFTER DELETE ON polls_choice BEGIN
+        UPDATE polls_question_search SET choices = coalesce((
+            SELECT group_concat(choice_text, ' ') FROM polls_choice WHERE question_id = old.question_id
+        ), '') WHERE rowid = old.question_id;
+    END
+    """,
+    """
+    INSERT INTO polls_question_search (rowid, question_text, choices)
+    SELECT q.id, q.question_text, coalesce((
+        SELECT group_concat(c.choice_text, ' ') FROM polls_choice c WHERE c.question_id = q.id
+    ), '')
+    FROM polls_question q
+    """,
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS polls_question_search_insert",
+    "DROP TRIGGER IF EXISTS polls_question_search_update",
+    "DROP TRIGGER IF EXISTS polls_question_search_delete",
+    "DROP TRIGGER IF EXISTS polls_choice_search_insert",
+    "DROP TRIGGER IF EXISTS polls_choice_search_update",
+    "DROP TRIGGER IF EXISTS polls_choice_search_delete",
+    "DROP TABLE IF EXISTS polls_question_search",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # FTS5 is SQLite only; polls.search falls back to LIKE elsewhere
+        if schema_editor.connection.vendor == "sqlite":
+            for statement in statements:
+                schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0014_vote_voted_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0015_question_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['trending_score', 'id'], name='question_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['category', 'trending_score', 'id'], name='question_category_trending_idx'),
+        ),
+    ]
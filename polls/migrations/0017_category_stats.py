@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:44
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def count_existing_polls(apps, schema_editor):
+    Category = apps.get_model("polls", "Category")
+    CategoryStats = apps.get_model("polls", "CategoryStats")
+    CategoryStats.objects.bulk_create(
+        CategoryStats(category_id=category.pk, polls=category.polls, votes=category.votes or 0)
+        for category in Category.objects.annotate(polls=Count("question"), votes=Sum("question__total_votes"))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0016_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='polls.category')),
+                ('polls', models.IntegerField(default=0)),
+                ('votes', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_existing_polls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0017_category_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='img_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='img_widths',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
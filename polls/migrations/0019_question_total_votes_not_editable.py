@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0018_category_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='question',
+            name='total_votes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
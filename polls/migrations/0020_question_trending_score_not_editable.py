@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0019_question_total_votes_not_editable'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='question',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.contrib.auth.models import User
+from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib import admin
 from django.utils import timezone
 
@@ -9,21 +12,91 @@ from django.utils import timezone
 class Category(models.Model):
     category_name = models.CharField("category", max_length=30, unique=True)
     img = models.ImageField(upload_to="polls/images", default=None, null=True)
+    # Content hash of `img` and widths of its resized copies, set once they
+    # are built (see polls.images)
+    img_hash = models.CharField(max_length=16, blank=True, editable=False)
+    img_widths = models.JSONField(default=list, blank=True, editable=False)
     pub_date = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.category_name
 
 
+class CategoryStats(models.Model):
+    """
+        Poll and vote counts of a category, kept up to date as polls are
+        created and deleted and as votes are counted (see polls.stats).
+        `votes` follows Question.total_votes, so votes of sharded polls show
+        up once they are rolled up.
+    """
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    polls = models.IntegerField(default=0)
+    votes = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.category_id}: {self.polls} polls, {self.votes} votes"
+
+
 class Question(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     question_text = models.CharField(max_length=201)
     pub_date = models.DateTimeField("date published")
+    # Only ever incremented in SQL, see save()
+    total_votes = models.PositiveIntegerField(default=0, editable=False)
+    # Votes decayed by age, see polls.trending; only ever updated in SQL
+    trending_score = models.FloatField(default=0, editable=False)
+    vote_shards = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        help_text="Counter rows per choice. Use more than one for very popular polls.",
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["pub_date", "id"], name="question_pub_date_idx"),
+            models.Index(fields=["category", "pub_date", "id"], name="question_category_pub_date_idx"),
+            models.Index(fields=["trending_score", "id"], name="question_trending_idx"),
+            models.Index(fields=["category", "trending_score", "id"], name="question_category_trending_idx"),
+        ]
+
+    # Kept up to date with F() increments, so a full save of an instance
+    # loaded earlier would write back stale counts
+    COUNTER_FIELDS = ("total_votes", "trending_score")
 
     def __str__(self) -> str:
         return self.question_text
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get("force_insert") and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so moving a poll to another category can move its stats
+        instance._loaded_category_id = instance.__dict__.get("category_id")
+        return instance
+
+    def choices_with_votes(self):
+        """Choices annotated with `vote_count`, including votes not yet rolled up from shards"""
+        # A correlated subquery rather than a join, so no GROUP BY (and no
+        # temporary sort) is needed
+        shard_votes = (
+            ChoiceVoteShard.objects.filter(choice=OuterRef("pk"))
+            .order_by()
+            .values("choice")
+            .annotate(total=Sum("votes"))
+            .values("total")
+        )
+        return self.choice_set.annotate(
+            vote_count=F("votes") + Coalesce(Subquery(shard_votes), 0)
+        ).order_by("pk")
+
     @admin.display(
         boolean=True,
         ordering="pub_date",
@@ -43,8 +116,37 @@ class Choice(models.Model):
         return self.choice_text
 
 
+class ChoiceVoteShard(models.Model):
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE, related_name="vote_shards")
+    shard = models.PositiveSmallIntegerField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["choice", "shard"], name="one_row_per_shard"),
+        ]
+
+
 class Vote(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     voted_on = models.ForeignKey(Choice, on_delete=models.CASCADE)
     voted_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    voted_at = models.DateTimeField(default=timezone.now, db_index=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["question", "voted_by"], name="one_vote_per_user"),
+        ]
+        indexes = [
+            models.Index(fields=["voted_by", "question"], name="vote_voted_by_question_idx"),
+        ]
+
+
+class Checkpoint(models.Model):
+    """Progress marker of a resumable background job, e.g. the vote journal applier"""
+    name = models.CharField(max_length=200, unique=True)
+    offset = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}@{self.offset}"
@@ -0,0 +1,110 @@
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+class InvalidCursor(Exception):
+    """ cursor token could not be decoded """
+
+
+def encode_cursor(pub_date, pk, direction):
+    raw = json.dumps([pub_date.isoformat(), pk, direction], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        pub_date, pk, direction = json.loads(raw)
+        pub_date = datetime.fromisoformat(pub_date)
+    except (ValueError, TypeError):
+        raise InvalidCursor(token)
+    # Cursors come back from the client, so anything encode_cursor() would
+    # not have produced is refused rather than reaching the query
+    if timezone.is_naive(pub_date) or type(pk) is not int or direction not in ("next", "prev"):
+        raise InvalidCursor(token)
+    return pub_date, pk, direction
+
+
+@dataclass
+class KeysetPage:
+    object_list: list = field(default_factory=list)
+    next_cursor: str = None
+    previous_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def paginate_by_pub_date(queryset, cursor=None, page_size=20, now=None):
+    """
+        Return one page of the questions of `queryset` published by `now`,
+        newest first on (pub_date, id).
+
+        Pages are located by seeking past the (pub_date, id) of the edge row of
+        the neighbouring page instead of using OFFSET, so every page costs a
+        single indexed range scan of `page_size + 1` rows however deep it is.
+    """
+    rows, direction = _page_query(queryset, cursor, page_size, now)
+    return _page(list(rows), direction, cursor, page_size)
+
+
+async def apaginate_by_pub_date(queryset, cursor=None, page_size=20, now=None):
+    """paginate_by_pub_date() for async views"""
+    rows, direction = _page_query(queryset, cursor, page_size, now)
+    return _page([row async for row in rows], direction, cursor, page_size)
+
+
+def _page_query(queryset, cursor, page_size, now):
+    now = now or timezone.now()
+    direction = "next"
+    if not cursor:
+        queryset = queryset.filter(pub_date__lte=now)
+    else:
+        pub_date, pk, direction = decode_cursor(cursor)
+        # Only one upper bound on pub_date can drive the index range, so the
+        # publication cut-off and the cursor are folded into a single one.
+        if direction == "prev":
+            queryset = queryset.filter(
+                Q(pub_date__gt=pub_date) | Q(pk__gt=pk), pub_date__gte=pub_date, pub_date__lte=now
+            )
+        elif pub_date <= now:
+            queryset = queryset.filter(Q(pub_date__lt=pub_date) | Q(pk__lt=pk), pub_date__lte=pub_date)
+        else:
+            queryset = queryset.filter(pub_date__lte=now)
+
+    if direction == "prev":
+        return queryset.order_by("pub_date", "pk")[:page_size + 1], direction
+    return queryset.order_by("-pub_date", "-pk")[:page_size + 1], direction
+
+
+def _page(rows, direction, cursor, page_size):
+    has_more = len(rows) > page_size
+    if direction == "prev":
+        rows = rows[:page_size][::-1]
+        has_next, has_previous = True, has_more
+    else:
+        rows = rows[:page_size]
+        has_next, has_previous = has_more, cursor is not None
+
+    page = KeysetPage(object_list=rows)
+    if rows and has_next:
+        page.next_cursor = encode_cursor(rows[-1].pub_date, rows[-1].pk, "next")
+    if rows and has_previous:
+        page.previous_cursor = encode_cursor(rows[0].pub_date, rows[0].pk, "prev")
+    return page
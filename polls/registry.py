@@ -0,0 +1,80 @@
+import threading
+import time
+
+from django.core.cache import cache
+
+from .models import Category
+
+VERSION_KEY = "polls:categories:version"
+
+
+class CategoryRegistry:
+    """
+        In-process copy of the Category table.
+
+        Categories are loaded once per worker and kept until a Category is
+        saved or deleted. The signal handlers bump a version number in the
+        shared cache, and every worker compares it with the version it loaded,
+        so changes made in one process are picked up by all of them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._categories = []
+        self._by_name = {}
+
+    def _shared_version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, time.time_ns(), None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    async def _ashared_version(self):
+        version = await cache.aget(VERSION_KEY)
+        if version is None:
+            await cache.aadd(VERSION_KEY, time.time_ns(), None)
+            version = await cache.aget(VERSION_KEY)
+        return version
+
+    def _ensure_loaded(self):
+        version = self._shared_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            self._load(list(Category.objects.order_by("-pub_date")), version)
+
+    async def _aensure_loaded(self):
+        version = await self._ashared_version()
+        if version != self._version:
+            # No lock: two coroutines loading at once just both store the same rows
+            self._load([category async for category in Category.objects.order_by("-pub_date")], version)
+
+    def _load(self, categories, version):
+        self._categories = categories
+        self._by_name = {category.category_name: category for category in categories}
+        self._version = version
+
+    def all(self):
+        """All categories, newest first"""
+        self._ensure_loaded()
+        return list(self._categories)
+
+    def get(self, name):
+        """The category called `name`, or None"""
+        self._ensure_loaded()
+        return self._by_name.get(name)
+
+    async def aget(self, name):
+        """get() for async views"""
+        await self._aensure_loaded()
+        return self._by_name.get(name)
+
+    def invalidate(self):
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+category_registry = CategoryRegistry()
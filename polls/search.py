@@ -0,0 +1,210 @@
+import re
+from dataclasses import dataclass, field
+
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import Question
+
+TABLE = "polls_question_search"
+# bm25 weights of the question_text and choices columns
+WEIGHTS = (2.0, 1.0)
+# Deepest result page served; ranked results cannot seek like the feeds do
+MAX_PAGE = 50
+# Most matches considered per query. Queries matching more than this are
+# served newest first from their newest matches, because scoring every poll
+# that contains a common word costs as much as scanning the table.
+CANDIDATES = 2000
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# The triggers created by migration 0015. Django rebuilds a SQLite table for
+# most schema changes, which drops its triggers, so install_triggers() puts
+# back any missing one after every migrate. They write to the index inside the
+# transaction that changed the poll, so transactions that read before they
+# write polls must take the write lock first (polls.creation.lock_for_writing).
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS polls_question_search_insert AFTER INSERT ON polls_question BEGIN
+        INSERT INTO {TABLE} (rowid, question_text, choices) VALUES (new.id, new.question_text, '');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS polls_question_search_update AFTER UPDATE OF question_text ON polls_question BEGIN
+        UPDATE {TABLE} SET question_text = new.question_text WHERE rowid = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS polls_question_search_delete AFTER DELETE ON polls_question BEGIN
+        DELETE FROM {TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS polls_choice_search_insert AFTER INSERT ON polls_choice BEGIN
+        UPDATE {TABLE} SET choices = (
+            SELECT group_concat(choice_text, ' ') FROM polls_choice WHERE question_id = new.question_id
+        ) WHERE rowid = new.question_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS polls_choice_search_update AFTER UPDATE OF choice_text, question_id ON polls_choice
+    BEGIN
+        UPDATE {TABLE} SET choices = (
+            SELECT group_concat(choice_text, ' ') FROM polls_choice WHERE question_id = {TABLE}.rowid
+        ) WHERE rowid IN (old.question_id, new.question_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS polls_choice_search_delete AFTER DELETE ON polls_choice BEGIN
+        UPDATE {TABLE} SET choices = coalesce((
+            SELECT group_concat(choice_text, ' ') FROM polls_choice WHERE question_id = old.question_id
+        ), '') WHERE rowid = old.question_id;
+    END
+    """,
+]
+
+
+def install_triggers(using="default"):
+    connection = connections[using]
+    if connection.vendor != "sqlite" or TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        for statement in TRIGGERS:
+            cursor.execute(statement)
+
+
+def match_expression(text, prefix=True):
+    """
+        FTS5 query for the words of `text`: all of them must occur, the last
+        one as a prefix if `prefix` is true and it has at least two letters.
+        Returns None when `text` has no words. Words are quoted, so FTS5
+        operators typed by the user are searched as plain text.
+    """
+    words = _WORD.findall(text or "")
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if prefix and len(words[-1]) >= 2:
+        terms[-1] += "*"
+    return " AND ".join(terms)
+
+
+def uses_fts():
+    return connection.vendor == "sqlite"
+
+
+def _fallback_filter(text):
+    query = Q()
+    for word in _WORD.findall(text):
+        query &= Q(question_text__icontains=word) | Q(choice__choice_text__icontains=word)
+    return query
+
+
+def filter_questions(queryset, text):
+    """`queryset` narrowed to the questions matching `text`, in its own order"""
+    expression = match_expression(text)
+    if expression is None:
+        return queryset.none()
+    if not uses_fts():
+        return queryset.filter(_fallback_filter(text)).distinct()
+    return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s", [expression]))
+
+
+@dataclass
+class SearchPage:
+    query: str = ""
+    number: int = 1
+    object_list: list = field(default_factory=list)
+    has_next: bool = False
+
+    @property
+    def has_previous(self):
+        return self.number > 1
+
+    @property
+    def next_page_number(self):
+        return self.number + 1
+
+    @property
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def _fts_ids(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _ranked_ids(text, page_size):
+    """
+        Ids of the questions matching `text`, best first, or newest first when
+        there are more than CANDIDATES of them.
+
+        The exact words are tried first. A prefix match for the last word is
+        only used when they do not fill a page, since FTS5 builds the full
+        list of matches of a prefix before it can return any, which is slow
+        for common words. Likewise bm25 reads the full list of matches of
+        every word, so it is only used when there are few of them; otherwise
+        the newest CANDIDATES matches are read in rowid (question id) order,
+        which stops early.
+    """
+    newest = f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s"
+    expression = match_expression(text, prefix=False)
+    ids = _fts_ids(newest, [expression, CANDIDATES + 1])
+    if len(ids) < page_size and match_expression(text) != expression:
+        expression = match_expression(text)
+        ids = _fts_ids(newest, [expression, CANDIDATES + 1])
+    if len(ids) > CANDIDATES:
+        return ids[:CANDIDATES]
+    return _fts_ids(
+        f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY bm25({TABLE}, %s, %s)",
+        [expression, *WEIGHTS],
+    )
+
+
+def _published(ids, count, now):
+    """The first `count` of `ids` that are published, in order"""
+    published = []
+    start, size = 0, count
+    while len(published) < count and start < len(ids):
+        window = ids[start:start + size]
+        found = set(Question.objects.filter(pk__in=window, pub_date__lte=now).values_list("pk", flat=True))
+        published.extend(pk for pk in window if pk in found)
+        start, size = start + size, size * 2
+    return published[:count]
+
+
+def search(text, page=1, page_size=20, now=None):
+    """
+        One page of the published questions matching `text`, best match
+        first.
+
+        Matching and ranking only touch the FTS index (see _ranked_ids), so
+        the cost depends on how many polls match, capped at CANDIDATES, not
+        on the size of the table. Unpublished questions are then dropped by
+        looking up only as many candidates as the page needs, and the page is
+        fetched by id.
+    """
+    page = min(max(page, 1), MAX_PAGE)
+    result = SearchPage(query=text or "", number=page)
+    if match_expression(text) is None:
+        return result
+    now = now or timezone.now()
+    offset = (page - 1) * page_size
+
+    if uses_fts():
+        ids = _published(_ranked_ids(text, page_size), offset + page_size + 1, now)[offset:]
+    else:
+        ids = list(
+            Question.objects.filter(_fallback_filter(text), pub_date__lte=now).distinct()
+            .order_by("-pub_date", "-pk").values_list("pk", flat=True)[offset:offset + page_size + 1]
+        )
+
+    result.has_next = len(ids) > page_size and page < MAX_PAGE
+    ids = ids[:page_size]
+    questions = Question.objects.select_related("created_by").in_bulk(ids)
+    result.object_list = [questions[pk] for pk in ids if pk in questions]
+    return result
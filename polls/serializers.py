@@ -1,8 +1,61 @@
-from .models import Category
-from rest_framework.serializers import ModelSerializer
+from .models import Category, Question, Choice
+from .creation import MIN_CHOICES, TOO_FEW_CHOICES, create_polls
+from .stats import stats_for
+from rest_framework.serializers import (
+    ModelSerializer, ListSerializer, CharField, SerializerMethodField, ValidationError,
+)
 
 
 class CategorySerializer(ModelSerializer):
+    polls = SerializerMethodField()
+    votes = SerializerMethodField()
+
     class Meta:
         model = Category
-        fields = ['id', 'category_name']
+        fields = ['id', 'category_name', 'polls', 'votes']
+
+    def get_polls(self, category):
+        return stats_for(self.context.get("stats", {}), category).polls
+
+    def get_votes(self, category):
+        return stats_for(self.context.get("stats", {}), category).votes
+
+
+class ChoiceSerializer(ModelSerializer):
+    class Meta:
+        model = Choice
+        fields = ['id', 'choice_text']
+
+
+class PollListSerializer(ListSerializer):
+    def create(self, validated_data):
+        """Create all the polls with create_polls(), so a batch costs a fixed number of queries"""
+        questions = create_polls(self.context["user"], [
+            {
+                "question_text": poll["question_text"],
+                "pub_date": poll.get("pub_date"),
+                "category": poll["category"]["category_name"],
+                "choices": [choice["choice_text"] for choice in poll["choice_set"]],
+            }
+            for poll in validated_data
+        ])
+        created = Question.objects.select_related("category").prefetch_related("choice_set").in_bulk(
+            [question.pk for question in questions]
+        )
+        return [created[question.pk] for question in questions]
+
+
+class PollSerializer(ModelSerializer):
+    category = CharField(source="category.category_name", max_length=30)
+    choices = ChoiceSerializer(source="choice_set", many=True)
+
+    class Meta:
+        model = Question
+        fields = ['id', 'question_text', 'pub_date', 'category', 'choices']
+        extra_kwargs = {'pub_date': {'required': False}}
+        list_serializer_class = PollListSerializer
+
+    def validate_choices(self, value):
+        if len(value) < MIN_CHOICES:
+            raise ValidationError(TOO_FEW_CHOICES)
+        return value
@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+
+from .cache import bump_question_version
+from .live import results_changed
+from .models import Question, Choice, Category, CategoryStats
+from .registry import category_registry
+from .search import install_triggers
+from .stats import add_to_category_stats
+
+
+def invalidate_question(question_id):
+    # Bump right away and again once the transaction commits: a reader that
+    # slips in between would otherwise cache the old rows under the version
+    # the first bump created. Live subscribers are only told after the commit.
+    bump_question_version(question_id)
+    transaction.on_commit(lambda: committed(question_id))
+
+
+def committed(question_id):
+    bump_question_version(question_id)
+    results_changed(question_id)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    invalidate_question(instance.pk)
+
+
+@receiver(post_save, sender=Question)
+def count_saved_question(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    loaded = getattr(instance, "_loaded_category_id", None)
+    if created:
+        add_to_category_stats(instance.category_id, polls=1, votes=instance.total_votes)
+    elif loaded is not None and loaded != instance.category_id:
+        add_to_category_stats(loaded, polls=-1, votes=-instance.total_votes)
+        add_to_category_stats(instance.category_id, polls=1, votes=instance.total_votes)
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(post_delete, sender=Question)
+def count_deleted_question(sender, instance, **kwargs):
+    add_to_category_stats(instance.category_id, polls=-1, votes=-instance.total_votes)
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def choice_changed(sender, instance, **kwargs):
+    invalidate_question(instance.question_id)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, **kwargs):
+    category_registry.invalidate()
+    transaction.on_commit(category_registry.invalidate)
+
+
+@receiver(post_save, sender=Category)
+def create_category_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        CategoryStats.objects.get_or_create(category=instance)
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    if sender.name == "polls":
+        install_triggers(using)
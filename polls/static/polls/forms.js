@@ -2,7 +2,6 @@ let number_of_fields = 1;
 let addButton = document.getElementById("add_choice_button");
 let reduceButton = document.getElementById("reduce_choice_button");
 let form = document.getElementById("new-edit-poll__fields");
-let categories = logMovies();
 
 function get_new_choice_element(){
     let new_element = Object.assign(document.createElement("div"), {class: "new-edit-poll__field"});
@@ -19,31 +18,11 @@ function get_new_choice_element(){
     return new_element;
 }
 
-async function logMovies() {
-  const response = await fetch("http://127.0.0.1:8000/polls/category_list/");
-  return response.json();
-}
-
-
 (function initial_field(){
     for(let i = 0; i < 2; i++){
         form.appendChild(get_new_choice_element());
         number_of_fields += 1;
     }
-
-    //Create array of options to be added
-    //Create and append select list
-    let selectList = document.createElement("select");
-    selectList.id = "mySelect";
-    form.appendChild(selectList);
-
-    //Create and append the options
-    for (let i = 0; i < categories.length; i++) {
-        let option = document.createElement("option");
-        option.value = categories[i];
-        option.text = categories[i];
-        selectList.appendChild(option);
-    }
 }());
 
 addButton.addEventListener('click', () => {
@@ -0,0 +1,37 @@
+let choiceList = document.querySelector("[data-stream]");
+// Milliseconds between two requests when polling instead of streaming
+const POLL_INTERVAL = 5000;
+
+function showResults(results) {
+    for (let choice of results.choices) {
+        let item = choiceList.querySelector(`[data-choice="${choice.id}"]`);
+        if (item) {
+            item.textContent = `${choice.choice_text}: ${choice.vote_count} votes`;
+        }
+    }
+}
+
+function poll() {
+    fetch(choiceList.dataset.poll, {headers: {"Accept": "application/json"}})
+        .then((response) => response.ok ? response.json() : null)
+        .then((results) => results && showResults(results))
+        .catch(() => {})
+        .finally(() => setTimeout(poll, POLL_INTERVAL));
+}
+
+if (choiceList && window.EventSource) {
+    let source = new EventSource(choiceList.dataset.stream);
+    let opened = false;
+    source.addEventListener("open", () => { opened = true; });
+    source.addEventListener("results", (event) => showResults(JSON.parse(event.data)));
+    source.addEventListener("error", () => {
+        // A stream that never opened is not served here (501 under WSGI):
+        // stop reconnecting to it and poll instead
+        if (!opened) {
+            source.close();
+            setTimeout(poll, POLL_INTERVAL);
+        }
+    });
+} else if (choiceList) {
+    setTimeout(poll, POLL_INTERVAL);
+}
@@ -0,0 +1,86 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .locking import lock_for_writing
+from .models import Category, CategoryStats, Question
+
+STATS_KEY = "polls:category_stats"
+
+
+def add_to_category_stats(category_id, polls=0, votes=0):
+    """Add to the poll and vote counts of a category, creating its row if needed"""
+    if not polls and not votes:
+        return
+    updated = CategoryStats.objects.filter(category_id=category_id).update(
+        polls=F("polls") + polls, votes=F("votes") + votes
+    )
+    if not updated and Category.objects.filter(pk=category_id).exists():
+        CategoryStats.objects.get_or_create(category_id=category_id)
+        CategoryStats.objects.filter(category_id=category_id).update(
+            polls=F("polls") + polls, votes=F("votes") + votes
+        )
+
+
+def add_votes_by_question(question_votes):
+    """Add {question id: votes} to the stats of the questions' categories, one UPDATE per category"""
+    categories = dict(Question.objects.filter(pk__in=question_votes).values_list("pk", "category_id"))
+    per_category = Counter()
+    for question_id, votes in question_votes.items():
+        if question_id in categories:
+            per_category[categories[question_id]] += votes
+    for category_id, votes in per_category.items():
+        add_to_category_stats(category_id, votes=votes)
+
+
+def category_stats():
+    """
+        {category id: CategoryStats} of all categories, from the cache.
+
+        The counts change with every vote, so rather than being invalidated
+        they are kept for POLLS_CATEGORY_STATS_TIMEOUT seconds and may lag
+        by that much.
+    """
+    stats = cache.get(STATS_KEY)
+    if stats is None:
+        stats = {row.category_id: row for row in CategoryStats.objects.all()}
+        cache.set(STATS_KEY, stats, settings.POLLS_CATEGORY_STATS_TIMEOUT)
+    return stats
+
+
+def stats_for(stats, category):
+    return stats.get(category.pk) or CategoryStats(category_id=category.pk)
+
+
+def rebuild_category_stats(dry_run=False):
+    """
+        Recount the stats of every category from the Question table and
+        return the drift found as (category, (polls, votes) stored,
+        (polls, votes) counted) tuples. Unless `dry_run`, the counted values
+        are saved.
+    """
+    with transaction.atomic():
+        lock_for_writing()
+        stored = {
+            row.category_id: row for row in CategoryStats.objects.select_for_update()
+        }
+        drift = []
+        rows = []
+        for category in Category.objects.annotate(
+            poll_count=Count("question"), vote_count=Sum("question__total_votes")
+        ).order_by("pk"):
+            counted = (category.poll_count, category.vote_count or 0)
+            row = stored.get(category.pk)
+            current = (row.polls, row.votes) if row else None
+            if current != counted:
+                drift.append((category, current, counted))
+                rows.append(CategoryStats(category_id=category.pk, polls=counted[0], votes=counted[1]))
+        if rows and not dry_run:
+            CategoryStats.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=["category"], update_fields=["polls", "votes"]
+            )
+            cache.delete(STATS_KEY)
+    return drift
@@ -0,0 +1,12 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from polls.cards import poll_cards as render_poll_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def poll_cards(questions, voted_ids=frozenset()):
+    """The cached cards of `questions`, see polls.cards.poll_cards()"""
+    return mark_safe("".join(render_poll_cards(list(questions), voted_ids)))
@@ -0,0 +1,36 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from polls.images import variant_name, variant_storage
+
+register = template.Library()
+
+
+@register.simple_tag
+def category_image(category, sizes="402px", alt=""):
+    """
+        A <picture> of a category's resized images, WebP first with a JPEG
+        fallback, each with a `srcset` of all the widths built. Until they are
+        built the original image is served as it is.
+    """
+    if not category.img:
+        return ""
+    if not category.img_hash or not category.img_widths:
+        return format_html('<img src="{}" alt="{}">', static(category.img.name), alt)
+    storage = variant_storage()
+    srcsets = {
+        extension: ", ".join(
+            f"{storage.url(variant_name(category.img_hash, width, extension))} {width}w"
+            for width in category.img_widths
+        )
+        for extension in ("webp", "jpg")
+    }
+    # The fallback src is the smallest copy that fills the tile on a 1x screen
+    default = next((width for width in category.img_widths if width >= 402), category.img_widths[-1])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy"></picture>',
+        srcsets["webp"], sizes,
+        storage.url(variant_name(category.img_hash, default, "jpg")), srcsets["jpg"], sizes, alt,
+    )
@@ -1,9 +1,45 @@
+import asyncio
+import base64
+import csv
 import datetime
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, sync_to_async
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template.loader import render_to_string
+from django.core.management import call_command, CommandError
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.test import (
+    AsyncRequestFactory, Client, RequestFactory, TestCase, TransactionTestCase, override_settings,
+)
 from django.utils import timezone
 from django.urls import reverse
-from django.contrib.auth.models import User
-from .models import Question, Category
+from django.contrib.auth.models import AnonymousUser, User
+from django.http import Http404
+from .models import Question, Choice, Category, CategoryStats, Vote, ChoiceVoteShard
+from .voting import record_vote, roll_up_vote_shards, AlreadyVoted
+from .journal import VoteJournal, apply_journal, journal_lag
+from .cache import results_cache_stats, voted_question_ids
+from .cards import poll_cards
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+from .registry import category_registry
+from .live import Broadcaster, LocalBroker, get_broker, results_changed
+from .views import results_stream
+from .search import filter_questions, search, uses_fts
+from .creation import create_polls
+from .trending import decay_trending_scores, trending_questions
+from .forms import CategoryForm
+from .images import build_variants, variant_name
+from . import views, async_views
 
 
 def create_question(question_text, days, category, user):
@@ -17,6 +53,16 @@ def create_question(question_text, days, category, user):
     return Question.objects.create(question_text=question_text, pub_date=time, category=category, created_by=user)
 
 
+class CacheClearingTestCase(TestCase):
+    """
+        Starts every test with an empty cache: ids are reused once a test's
+        transaction is rolled back, so cached per-question and per-user data
+        would otherwise leak between tests.
+    """
+    def setUp(self):
+        cache.clear()
+
+
 class QuestionModelTest(TestCase):
     def test_was_published_recently_with_future_question(self):
         """was_published_recently() returns False for questions whose pub_date is in future"""
@@ -158,7 +204,7 @@ class QuestionResultViewTest(TestCase):
         self.assertContains(response, past_question.question_text)
         
 
-class CategoriesListViewTest(TestCase):
+class CategoriesListViewTest(CacheClearingTestCase):
     def test_no_categories(self):
         """
             Displays the view for categories list, returns empty array of categories and
@@ -201,7 +247,7 @@ class CategoriesListViewTest(TestCase):
         )
 
 
-class CategoryListViewTest(TestCase):
+class CategoryListViewTest(CacheClearingTestCase):
     def test_no_polls(self):
         """
             Displays the list view of some category, returns no polls
@@ -231,3 +277,1512 @@ class CategoryListViewTest(TestCase):
             response.context["polls"],
             [question]
         )
+
+
+class PollListQueryCountTest(CacheClearingTestCase):
+    def create_polls(self, count, category, user):
+        for index in range(count):
+            question = create_question(f"Question {index}", days=-1, category=category, user=user)
+            choice = question.choice_set.create(choice_text="Yes")
+            Vote.objects.create(question=question, voted_on=choice, voted_by=user)
+            Question.objects.filter(pk=question.pk).update(total_votes=1)
+
+    def test_index_query_count_does_not_grow_with_polls(self):
+        """
+            The index page loads questions and their authors in a single query
+            whatever the number of polls listed
+        """
+        category = Category.objects.create(category_name="Games")
+        user = User.objects.create(username="Kirill")
+        self.create_polls(1, category, user)
+        with self.assertNumQueries(1):
+            self.client.get(reverse("polls:index"))
+        self.create_polls(19, category, user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("polls:index"))
+        self.assertContains(response, "1 votes", count=20)
+
+    def test_category_query_count_does_not_grow_with_polls(self):
+        """
+            The category page loads questions and their authors in a single query
+            whatever the number of polls listed
+        """
+        category = Category.objects.create(category_name="Games")
+        user = User.objects.create(username="Kirill")
+        self.create_polls(1, category, user)
+        url = reverse("polls:category", args=(category.category_name, ))
+        # The first request loads the category registry
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        self.create_polls(19, category, user)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, "Kirill", count=20)
+
+
+class VoteViewTest(CacheClearingTestCase):
+    def test_vote_updates_total_votes(self):
+        """
+            Voting increments both the choice counter and the question's total_votes
+        """
+        category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        voter = User.objects.create(username="Voter1")
+        question = create_question("Past question.", days=-1, category=category, user=author)
+        choice = question.choice_set.create(choice_text="Yes")
+        self.client.force_login(voter)
+        self.client.post(reverse("polls:vote", args=(question.id, )), {"choice": choice.id})
+        question.refresh_from_db()
+        choice.refresh_from_db()
+        self.assertEqual(choice.votes, 1)
+        self.assertEqual(question.total_votes, 1)
+
+    def test_saving_a_stale_question_keeps_votes(self):
+        """
+            Editing a poll, in the view or through a full save, does not write
+            back a total_votes or trending_score read before a concurrent vote
+        """
+        category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        question = create_question("Past question.", days=-1, category=category, user=author)
+        stale = Question.objects.get(pk=question.pk)
+        Question.objects.filter(pk=question.pk).update(
+            total_votes=F("total_votes") + 3, trending_score=F("trending_score") + 2.5
+        )
+        stale.question_text = "Edited"
+        stale.save()
+        self.client.force_login(author)
+        self.client.post(reverse("polls:edit_poll", args=(question.id, )), {"question_text": "Edited again"})
+        question.refresh_from_db()
+        self.assertEqual(question.question_text, "Edited again")
+        self.assertEqual(question.total_votes, 3)
+        self.assertEqual(question.trending_score, 2.5)
+
+    def test_second_vote_is_rejected(self):
+        """
+            A user voting twice in the same poll is counted once and detail_view
+            keeps showing the results
+        """
+        category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        voter = User.objects.create(username="Voter1")
+        question = create_question("Past question.", days=-1, category=category, user=author)
+        yes = question.choice_set.create(choice_text="Yes")
+        no = question.choice_set.create(choice_text="No")
+        self.client.force_login(voter)
+        url = reverse("polls:vote", args=(question.id, ))
+        self.client.post(url, {"choice": yes.id})
+        response = self.client.post(url, {"choice": no.id})
+        self.assertRedirects(response, reverse("polls:results", args=(question.id, )))
+        self.assertEqual(Vote.objects.filter(question=question).count(), 1)
+        question.refresh_from_db()
+        self.assertEqual(question.total_votes, 1)
+        response = self.client.get(reverse("polls:details", args=(question.id, )))
+        self.assertTemplateUsed(response, "polls/results.html")
+
+
+
+class ShardedVoteTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        self.question = create_question("Hot question", days=-1, category=category, user=author)
+        Question.objects.filter(pk=self.question.pk).update(vote_shards=4)
+        self.question.refresh_from_db()
+        self.choice = self.question.choice_set.create(choice_text="Yes")
+        for index in range(10):
+            record_vote(self.question, self.choice, User.objects.create(username=f"voter{index}"))
+
+    def test_votes_go_to_shards(self):
+        """
+            Votes on a sharded poll land in shard rows and the results page adds them up
+        """
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.votes, 0)
+        self.assertLessEqual(ChoiceVoteShard.objects.filter(choice=self.choice).count(), 4)
+        response = self.client.get(reverse("polls:results", args=(self.question.id, )))
+        self.assertContains(response, "Yes: 10 votes")
+
+    def test_roll_up_moves_shard_votes_to_totals(self):
+        """
+            Rolling up empties the shards into Choice.votes and Question.total_votes
+        """
+        self.assertEqual(roll_up_vote_shards(), 10)
+        self.choice.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual(self.choice.votes, 10)
+        self.assertEqual(self.question.total_votes, 10)
+        self.assertFalse(ChoiceVoteShard.objects.filter(votes__gt=0).exists())
+        response = self.client.get(reverse("polls:results", args=(self.question.id, )))
+        self.assertContains(response, "Yes: 10 votes")
+
+
+class VoteJournalTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "votes.log")
+        journal_settings = override_settings(VOTE_JOURNAL_ENABLED=True, VOTE_JOURNAL_PATH=self.path)
+        journal_settings.enable()
+        self.addCleanup(journal_settings.disable)
+
+        category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        self.question = create_question("Past question.", days=-1, category=category, user=author)
+        self.choice = self.question.choice_set.create(choice_text="Yes")
+        self.voters = [User.objects.create(username=f"voter{index}") for index in range(3)]
+
+    def append(self, *voters):
+        journal = VoteJournal(self.path, commit_delay=0)
+        for voter in voters:
+            journal.append(self.question.pk, self.choice.pk, voter.pk)
+        journal.close()
+
+    def assertVotes(self, count):
+        self.choice.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual(Vote.objects.count(), count)
+        self.assertEqual(self.choice.votes, count)
+        self.assertEqual(self.question.total_votes, count)
+
+    def test_vote_is_journalled_then_applied(self):
+        """
+            With the journal enabled vote() only appends, and the applier writes the vote later
+        """
+        self.client.force_login(self.voters[0])
+        self.client.post(reverse("polls:vote", args=(self.question.id, )), {"choice": self.choice.id})
+        self.assertVotes(0)
+        self.assertGreater(journal_lag().bytes, 0)
+        call_command("apply_vote_journal", "--drain", stdout=io.StringIO())
+        self.assertVotes(1)
+        self.assertEqual(journal_lag().bytes, 0)
+
+    def test_repeated_votes_are_applied_once(self):
+        """
+            A user appearing twice in the journal, or already in the database, is counted once
+        """
+        self.append(self.voters[0], self.voters[0], self.voters[1])
+        self.assertEqual(apply_journal(), 3)
+        self.append(self.voters[1])
+        apply_journal()
+        self.assertVotes(2)
+
+    def test_replay_resumes_after_torn_write(self):
+        """
+            A half-written last line is left for later and nothing is applied twice
+        """
+        self.append(self.voters[0], self.voters[1])
+        with open(self.path, "ab") as journal:
+            journal.write(b'{"q":%d,"c":%d,' % (self.question.pk, self.choice.pk))
+        self.assertEqual(apply_journal(), 2)
+        self.assertEqual(apply_journal(), 0)
+        with open(self.path, "ab") as journal:
+            journal.write(b'"u":%d,"t":0}\n' % self.voters[2].pk)
+        self.assertEqual(apply_journal(), 1)
+        self.assertVotes(3)
+
+    def test_torn_write_is_ended_when_the_journal_reopens(self):
+        """
+            After a crash tore the last line, the next process's appends start
+            a new line: the torn record is lost, the others are all applied
+        """
+        self.append(self.voters[0])
+        with open(self.path, "ab") as journal:
+            journal.write(b'{"q":%d,"c":%d,' % (self.question.pk, self.choice.pk))
+        self.append(self.voters[1], self.voters[2])
+        with self.assertLogs("polls.journal", "WARNING"):
+            self.assertEqual(apply_journal(), 4)
+        self.assertVotes(3)
+        self.assertEqual(journal_lag().bytes, 0)
+
+    def test_unreadable_line_does_not_stall_the_applier(self):
+        """
+            A complete line that is not a record, such as a torn line a later
+            append was written onto, is skipped with the votes around it applied
+        """
+        self.append(self.voters[0])
+        with open(self.path, "ab") as journal:
+            journal.write(b'{"q":%d,"c":%d,{"q":1}\n[1, 2]\n' % (self.question.pk, self.choice.pk))
+        self.append(self.voters[1])
+        with self.assertLogs("polls.journal", "WARNING") as logs:
+            call_command("apply_vote_journal", "--drain", stdout=io.StringIO())
+        self.assertEqual(len(logs.output), 2)
+        self.assertVotes(2)
+        self.assertEqual(journal_lag().bytes, 0)
+
+    def test_applier_retries_when_the_database_is_locked(self):
+        self.append(self.voters[0])
+        with mock.patch(
+            "polls.management.commands.apply_vote_journal.apply_journal",
+            side_effect=[OperationalError("database is locked"), 1, 0],
+        ) as applied:
+            stderr = io.StringIO()
+            call_command("apply_vote_journal", "--drain", "--interval", "0", stdout=io.StringIO(), stderr=stderr)
+        self.assertEqual(applied.call_count, 3)
+        self.assertIn("Database locked", stderr.getvalue())
+
+
+class ResultsCacheTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name="Games")
+        self.author = User.objects.create(username="Kirill")
+        self.question = create_question("Past question.", days=-1, category=category, user=self.author)
+        self.choice = self.question.choice_set.create(choice_text="Yes")
+        self.url = reverse("polls:results", args=(self.question.id, ))
+
+    def test_warm_cache_needs_no_queries(self):
+        """
+            Once the results are cached the results and details pages run no queries
+        """
+        self.client.get(self.url)
+        misses = results_cache_stats()["misses"]
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+            self.client.get(reverse("polls:details", args=(self.question.id, )))
+        self.assertContains(response, "Yes: 0 votes")
+        self.assertEqual(results_cache_stats()["misses"], misses)
+
+    def test_vote_and_edit_invalidate_results(self):
+        """
+            Voting and editing the poll bump its version, so the next request sees the change
+        """
+        self.client.get(self.url)
+        record_vote(self.question, self.choice, User.objects.create(username="Voter1"))
+        self.assertContains(self.client.get(self.url), "Yes: 1 votes")
+
+        self.client.force_login(self.author)
+        self.client.post(reverse("polls:edit_poll", args=(self.question.id, )), {"question_text": "Edited"})
+        self.assertContains(self.client.get(self.url), "Edited")
+
+    def test_deleted_poll_is_not_served_from_cache(self):
+        """
+            After the poll is deleted its results page returns 404
+        """
+        self.client.get(self.url)
+        self.client.force_login(self.author)
+        self.client.post(reverse("polls:delete_poll", args=(self.question.id, )))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class VotedCacheTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        self.voter = User.objects.create(username="Voter1")
+        self.question = create_question("Past question.", days=-1, category=category, user=author)
+        self.choice = self.question.choice_set.create(choice_text="Yes")
+        self.client.force_login(self.voter)
+
+    def test_vote_updates_cached_set(self):
+        """
+            A vote is added to the user's cached set without reloading it
+        """
+        self.assertEqual(voted_question_ids(self.voter), frozenset())
+        self.client.post(reverse("polls:vote", args=(self.question.id, )), {"choice": self.choice.id})
+        with self.assertNumQueries(0):
+            self.assertEqual(voted_question_ids(self.voter), {self.question.id})
+
+    @override_settings(
+        SESSION_ENGINE="django.contrib.sessions.backends.cached_db", LOGIN_USER_CACHE_TIMEOUT=300
+    )
+    def test_detail_view_decision_uses_cache(self):
+        """
+            With warm caches detail_view, the session and the user included,
+            makes no query at all
+        """
+        record_vote(self.question, self.choice, self.voter)
+        url = reverse("polls:details", args=(self.question.id, ))
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertTemplateUsed(response, "polls/results.html")
+
+    def test_list_pages_show_voted_badge(self):
+        """
+            Polls the user has voted in are marked on the index page
+        """
+        self.assertNotContains(self.client.get(reverse("polls:index")), "poll-footer__voted")
+        record_vote(self.question, self.choice, self.voter)
+        self.assertContains(self.client.get(reverse("polls:index")), "poll-footer__voted", count=1)
+
+
+class QueryPlanTest(CacheClearingTestCase):
+    """
+        Runs EXPLAIN QUERY PLAN on every query the hot views issue and fails if
+        SQLite has to scan a whole table or sort through a temporary B-tree.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        self.voter = User.objects.create(username="Voter1")
+        self.question = create_question("Past question.", days=-1, category=self.category, user=author)
+        choice = self.question.choice_set.create(choice_text="Yes")
+        record_vote(self.question, choice, self.voter)
+
+    def assertIndexedPlans(self, url, **params):
+        # Start cold so the queries behind the caches are checked too; only
+        # the category registry, which reads the whole table by design, is
+        # loaded up front
+        cache.clear()
+        category_registry.all()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+        self.assertTrue(context.captured_queries)
+        for query in context.captured_queries:
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                self.assertFalse(
+                    step.startswith("SCAN ") or "TEMP B-TREE" in step,
+                    f"{step!r} in the plan of {query['sql']}",
+                )
+
+    def test_hot_views_use_indexes(self):
+        self.client.force_login(self.voter)
+        self.assertIndexedPlans(reverse("polls:index"))
+        self.assertIndexedPlans(
+            reverse("polls:index"), cursor=encode_cursor(self.question.pub_date, self.question.pk + 1, "next")
+        )
+        self.assertIndexedPlans(
+            reverse("polls:index"), cursor=encode_cursor(self.question.pub_date, self.question.pk - 1, "prev")
+        )
+        self.assertIndexedPlans(reverse("polls:category", args=(self.category.category_name, )))
+        self.assertIndexedPlans(reverse("polls:details", args=(self.question.id, )))
+        self.assertIndexedPlans(reverse("polls:results", args=(self.question.id, )))
+        self.assertIndexedPlans(reverse("polls:trending"))
+        self.assertIndexedPlans(reverse("polls:category_trending", args=(self.category.category_name, )))
+
+
+class CategoryRegistryTest(CacheClearingTestCase):
+    def test_listing_is_served_from_registry(self):
+        """
+            Once loaded, the categories page and category_list run no queries
+        """
+        Category.objects.create(category_name="Games")
+        self.client.get(reverse("polls:categories"))
+        with self.assertNumQueries(0):
+            self.client.get(reverse("polls:categories"))
+            response = self.client.get(reverse("polls:category_list"))
+        self.assertEqual([category["category_name"] for category in response.json()], ["Games"])
+
+    def test_saving_a_category_invalidates_registry(self):
+        """
+            Creating, renaming and deleting categories is visible on the next request
+        """
+        category = Category.objects.create(category_name="Games")
+        self.assertEqual(category_registry.get("Games"), category)
+        category.category_name = "Science"
+        category.save()
+        self.assertIsNone(category_registry.get("Games"))
+        self.assertEqual(category_registry.get("Science").category_name, "Science")
+        category.delete()
+        self.assertEqual(category_registry.all(), [])
+
+
+class ExportTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        self.voter = User.objects.create(username="Voter1")
+        self.questions = [
+            create_question(f"Question {index}", days=-index, category=category, user=author)
+            for index in range(1, 4)
+        ]
+        for question in self.questions:
+            record_vote(question, question.choice_set.create(choice_text="Yes"), self.voter)
+        self.staff = User.objects.create(username="Analyst", is_staff=True)
+
+    def test_export_requires_staff(self):
+        """
+            Anonymous users are sent to the login page and other users are refused
+        """
+        self.assertRedirects(self.client.get(reverse("polls:export")), reverse("login:index"))
+        self.client.force_login(self.voter)
+        self.assertEqual(self.client.get(reverse("polls:export")).status_code, 403)
+
+    def test_ndjson_export_streams_every_row(self):
+        """
+            The default export streams every question, choice and vote as NDJSON
+        """
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("polls:export"))
+        self.assertTrue(response.streaming)
+        records = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(
+            [record["type"] for record in records], ["questions"] * 3 + ["choices"] * 3 + ["votes"] * 3
+        )
+        self.assertEqual(records[0]["question_text"], "Question 1")
+
+    def test_incremental_csv_export(self):
+        """
+            since_id and since limit the export to newer rows
+        """
+        self.client.force_login(self.staff)
+        response = self.client.get(
+            reverse("polls:export"), {"kind": "questions", "format": "csv", "since_id": self.questions[0].id}
+        )
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:2], ["id", "category_id"])
+        self.assertEqual([int(row[0]) for row in rows[1:]], [question.id for question in self.questions[1:]])
+
+        since = (timezone.now() - datetime.timedelta(days=2, hours=1)).isoformat()
+        output = io.StringIO()
+        call_command("export_polls", "--kind", "questions", "--since", since, stdout=output)
+        exported = [json.loads(line)["id"] for line in output.getvalue().splitlines()]
+        self.assertEqual(exported, [question.id for question in self.questions[:2]])
+
+    def test_invalid_parameters(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("polls:export"), {"format": "csv"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportPollsTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "polls.jsonl")
+        User.objects.create(username="kirill")
+
+    def write(self, *lines):
+        with open(self.path, "w") as source:
+            source.write("\n".join(lines) + "\n")
+
+    def poll(self, text, votes, category="Games"):
+        return json.dumps({
+            "question_text": text,
+            "pub_date": "2023-01-01T10:00:00Z",
+            "category": category,
+            "created_by": "kirill",
+            "choices": [
+                {"choice_text": "Yes", "votes": votes},
+                {"choice_text": "No", "votes": [{"user": "carol", "voted_at": "2023-01-02T10:00:00Z"}]},
+            ],
+        })
+
+    def test_import_creates_polls_and_recounts_votes(self):
+        """
+            Polls, choices, missing users and categories are created, repeated
+            votes dropped and the vote counters computed from the imported votes
+        """
+        self.write(self.poll("First", ["ann", "bob", "ann"]), self.poll("Second", ["bob"], category="Science"))
+        call_command("import_polls", self.path, "--batch-size", "1", stdout=io.StringIO())
+        first = Question.objects.get(question_text="First")
+        self.assertEqual(first.total_votes, 3)
+        self.assertEqual(
+            list(first.choice_set.order_by("pk").values_list("choice_text", "votes")), [("Yes", 2), ("No", 1)]
+        )
+        self.assertEqual(Question.objects.get(question_text="Second").category.category_name, "Science")
+        self.assertFalse(User.objects.get(username="ann").has_usable_password())
+        self.assertEqual(Vote.objects.count(), 5)
+
+    def test_import_resumes_after_failure(self):
+        """
+            A bad line aborts the import after the last good batch, and rerunning
+            continues from there without importing anything twice
+        """
+        good = self.poll("First", ["ann"])
+        self.write(good, '{"question_text": "Broken"}', self.poll("Third", ["bob"]))
+        with self.assertRaises(CommandError):
+            call_command("import_polls", self.path, "--batch-size", "1", stdout=io.StringIO())
+        self.assertEqual(list(Question.objects.values_list("question_text", flat=True)), ["First"])
+
+        self.write(good, self.poll("Second", ["bob"]), self.poll("Third", ["bob"]))
+        call_command("import_polls", self.path, "--batch-size", "1", stdout=io.StringIO())
+        self.assertEqual(
+            list(Question.objects.order_by("pk").values_list("question_text", flat=True)),
+            ["First", "Second", "Third"],
+        )
+        self.assertEqual(Choice.objects.count(), 6)
+
+
+class NewPollTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username="Kirill")
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(category_name="Games")
+
+    def test_new_poll_creates_question_and_choices(self):
+        """
+            The form creates the question in the chosen category with all its non-empty choices
+        """
+        response = self.client.post(reverse("polls:new_poll"), {
+            "question_text": "Best game?", "category": "Games",
+            "choice_text_1": "Chess", "choice_text_2": "", "choice_text_3": "Go",
+        })
+        self.assertRedirects(response, reverse("polls:index"))
+        question = Question.objects.get()
+        self.assertEqual((question.category, question.created_by), (self.category, self.user))
+        self.assertEqual(list(question.choice_set.order_by("pk").values_list("choice_text", flat=True)), ["Chess", "Go"])
+
+    def test_new_poll_rejects_unknown_category(self):
+        """
+            A category that does not exist is reported and nothing is created
+        """
+        response = self.client.post(reverse("polls:new_poll"), {
+            "question_text": "Best game?", "category": "Nope", "choice_text_1": "Chess",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["error_messages"])
+        self.assertFalse(Question.objects.exists())
+
+    def test_new_poll_needs_two_choices(self):
+        """
+            The form applies the API's rule that a poll has at least two choices
+        """
+        response = self.client.post(reverse("polls:new_poll"), {
+            "question_text": "Best game?", "category": "Games", "choice_text_1": "Chess", "choice_text_2": " ",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("A poll needs at least two choices.", response.context["error_messages"])
+        self.assertFalse(Question.objects.exists())
+
+    def post_polls(self, polls, **kwargs):
+        return self.client.post(
+            reverse("polls:create_polls_api"), json.dumps(polls), content_type="application/json", **kwargs
+        )
+
+    def poll(self, index, category="Games"):
+        return {"question_text": f"Question {index}", "category": category, "choices": [
+            {"choice_text": "Yes"}, {"choice_text": "No"},
+        ]}
+
+    def test_api_creates_batch_with_constant_queries(self):
+        """
+            The API creates every poll, and missing categories, with the same
+            number of queries for a batch of 2 or 50 polls
+        """
+        counts = []
+        # Load the session and the user into the cache first
+        self.client.get(reverse("polls:about"))
+        for size in (2, 50):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post_polls([self.poll(index, category=f"New {size}") for index in range(size)])
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+        created = response.json()
+        self.assertEqual(len(created), 50)
+        self.assertEqual([choice["choice_text"] for choice in created[0]["choices"]], ["Yes", "No"])
+        self.assertEqual(created[0]["category"], "New 50")
+        self.assertEqual(Choice.objects.filter(question_id=created[0]["id"]).count(), 2)
+        self.assertEqual(Question.objects.filter(created_by=self.user).count(), 52)
+
+    def test_api_rejects_invalid_batch_atomically(self):
+        """
+            One invalid poll rejects the whole batch and nothing is created
+        """
+        invalid = dict(self.poll(2), choices=[{"choice_text": "Only"}])
+        response = self.post_polls([self.poll(1), invalid])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("choices", response.json()[1])
+        self.assertFalse(Question.objects.exists())
+
+    def test_api_requires_login_and_json(self):
+        self.assertEqual(
+            self.client.post(reverse("polls:create_polls_api"), {"question_text": "x"}).status_code, 415
+        )
+        self.client.logout()
+        self.assertEqual(self.post_polls([self.poll(1)]).status_code, 401)
+
+
+@override_settings(POLLS_LIVE_INTERVAL=0.05)
+class LiveResultsTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        self.voter = User.objects.create(username="Voter1")
+        self.question = create_question("Live?", days=-1, category=category, user=author)
+        self.choice = self.question.choice_set.create(choice_text="Yes")
+
+    def test_committed_vote_is_published(self):
+        """
+            A vote notifies the broker once its transaction commits
+        """
+        published = []
+        get_broker().subscribe(published.append)
+        self.addCleanup(get_broker().unsubscribe, published.append)
+        with self.captureOnCommitCallbacks(execute=True):
+            record_vote(self.question, self.choice, self.voter)
+            self.assertEqual(published, [])
+        self.assertEqual(published, [self.question.id])
+
+    async def test_updates_are_coalesced_and_shared(self):
+        """
+            Many notifications within one interval produce a single update,
+            loaded once and delivered to every subscriber
+        """
+        broker = LocalBroker()
+        broadcaster = Broadcaster(asyncio.get_running_loop(), broker, 0.05)
+        queues = [broadcaster.subscribe(self.question.id) for _ in range(3)]
+        misses = results_cache_stats()["misses"]
+        threads = [threading.Thread(target=broker.publish, args=(self.question.id,)) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        await asyncio.sleep(0.2)
+        self.assertEqual(results_cache_stats()["misses"] - misses, 1)
+        for queue in queues:
+            self.assertEqual(queue.qsize(), 1)
+            self.assertEqual((await queue.get())["id"], self.question.id)
+        for queue in queues:
+            broadcaster.unsubscribe(self.question.id, queue)
+        self.assertEqual(broadcaster.subscriber_count(self.question.id), 0)
+
+    async def test_stream_sends_current_results_then_updates(self):
+        request = AsyncRequestFactory().get(reverse("polls:results_stream", args=(self.question.id,)))
+        response = await results_stream(request, self.question.id)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = aiter(response.streaming_content)
+        first = await anext(events)
+        self.assertIn(b'"total_votes":0', first)
+
+        await sync_to_async(record_vote)(self.question, self.choice, self.voter)
+        results_changed(self.question.id)
+        update = await asyncio.wait_for(anext(events), 1)
+        self.assertIn(b'"total_votes":1', update)
+        await events.aclose()
+
+    def test_stream_needs_asgi(self):
+        response = self.client.get(reverse("polls:results_stream", args=(self.question.id,)))
+        self.assertEqual(response.status_code, 501)
+
+    def test_results_json_for_polling_clients(self):
+        """
+            Where the stream is not served the results page polls the same payload as JSON
+        """
+        response = self.client.get(reverse("polls:results", args=(self.question.id,)))
+        self.assertContains(response, f'data-poll="{reverse("polls:results_json", args=(self.question.id,))}"')
+        record_vote(self.question, self.choice, self.voter)
+        response = self.client.get(reverse("polls:results_json", args=(self.question.id,)))
+        self.assertEqual(response.json()["total_votes"], 1)
+        self.assertEqual(response.json()["choices"][0]["vote_count"], 1)
+
+
+class AsyncViewsTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(category_name="Games")
+        self.author = User.objects.create(username="Kirill")
+        self.voter = User.objects.create(username="Voter1")
+        self.questions = [
+            create_question(f"Question {index}", days=-index, category=self.category, user=self.author)
+            for index in range(1, 4)
+        ]
+        for question in self.questions:
+            question.choice_set.create(choice_text="Yes")
+        record_vote(self.questions[0], self.questions[0].choice_set.get(), self.voter)
+
+    def assertSameOutput(self, sync_view, async_view, query=None, **kwargs):
+        for user in (AnonymousUser(), self.voter, self.author):
+            responses = []
+            for view in (sync_view, async_to_sync(async_view)):
+                request = RequestFactory().get("/", query)
+                request.user = user
+                response = view(request, **kwargs)
+                if hasattr(response, "render"):
+                    response.render()
+                # The CSRF token is masked differently on every render
+                content = re.sub(rb'name="csrfmiddlewaretoken" value="[^"]+"', b"", response.content)
+                responses.append((response.status_code, response.get("Location"), content))
+            self.assertEqual(responses[0], responses[1])
+
+    def test_index_and_category(self):
+        self.assertSameOutput(views.IndexView.as_view(), async_views.index)
+        cursor = encode_cursor(self.questions[1].pub_date, self.questions[1].pk, "next")
+        self.assertSameOutput(views.IndexView.as_view(), async_views.index, {"cursor": cursor})
+        self.assertSameOutput(views.category, async_views.category, cat="Games")
+        self.assertSameOutput(views.category, async_views.category, cat="Missing")
+
+    def test_details_and_results(self):
+        for question in self.questions[:2]:
+            self.assertSameOutput(views.detail_view, async_views.detail_view, pk=question.pk)
+            self.assertSameOutput(views.Result.as_view(), async_views.results, pk=question.pk)
+
+    def test_unknown_question_is_404(self):
+        with self.assertRaises(Http404):
+            async_to_sync(async_views.results)(RequestFactory().get("/"), 0)
+
+
+class SearchTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(category_name="Games")
+        self.user = User.objects.create(username="Kirill")
+        self.chess = create_question("Is chess a sport?", days=-2, category=self.category, user=self.user)
+        self.chess.choice_set.create(choice_text="Yes")
+        self.games = create_question("Favourite board game?", days=-1, category=self.category, user=self.user)
+        self.games.choice_set.create(choice_text="Chess")
+        self.games.choice_set.create(choice_text="Go")
+
+    def found(self, text, **kwargs):
+        return [question.question_text for question in search(text, **kwargs).object_list]
+
+    def test_question_matches_rank_above_choice_matches(self):
+        self.assertEqual(self.found("chess"), ["Is chess a sport?", "Favourite board game?"])
+        self.assertEqual(self.found("board go"), ["Favourite board game?"])
+
+    def test_last_word_matches_as_prefix(self):
+        self.assertEqual(self.found("spo"), ["Is chess a sport?"])
+        self.assertEqual(self.found("sport che"), ["Is chess a sport?"])
+
+    def test_common_words_are_served_newest_first(self):
+        """
+            Past CANDIDATES matches, only the newest ones are served, by recency
+        """
+        with mock.patch("polls.search.CANDIDATES", 1):
+            self.assertEqual(self.found("chess"), ["Favourite board game?"])
+
+    def test_index_follows_writes(self):
+        """
+            Renaming, adding, bulk creating and deleting rows updates the index
+        """
+        self.chess.question_text = "Is poker a sport?"
+        self.chess.save()
+        self.assertEqual(self.found("chess"), ["Favourite board game?"])
+        self.games.choice_set.get(choice_text="Chess").delete()
+        self.assertEqual(self.found("chess"), [])
+        create_polls(self.user, [{"question_text": "Best card game?", "category": "Games", "choices": ["Poker"]}])
+        self.assertEqual(self.found("poker"), ["Is poker a sport?", "Best card game?"])
+        self.games.delete()
+        self.assertEqual(self.found("favourite"), [])
+
+    def test_unpublished_and_operator_input(self):
+        create_question("Future chess poll", days=5, category=self.category, user=self.user)
+        self.assertNotIn("Future chess poll", self.found("chess"))
+        for text in ['"', "NEAR(chess", "chess OR", "*", "", "a:b"]:
+            search(text)
+
+    @override_settings(POLLS_PAGE_SIZE=1)
+    def test_views_paginate(self):
+        response = self.client.get(reverse("polls:search"), {"q": "chess"})
+        self.assertContains(response, "Is chess a sport?")
+        self.assertNotContains(response, "Favourite board game?")
+        self.assertContains(response, "page=2")
+        data = self.client.get(reverse("polls:search_api"), {"q": "chess", "page": 2}).json()
+        self.assertEqual([result["id"] for result in data["results"]], [self.games.id])
+        self.assertIsNone(data["next_page"])
+
+    def test_admin_search_uses_index(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("admin:polls_question_changelist"), {"q": "sport"})
+        self.assertContains(response, "Is chess a sport?")
+        self.assertNotContains(response, "Favourite board game?")
+        self.assertTrue(any("MATCH" in query["sql"] for query in queries))
+
+
+@override_settings(POLLS_TRENDING_HALF_LIFE=3600)
+class TrendingTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.games = Category.objects.create(category_name="Games")
+        science = Category.objects.create(category_name="Science")
+        author = User.objects.create(username="Kirill")
+        self.voters = [User.objects.create(username=f"Voter{index}") for index in range(3)]
+        self.quiet = create_question("Quiet", days=-1, category=self.games, user=author)
+        self.hot = create_question("Hot", days=-1, category=self.games, user=author)
+        self.physics = create_question("Physics", days=-1, category=science, user=author)
+
+    def vote(self, question, voters):
+        choice = question.choice_set.create(choice_text="Yes")
+        for voter in voters:
+            record_vote(question, choice, voter)
+
+    def test_votes_raise_the_score_and_order_the_feed(self):
+        self.vote(self.hot, self.voters)
+        self.vote(self.quiet, self.voters[:1])
+        self.vote(self.physics, self.voters[:2])
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.trending_score, 3)
+        response = self.client.get(reverse("polls:trending"))
+        self.assertEqual([question.question_text for question in response.context["polls"]], ["Hot", "Physics", "Quiet"])
+        response = self.client.get(reverse("polls:category_trending", args=("Games", )))
+        self.assertEqual([question.question_text for question in response.context["polls"]], ["Hot", "Quiet"])
+
+    def test_sharded_votes_count_once_rolled_up(self):
+        self.hot.vote_shards = 4
+        self.hot.save()
+        self.vote(self.hot, self.voters)
+        roll_up_vote_shards()
+        self.hot.refresh_from_db()
+        self.assertEqual(self.hot.trending_score, 3)
+
+    def test_decay_halves_scores_every_half_life(self):
+        """
+            The first run only records the time; later runs decay by the time
+            elapsed, and scores under the floor drop out of the feed
+        """
+        self.vote(self.hot, self.voters)
+        self.vote(self.quiet, self.voters[:1])
+        self.assertEqual(decay_trending_scores(now=1000), 0)
+        self.assertEqual(decay_trending_scores(now=1000 + 3600), 2)
+        self.hot.refresh_from_db()
+        self.assertAlmostEqual(self.hot.trending_score, 1.5)
+        decay_trending_scores(now=1000 + 8 * 3600)
+        self.quiet.refresh_from_db()
+        self.assertEqual(self.quiet.trending_score, 0)
+        self.assertEqual(trending_questions(), [self.hot])
+
+    def test_decay_command_retries_when_the_database_is_locked(self):
+        with mock.patch(
+            "polls.management.commands.decay_trending.decay_trending_scores",
+            side_effect=[OperationalError("database is locked"), 2, KeyboardInterrupt],
+        ) as decayed:
+            stdout, stderr = io.StringIO(), io.StringIO()
+            with self.assertRaises(KeyboardInterrupt):
+                call_command("decay_trending", "--interval", "0.001", stdout=stdout, stderr=stderr)
+        self.assertEqual(decayed.call_count, 3)
+        self.assertIn("Database locked", stderr.getvalue())
+        self.assertIn("Decayed 2 trending scores", stdout.getvalue())
+
+
+class CategoryStatsTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.games = Category.objects.create(category_name="Games")
+        self.science = Category.objects.create(category_name="Science")
+        self.author = User.objects.create(username="Kirill")
+        self.voters = [User.objects.create(username=f"Voter{index}") for index in range(3)]
+
+    def stats(self, category):
+        stats = CategoryStats.objects.get(category=category)
+        return stats.polls, stats.votes
+
+    def vote(self, question, voters):
+        choice = question.choice_set.create(choice_text="Yes")
+        for voter in voters:
+            record_vote(question, choice, voter)
+
+    def test_counts_follow_polls_and_votes(self):
+        question = create_question("Chess?", days=-1, category=self.games, user=self.author)
+        self.vote(question, self.voters[:2])
+        create_polls(self.author, [
+            {"question_text": "Go?", "category": "Games", "choices": ["Yes"]},
+            {"question_text": "Atoms?", "category": "Science", "choices": ["Yes"]},
+        ])
+        self.assertEqual(self.stats(self.games), (2, 2))
+        self.assertEqual(self.stats(self.science), (1, 0))
+
+        question.refresh_from_db()
+        question.category = self.science
+        question.save()
+        self.assertEqual(self.stats(self.games), (1, 0))
+        self.assertEqual(self.stats(self.science), (2, 2))
+        question.delete()
+        self.assertEqual(self.stats(self.science), (1, 0))
+
+    def test_sharded_votes_count_once_rolled_up(self):
+        question = create_question("Chess?", days=-1, category=self.games, user=self.author)
+        question.vote_shards = 4
+        question.save()
+        self.vote(question, self.voters)
+        self.assertEqual(self.stats(self.games), (1, 0))
+        roll_up_vote_shards()
+        self.assertEqual(self.stats(self.games), (1, 3))
+
+    def test_pages_show_counts_without_aggregating(self):
+        question = create_question("Chess?", days=-1, category=self.games, user=self.author)
+        self.vote(question, self.voters)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("polls:categories"))
+        self.assertContains(response, "1 poll · 3 votes")
+        self.assertContains(response, "0 polls · 0 votes")
+        self.assertFalse(any("GROUP BY" in query["sql"] for query in queries))
+        data = {row["category_name"]: row for row in self.client.get(reverse("polls:category_list")).json()}
+        self.assertEqual((data["Games"]["polls"], data["Games"]["votes"]), (1, 3))
+
+    def test_repair_reports_and_fixes_drift(self):
+        question = create_question("Chess?", days=-1, category=self.games, user=self.author)
+        self.vote(question, self.voters[:1])
+        CategoryStats.objects.filter(category=self.games).update(polls=5, votes=0)
+        CategoryStats.objects.filter(category=self.science).delete()
+
+        out = io.StringIO()
+        call_command("repair_category_stats", "--dry-run", stdout=out)
+        self.assertIn("Games: 5 polls, 0 votes -> 1 polls, 1 votes", out.getvalue())
+        self.assertIn("Science: missing -> 0 polls, 0 votes", out.getvalue())
+        self.assertEqual(self.stats(self.games), (5, 0))
+
+        call_command("repair_category_stats", stdout=io.StringIO())
+        self.assertEqual((self.stats(self.games), self.stats(self.science)), ((1, 1), (0, 0)))
+        out = io.StringIO()
+        call_command("repair_category_stats", stdout=out)
+        self.assertIn("0 categories repaired", out.getvalue())
+
+@override_settings(POLLS_IMAGE_WORKERS=0, POLLS_IMAGE_WIDTHS=(402, 804, 1206))
+class CategoryImageTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        variants = tempfile.TemporaryDirectory()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(variants.cleanup)
+        self.addCleanup(media.cleanup)
+        self.variants = variants.name
+        overrides = override_settings(POLLS_IMAGE_VARIANTS_ROOT=variants.name, MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def upload(self, width=1000, height=500, color="red"):
+        output = io.BytesIO()
+        Image.new("RGB", (width, height), color).save(output, "PNG")
+        return SimpleUploadedFile("tile.png", output.getvalue(), content_type="image/png")
+
+    def variant_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.variants)
+            for root, _, names in os.walk(self.variants) for name in names
+        )
+
+    def test_saving_an_image_through_the_form_builds_its_variants(self):
+        """
+            Every width is built as WebP and JPEG, never wider than the
+            original, under names derived from the image content
+        """
+        form = CategoryForm({"category_name": "Games"}, {"img": self.upload()})
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            category = form.save()
+        category.refresh_from_db()
+        self.assertEqual(category.img_widths, [402, 804, 1000])
+        self.assertEqual(len(category.img_hash), 16)
+        self.assertEqual(self.variant_files(), [
+            f"{category.img_hash[:2]}/{category.img_hash}-{width}w.{extension}"
+            for width in (1000, 402, 804) for extension in ("jpg", "webp")
+        ])
+        with Image.open(os.path.join(self.variants, variant_name(category.img_hash, 402, "webp"))) as image:
+            self.assertEqual((image.format, image.size), ("WEBP", (402, 201)))
+
+    def test_same_image_reuses_its_variants(self):
+        first = Category.objects.create(category_name="Games", img=self.upload())
+        second = Category.objects.create(category_name="Music", img=self.upload())
+        build_variants(first.pk)
+        files = self.variant_files()
+        build_variants(second.pk)
+        second.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual(second.img_hash, first.img_hash)
+        self.assertEqual(self.variant_files(), files)
+
+    def test_new_image_replaces_the_variants_in_use(self):
+        form = CategoryForm({"category_name": "Games"}, {"img": self.upload()})
+        form.is_valid()
+        with self.captureOnCommitCallbacks(execute=True):
+            category = form.save()
+        category.refresh_from_db()
+        old_hash = category.img_hash
+        form = CategoryForm({"category_name": "Games"}, {"img": self.upload(color="blue")}, instance=category)
+        form.is_valid()
+        with mock.patch("polls.forms.schedule_variants") as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                form.save()
+        schedule.assert_called_once_with(category.pk)
+        category.refresh_from_db()
+        self.assertEqual((category.img_hash, category.img_widths), ("", []))
+        build_variants(category.pk)
+        category.refresh_from_db()
+        self.assertNotEqual(category.img_hash, old_hash)
+
+    def test_categories_page_uses_srcset(self):
+        category = Category.objects.create(category_name="Games", img=self.upload())
+        other = Category.objects.create(category_name="Music", img="polls/images/shutterstock_172355312.0.0.jpg")
+        build_variants(category.pk)
+        category.refresh_from_db()
+        response = self.client.get(reverse("polls:categories"))
+        self.assertContains(
+            response,
+            f'<source type="image/webp" srcset="/media/variants/{category.img_hash[:2]}/{category.img_hash}-402w.webp'
+            f' 402w, /media/variants/{category.img_hash[:2]}/{category.img_hash}-804w.webp 804w,',
+        )
+        self.assertContains(response, f'<img src="/media/variants/{category.img_hash[:2]}/{category.img_hash}-402w.jpg"')
+        # Not built yet: the original is served
+        self.assertContains(response, f'<img src="/static/{other.img.name}" alt="Music">', html=True)
+
+    def test_command_builds_missing_variants(self):
+        """Images shipped as static files are found too, and built ones are skipped"""
+        Category.objects.create(category_name="Games", img=self.upload())
+        Category.objects.create(category_name="Science", img="polls/images/shutterstock_172355312.0.0.jpg")
+        Category.objects.create(category_name="Lost", img="polls/images/missing.jpg")
+        Category.objects.create(category_name="Empty")
+        out, err = io.StringIO(), io.StringIO()
+        call_command("build_category_images", stdout=out, stderr=err)
+        self.assertIn("Games: 402, 804, 1000\nScience: 402, 804, 1200\nBuilt images of 2 categories", out.getvalue())
+        self.assertIn("Lost: image polls/images/missing.jpg not found", err.getvalue())
+        self.assertEqual(Category.objects.exclude(img_hash="").count(), 2)
+        out = io.StringIO()
+        call_command("build_category_images", stdout=out, stderr=io.StringIO())
+        self.assertIn("Built images of 0 categories", out.getvalue())
+
+
+class PollCardCacheTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(category_name="Games")
+        self.author = User.objects.create(username="Kirill")
+        self.questions = [
+            create_question(f"Question {index}", days=-1, category=self.category, user=self.author)
+            for index in range(5)
+        ]
+        self.choice = self.questions[0].choice_set.create(choice_text="Yes")
+
+    def rendered_cards(self, url):
+        with mock.patch("polls.cards.render_to_string", wraps=render_to_string) as render:
+            response = self.client.get(url)
+        return response, [call.args[1]["question"].id for call in render.call_args_list]
+
+    def test_cards_are_rendered_once(self):
+        """The second view of a page renders no card and reads them all with one multi-get"""
+        url = reverse("polls:index")
+        response, rendered = self.rendered_cards(url)
+        self.assertEqual(len(rendered), 5)
+        with mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+            cached, rendered = self.rendered_cards(url)
+        self.assertEqual(rendered, [])
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(cached.content, response.content)
+        # The category page shares the cards
+        self.assertEqual(self.rendered_cards(reverse("polls:category", args=("Games", )))[1], [])
+
+    def test_vote_edit_and_delete_rerender_the_card(self):
+        url = reverse("polls:index")
+        self.client.get(url)
+        voter = User.objects.create(username="voter")
+        with self.captureOnCommitCallbacks(execute=True):
+            record_vote(self.questions[0], self.choice, voter)
+        response, rendered = self.rendered_cards(url)
+        self.assertEqual(rendered, [self.questions[0].id])
+        self.assertContains(response, "1 votes", count=1)
+
+        self.client.force_login(voter)
+        response, rendered = self.rendered_cards(url)
+        # Whether the viewer voted is part of the key
+        self.assertEqual(rendered, [self.questions[0].id])
+        self.assertContains(response, "poll-footer__voted", count=1)
+        self.client.logout()
+
+        question = self.questions[1]
+        question.question_text = "Edited question"
+        with self.captureOnCommitCallbacks(execute=True):
+            question.save()
+        response, rendered = self.rendered_cards(url)
+        self.assertEqual(rendered, [question.id])
+        self.assertContains(response, "Edited question")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.questions[2].delete()
+        response, rendered = self.rendered_cards(url)
+        self.assertEqual(rendered, [])
+        self.assertNotContains(response, "Question 2")
+
+    def test_renaming_the_author_rerenders_the_card(self):
+        url = reverse("polls:index")
+        self.client.get(url)
+        self.author.username = "Renamed"
+        self.author.save()
+        response, rendered = self.rendered_cards(url)
+        self.assertEqual(sorted(rendered), sorted(question.id for question in self.questions))
+        self.assertContains(response, "Renamed", count=5)
+        self.assertNotContains(response, "Kirill")
+
+    def test_card_rendered_before_a_vote_is_not_served_after_it(self):
+        """
+            Cards rendered from rows read before a vote committed are keyed
+            by the old count, so the next page view shows the new one
+        """
+        stale = list(Question.objects.filter(pk=self.questions[0].pk))
+        record_vote(self.questions[0], self.choice, User.objects.create(username="voter"))
+        self.assertIn("0 votes", poll_cards(stale)[0])
+        self.assertContains(self.client.get(reverse("polls:index")), "1 votes", count=1)
+
+    def test_rolled_up_votes_rerender_the_card(self):
+        Question.objects.filter(pk=self.questions[0].pk).update(vote_shards=2)
+        self.questions[0].refresh_from_db()
+        record_vote(self.questions[0], self.choice, User.objects.create(username="voter"))
+        url = reverse("polls:index")
+        self.assertNotContains(self.client.get(url), "1 votes")
+        roll_up_vote_shards()
+        self.assertContains(self.client.get(url), "1 votes", count=1)
+
+
+@override_settings(POLLS_PAGE_SIZE=10)
+class KeysetPaginationTest(CacheClearingTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name="Games")
+        user = User.objects.create(username="Kirill")
+        self.questions = [
+            create_question(f"Question {index}", days=-index, category=category, user=user)
+            for index in range(1, 26)
+        ]
+        # Same pub_date as a neighbour, so the id tie-breaker is exercised
+        self.questions.insert(10, Question.objects.create(
+            question_text="Tie", pub_date=self.questions[9].pub_date, category=category, created_by=user
+        ))
+        self.questions[9:11] = sorted(self.questions[9:11], key=lambda question: -question.pk)
+
+    def test_walk_forward_and_back(self):
+        """
+            Following next cursors visits every question once, newest first,
+            and previous cursors lead back to the same pages
+        """
+        pages = []
+        url = reverse("polls:index")
+        response = self.client.get(url)
+        while True:
+            page = response.context["page"]
+            pages.append(list(page))
+            if not page.has_next:
+                break
+            response = self.client.get(url, {"cursor": page.next_cursor})
+        self.assertEqual([len(page) for page in pages], [10, 10, 6])
+        self.assertEqual(sum(pages, []), self.questions)
+
+        response = self.client.get(url, {"cursor": response.context["page"].previous_cursor})
+        self.assertEqual(list(response.context["page"]), pages[1])
+        response = self.client.get(url, {"cursor": response.context["page"].previous_cursor})
+        self.assertEqual(list(response.context["page"]), pages[0])
+        self.assertFalse(response.context["page"].has_previous)
+
+    def test_invalid_cursor_shows_first_page(self):
+        """
+            A malformed cursor falls back to the first page
+        """
+        response = self.client.get(reverse("polls:index"), {"cursor": "not-a-cursor"})
+        self.assertEqual(list(response.context["page"]), self.questions[:10])
+
+    def crafted_cursor(self, *values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+    def test_cursor_with_naive_datetime_is_rejected(self):
+        cursor = self.crafted_cursor("2026-01-01T00:00:00", self.questions[0].pk, "next")
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(cursor)
+        response = self.client.get(reverse("polls:index"), {"cursor": cursor})
+        self.assertEqual(list(response.context["page"]), self.questions[:10])
+
+    def test_cursor_with_unknown_direction_is_rejected(self):
+        cursor = encode_cursor(self.questions[0].pub_date, self.questions[0].pk, "sideways")
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(cursor)
+
+    def test_cursor_with_non_integer_pk_is_rejected(self):
+        pub_date = self.questions[0].pub_date.isoformat()
+        for pk in ("5", 5.5, None, True):
+            with self.subTest(pk=pk), self.assertRaises(InvalidCursor):
+                decode_cursor(self.crafted_cursor(pub_date, pk, "next"))
+
+
+class ConcurrentPollCreationTest(TransactionTestCase):
+    threads = 4
+    polls_per_thread = 10
+
+    def test_concurrent_creation_waits_for_the_lock(self):
+        """
+            Threads creating polls at once on SQLite queue on the write lock
+            instead of failing with "database is locked"
+        """
+        users = User.objects.bulk_create(User(username=f"author{index}") for index in range(self.threads))
+        errors = []
+        start = threading.Barrier(self.threads)
+
+        def worker(user):
+            try:
+                start.wait()
+                for index in range(self.polls_per_thread):
+                    create_polls(user, [{
+                        "question_text": f"Question {index} by {user.username}",
+                        "category": f"Category {index % 3}",
+                        "choices": ["Yes", "No"],
+                    }])
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(user, )) for user in users]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Question.objects.count(), self.threads * self.polls_per_thread)
+        self.assertEqual(Choice.objects.count(), 2 * self.threads * self.polls_per_thread)
+
+    @skipUnless(uses_fts(), "needs SQLite FTS5")
+    def test_concurrently_created_polls_are_searchable(self):
+        """
+            The search triggers index every poll created by concurrent
+            requests, and none of the requests fails on the lock
+        """
+        users = User.objects.bulk_create(User(username=f"author{index}") for index in range(self.threads))
+        statuses = []
+        errors = []
+        start = threading.Barrier(self.threads)
+
+        def worker(user):
+            client = Client()
+            client.force_login(user)
+            try:
+                start.wait()
+                for index in range(self.polls_per_thread):
+                    statuses.append(client.post(reverse("polls:new_poll"), {
+                        "question_text": f"Searchable {user.username} {index}", "category": "Games",
+                        "choice_text_1": "Yes", "choice_text_2": "No",
+                    }).status_code)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        Category.objects.create(category_name="Games")
+        category_registry.invalidate()
+        workers = [threading.Thread(target=worker, args=(user, )) for user in users]
+        with override_settings(THROTTLE_RULES={}):
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(statuses, [302] * self.threads * self.polls_per_thread)
+        self.assertEqual(
+            filter_questions(Question.objects.all(), "searchable").count(), self.threads * self.polls_per_thread
+        )
+
+
+class ConcurrentVoteTest(TransactionTestCase):
+    threads = 8
+    votes_per_thread = 25
+
+    def test_concurrent_votes_are_all_counted(self):
+        """
+            Many threads voting at once on SQLite lose no counter updates and
+            cannot record a user's vote twice
+        """
+        category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        question = create_question("Hot question", days=-1, category=category, user=author)
+        choice = question.choice_set.create(choice_text="Yes")
+        voters = User.objects.bulk_create(
+            User(username=f"voter{index}") for index in range(self.threads * self.votes_per_thread)
+        )
+        errors = []
+        duplicates = []
+        start = threading.Barrier(self.threads)
+
+        def worker(batch):
+            try:
+                start.wait()
+                for voter in batch:
+                    record_vote(question, choice, voter)
+                    try:
+                        record_vote(question, choice, voter)
+                    except AlreadyVoted:
+                        duplicates.append(voter)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=worker, args=(voters[index::self.threads], ))
+            for index in range(self.threads)
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(duplicates), len(voters))
+        choice.refresh_from_db()
+        question.refresh_from_db()
+        self.assertEqual(Vote.objects.filter(question=question).count(), len(voters))
+        self.assertEqual(choice.votes, len(voters))
+        self.assertEqual(question.total_votes, len(voters))
+
+    def test_roll_up_runs_during_concurrent_votes(self):
+        """
+            Rolling up the shards of a poll while threads vote on it neither
+            fails on SQLite's lock nor loses votes
+        """
+        category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        question = create_question("Hot question", days=-1, category=category, user=author)
+        Question.objects.filter(pk=question.pk).update(vote_shards=4)
+        question.refresh_from_db()
+        choice = question.choice_set.create(choice_text="Yes")
+        voters = User.objects.bulk_create(
+            User(username=f"voter{index}") for index in range(self.threads * self.votes_per_thread)
+        )
+        errors = []
+        voting = threading.Barrier(self.threads + 1)
+        done = threading.Event()
+
+        def vote(batch):
+            try:
+                voting.wait()
+                for voter in batch:
+                    record_vote(question, choice, voter)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        def roll_up():
+            try:
+                voting.wait()
+                # Pause like the roll-up command does: SQLite's busy wait is
+                # not fair, so a roller taking the lock back to back could
+                # starve the voters past the busy timeout
+                while not done.wait(0.005):
+                    roll_up_vote_shards()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=vote, args=(voters[index::self.threads], ))
+            for index in range(self.threads)
+        ]
+        roller = threading.Thread(target=roll_up)
+        for thread in workers + [roller]:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        done.set()
+        roller.join()
+
+        self.assertEqual(errors, [])
+        roll_up_vote_shards()
+        choice.refresh_from_db()
+        question.refresh_from_db()
+        self.assertEqual(choice.votes, len(voters))
+        self.assertEqual(question.total_votes, len(voters))
+
+    def test_decay_runs_during_concurrent_votes(self):
+        """
+            Decaying the trending scores while threads vote neither fails on
+            SQLite's lock nor loses votes
+        """
+        category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        question = create_question("Hot question", days=-1, category=category, user=author)
+        choice = question.choice_set.create(choice_text="Yes")
+        voters = User.objects.bulk_create(
+            User(username=f"voter{index}") for index in range(self.threads * self.votes_per_thread)
+        )
+        errors = []
+        voting = threading.Barrier(self.threads + 1)
+        done = threading.Event()
+
+        def vote(batch):
+            try:
+                voting.wait()
+                for voter in batch:
+                    record_vote(question, choice, voter)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        def decay():
+            try:
+                voting.wait()
+                while not done.wait(0.005):
+                    decay_trending_scores()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=vote, args=(voters[index::self.threads], ))
+            for index in range(self.threads)
+        ]
+        decayer = threading.Thread(target=decay)
+        for thread in workers + [decayer]:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        done.set()
+        decayer.join()
+
+        self.assertEqual(errors, [])
+        choice.refresh_from_db()
+        question.refresh_from_db()
+        self.assertEqual(choice.votes, len(voters))
+        self.assertEqual(question.total_votes, len(voters))
+
+    def test_journal_applies_during_concurrent_votes(self):
+        """
+            Applying journalled votes while threads vote directly neither fails
+            on SQLite's lock nor loses votes
+        """
+        category = Category.objects.create(category_name="Games")
+        author = User.objects.create(username="Kirill")
+        question = create_question("Hot question", days=-1, category=category, user=author)
+        choice = question.choice_set.create(choice_text="Yes")
+        voters = User.objects.bulk_create(
+            User(username=f"voter{index}") for index in range(2 * self.threads * self.votes_per_thread)
+        )
+        direct, journalled = voters[::2], voters[1::2]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "votes.log")
+        journal = VoteJournal(path, commit_delay=0)
+        for voter in journalled:
+            journal.append(question.pk, choice.pk, voter.pk)
+        journal.close()
+        errors = []
+        voting = threading.Barrier(self.threads + 1)
+
+        def vote(batch):
+            try:
+                voting.wait()
+                for voter in batch:
+                    record_vote(question, choice, voter)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        def apply():
+            try:
+                voting.wait()
+                while apply_journal(batch_size=5):
+                    pass
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=vote, args=(direct[index::self.threads], )) for index in range(self.threads)
+        ] + [threading.Thread(target=apply)]
+        with override_settings(VOTE_JOURNAL_PATH=path):
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        choice.refresh_from_db()
+        self.assertEqual(choice.votes, len(voters))
+        self.assertEqual(Vote.objects.filter(question=question).count(), len(voters))
@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .locking import lock_for_writing
+from .models import Question, Checkpoint
+
+CHECKPOINT_NAME = "trending_decay"
+# Scores that decay below this are set to 0, so they leave the score index
+# range the decay job walks
+FLOOR = 0.01
+
+
+def decay_trending_scores(now=None):
+    """
+        Decay every trending score for the time since the previous run.
+
+        Votes add 1 to Question.trending_score as they are recorded, and this
+        multiplies the scores by 0.5 ** (elapsed / POLLS_TRENDING_HALF_LIFE),
+        so a score is the number of recent votes with each vote's weight
+        halving every half-life. Run it every few minutes: a vote counts in
+        full until the next run, so the interval bounds the error. Only
+        questions with a score are touched, found through the score index.
+        Returns the number of scores decayed.
+    """
+    now = time.time() if now is None else now
+    with transaction.atomic():
+        # select_for_update() is a no-op on SQLite, so take its write lock
+        # before reading the checkpoint
+        lock_for_writing()
+        checkpoint, created = Checkpoint.objects.select_for_update().get_or_create(
+            name=CHECKPOINT_NAME, defaults={"offset": int(now * 1_000_000)}
+        )
+        elapsed = now - checkpoint.offset / 1_000_000
+        if created or elapsed <= 0:
+            return 0
+        factor = 0.5 ** (elapsed / settings.POLLS_TRENDING_HALF_LIFE)
+        decayed = Question.objects.filter(trending_score__gt=0).update(trending_score=F("trending_score") * factor)
+        Question.objects.filter(trending_score__gt=0, trending_score__lt=FLOOR).update(trending_score=0)
+        checkpoint.offset = int(now * 1_000_000)
+        checkpoint.save(update_fields=["offset", "updated_at"])
+    return decayed
+
+
+def trending_questions(category_id=None, limit=20, now=None):
+    """
+        The `limit` published questions with the highest trending score,
+        read from the top of the score index (per category with
+        `category_id`) without looking at votes.
+    """
+    queryset = Question.objects.select_related("created_by").filter(
+        trending_score__gt=0, pub_date__lte=now or timezone.now()
+    )
+    if category_id is not None:
+        queryset = queryset.filter(category_id=category_id)
+    return list(queryset.order_by("-trending_score", "-id")[:limit])
@@ -1,20 +1,40 @@
+from django.conf import settings
 from django.urls import path
 
 
-from . import views
+from . import views, async_views
 
 app_name = "polls"
 
-urlpatterns = [
-    path("", views.IndexView.as_view(), name="index"),
-    path("<int:pk>/", views.detail_view, name="details"),
-    path("results/<int:pk>", views.Result.as_view(), name="results"),
+if settings.POLLS_ASYNC_VIEWS:
+    read_views = [
+        path("", async_views.index, name="index"),
+        path("<int:pk>/", async_views.detail_view, name="details"),
+        path("results/<int:pk>", async_views.results, name="results"),
+        path("category/<str:cat>", async_views.category, name="category"),
+    ]
+else:
+    read_views = [
+        path("", views.IndexView.as_view(), name="index"),
+        path("<int:pk>/", views.detail_view, name="details"),
+        path("results/<int:pk>", views.Result.as_view(), name="results"),
+        path("category/<str:cat>", views.category, name="category"),
+    ]
+
+urlpatterns = read_views + [
+    path("results/<int:pk>/stream", views.results_stream, name="results_stream"),
+    path("results/<int:pk>/json", views.results_json, name="results_json"),
     path("<int:question_id>/vote", views.vote, name="vote"),
     path("new_poll/", views.new_poll, name="new_poll"),
+    path("api/polls/", views.create_polls_api, name="create_polls_api"),
     path("delete_poll/<int:pk>", views.delete_poll, name="delete_poll"),
     path("edit_poll/<int:pk>", views.edit_poll, name="edit_poll"),
     path("categories/", views.Categories.as_view(), name="categories"),
-    path("category/<str:cat>", views.category, name="category"),
     path("category_list/", views.category_list, name="category_list"),
-    path("about/", views.about, name="about")
+    path("trending/", views.trending, name="trending"),
+    path("trending/<str:cat>", views.trending, name="category_trending"),
+    path("search/", views.search_view, name="search"),
+    path("api/search/", views.search_api, name="search_api"),
+    path("about/", views.about, name="about"),
+    path("export/", views.export, name="export"),
 ]
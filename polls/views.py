@@ -1,15 +1,30 @@
 from typing import Any
+from asgiref.sync import sync_to_async
 from django.db import models
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponseRedirect, Http404, JsonResponse, HttpResponse
+from django.http import HttpResponseRedirect, Http404, JsonResponse, HttpResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.views import generic
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from rest_framework.exceptions import ParseError
 from rest_framework.parsers import JSONParser
-from .models import Question, Choice, Vote, Category
-from .serializers import CategorySerializer
+from .models import Question, Choice
+from .serializers import CategorySerializer, PollSerializer
 from .forms import CreateQuestionForm, CreateChoiceForm
+from .pagination import paginate_by_pub_date, InvalidCursor, KeysetPage
+from .voting import record_vote, AlreadyVoted
+from .journal import get_journal
+from .cache import get_results, voted_question_ids, mark_voted
+from .registry import category_registry
+from .export import export_lines, parse_since, ExportError, FORMATS
+from .creation import MIN_CHOICES, TOO_FEW_CHOICES, create_polls
+from .live import results_events, results_payload
+from .search import search
+from .trending import trending_questions
+from .stats import category_stats, stats_for
 # Create your views here.
 
 
@@ -18,22 +33,47 @@ class IndexView(generic.ListView):
     context_object_name = "latest_question_list"
 
     def get_queryset(self):
-        """Return last five published questions"""
-        return Question.objects.filter(pub_date__lte=timezone.now()).order_by("-pub_date")
+        """Return one page of published questions, newest first"""
+        self.page = published_page(
+            Question.objects.select_related("created_by"),
+            self.request.GET.get("cursor"),
+        )
+        return self.page.object_list
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page"] = self.page
+        context["voted_ids"] = voted_ids(self.request)
+        return context
 
-def detail_view(request, pk):
-    question = get_object_or_404(Question, pk=pk)
-    if question.pub_date > timezone.now():
+
+def voted_ids(request):
+    if not request.user.is_authenticated:
+        return frozenset()
+    return voted_question_ids(request.user)
+
+
+def published_page(queryset, cursor):
+    try:
+        return paginate_by_pub_date(queryset, cursor, settings.POLLS_PAGE_SIZE)
+    except InvalidCursor:
+        return paginate_by_pub_date(queryset, None, settings.POLLS_PAGE_SIZE)
+
+
+def published_results_or_404(pk):
+    results = get_results(pk)
+    if results is None or results.pub_date > timezone.now():
         raise Http404()
+    return results
+
+
+def detail_view(request, pk):
+    question = published_results_or_404(pk)
     if request.user.is_authenticated:
-        if question.created_by == request.user:
+        if question.created_by_id == request.user.id:
             return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
-        try:
-            Vote.objects.get(voted_by=request.user, question=question)
+        if question.id in voted_question_ids(request.user):
             return render(request, "polls/results.html", {"question": question})
-        except Vote.DoesNotExist:
-            pass
     return render(request, "polls/details.html", {"question": question})
 
 
@@ -41,8 +81,31 @@ class Result(generic.DetailView):
     template_name = "polls/results.html"
     context_object_name = "question"
 
-    def get_queryset(self):
-        return Question.objects.filter(pub_date__lte=timezone.now())
+    def get_object(self, queryset=None):
+        return published_results_or_404(self.kwargs["pk"])
+
+
+async def results_stream(request, pk):
+    """
+    Push the results of a question as Server-Sent Events. Needs the ASGI application.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the stream would hold a worker thread forever
+        return HttpResponse("Live results need the ASGI server", status=501)
+    results = await sync_to_async(published_results_or_404)(pk)
+    response = StreamingHttpResponse(results_events(results.id, results), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def results_json(request, pk):
+    """
+    The results of a question as in a live update, for clients polling where the stream is not available.
+    """
+    response = JsonResponse(results_payload(published_results_or_404(pk)))
+    response["Cache-Control"] = "no-cache"
+    return response
 
 
 def vote(request, question_id):
@@ -56,13 +119,20 @@ def vote(request, question_id):
     except (KeyError, Choice.DoesNotExist):
         return render(request, "polls/details.html",
                       {
-                            "question": question,
+                            "question": get_results(question.id),
                             "error_message": "You didn't select a choice"
                        })
     else:
-        Vote.objects.create(question=question, voted_on=selected_choice, voted_by=request.user)
-        selected_choice.votes += 1
-        selected_choice.save()
+        if question.id in voted_question_ids(request.user):
+            pass
+        elif settings.VOTE_JOURNAL_ENABLED:
+            get_journal().append(question.pk, selected_choice.pk, request.user.pk)
+            mark_voted(request.user, question.pk)
+        else:
+            try:
+                record_vote(question, selected_choice, request.user)
+            except AlreadyVoted:
+                pass
         return HttpResponseRedirect(reverse("polls:results", args=(question.id, )))
 
 
@@ -70,34 +140,74 @@ def new_poll(request):
     if not request.user.is_authenticated:
         return HttpResponseRedirect(reverse("login:index"))
 
+    categories = category_registry.all()
     if request.method == "POST":
-        created_by = request.user
-        question_text = request.POST["question_text"]
-        pub_date = timezone.now()
-        new_question = Question(question_text=question_text, created_by=created_by, pub_date=pub_date, category_id=6)
-        new_question.save()
-
-        index = 1
-        while True:
-            value = request.POST.get(f"choice_text_{index}", None)
-            print(value)
-            if value:
-                new_question.choice_set.create(choice_text=value)
-            else:
-                break
-            index += 1
-
-        return HttpResponseRedirect(reverse("polls:index"))
+        q_form = CreateQuestionForm(request.POST, categories=categories)
+        choices = choice_texts(request.POST)
+        if q_form.is_valid() and len(choices) >= MIN_CHOICES:
+            create_polls(request.user, [{
+                "question_text": q_form.cleaned_data["question_text"],
+                "category": q_form.cleaned_data["category"],
+                "choices": choices,
+            }])
+            return HttpResponseRedirect(reverse("polls:index"))
+        error_messages = [error for errors in q_form.errors.values() for error in errors]
+        if len(choices) < MIN_CHOICES:
+            error_messages.append(TOO_FEW_CHOICES)
+        return render(request, "polls/new_poll.html", {
+            "question_form": q_form,
+            "categories": categories,
+            "error_messages": error_messages,
+        })
 
     elif request.method == "GET":
-        q_form = CreateQuestionForm()
+        q_form = CreateQuestionForm(categories=categories)
 
         return render(request, "polls/new_poll.html",
                       {
                         "question_form": q_form,
+                        "categories": categories,
                       })
 
 
+def choice_texts(data):
+    """The non-empty choice_text_1, choice_text_2, ... values of a poll form"""
+    choices = []
+    index = 1
+    while f"choice_text_{index}" in data:
+        value = data[f"choice_text_{index}"].strip()
+        if value:
+            choices.append(value)
+        index += 1
+    return choices
+
+
+@csrf_exempt
+def create_polls_api(request):
+    """
+    Create a batch of polls, with their choices and categories, from a JSON list.
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": "Method not allowed"}, status=405)
+    if not request.user.is_authenticated:
+        return JsonResponse({"detail": "Authentication required"}, status=401)
+    # Only JSON bodies are accepted, which a cross-site form cannot send
+    if request.content_type != "application/json":
+        return JsonResponse({"detail": "Expected application/json"}, status=415)
+
+    try:
+        data = JSONParser().parse(request)
+    except ParseError as error:
+        return JsonResponse({"detail": str(error.detail)}, status=400)
+    serializer = PollSerializer(
+        data=data, many=True, max_length=settings.POLLS_CREATE_MAX_BATCH, context={"user": request.user}
+    )
+    if serializer.is_valid():
+        serializer.save()
+        return JsonResponse(serializer.data, safe=False, status=201)
+    return JsonResponse(serializer.errors, safe=False, status=400)
+
+
 def delete_poll(request, pk):
     if not request.user.is_authenticated:
         return HttpResponseRedirect(reverse("login:index"))
@@ -123,7 +233,10 @@ def edit_poll(request, pk):
     poll = get_object_or_404(Question, pk=pk)
 
     if poll.created_by != request.user:
-        return render(request, "polls/results.html", {"error_messages": ["You can edit this poll"], "question": poll})
+        return render(request, "polls/results.html", {
+            "error_messages": ["You can edit this poll"],
+            "question": get_results(poll.id)
+        })
 
     if request.method == "GET":
         q_form = CreateQuestionForm()
@@ -143,7 +256,7 @@ def edit_poll(request, pk):
                 break
 
         poll.question_text = request.POST["question_text"]
-        poll.save()
+        poll.save(update_fields=["question_text"])
         return HttpResponseRedirect(reverse("polls:results", args=(poll.id,)))
 
 
@@ -152,12 +265,83 @@ class Categories(generic.ListView):
     context_object_name = "categories"
 
     def get_queryset(self):
-        return Category.objects.all().order_by("-pub_date")
+        return category_registry.all()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        stats = category_stats()
+        context["category_rows"] = [(category, stats_for(stats, category)) for category in context["categories"]]
+        return context
 
 
 def category(request, cat):
-    polls = Question.objects.filter(category__category_name=cat, pub_date__lte=timezone.now()).order_by("-pub_date")
-    return render(request, "polls/category.html", {"polls": polls, "category": cat})
+    found = category_registry.get(cat)
+    if found is None:
+        page = KeysetPage()
+    else:
+        page = published_page(
+            Question.objects.select_related("created_by").filter(category_id=found.pk),
+            request.GET.get("cursor"),
+        )
+    return render(request, "polls/category.html", {
+        "polls": page.object_list,
+        "page": page,
+        "category": cat,
+        "voted_ids": voted_ids(request),
+    })
+
+
+def search_page(request):
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        page = 1
+    return search(request.GET.get("q", ""), page, settings.POLLS_PAGE_SIZE)
+
+
+def search_view(request):
+    page = search_page(request)
+    return render(request, "polls/search.html", {
+        "page": page,
+        "polls": page.object_list,
+        "voted_ids": voted_ids(request),
+    })
+
+
+def search_api(request):
+    """
+    Ranked search results as JSON, one page at a time.
+    """
+    page = search_page(request)
+    return JsonResponse({
+        "query": page.query,
+        "page": page.number,
+        "next_page": page.next_page_number if page.has_next else None,
+        "results": [
+            {
+                "id": question.id,
+                "question_text": question.question_text,
+                "pub_date": question.pub_date,
+                "total_votes": question.total_votes,
+                "created_by": question.created_by.username,
+                "url": reverse("polls:details", args=(question.id,)),
+            }
+            for question in page.object_list
+        ],
+    })
+
+
+def trending(request, cat=None):
+    if cat is None:
+        polls = trending_questions(limit=settings.POLLS_TRENDING_SIZE)
+    else:
+        found = category_registry.get(cat)
+        polls = [] if found is None else trending_questions(found.pk, settings.POLLS_TRENDING_SIZE)
+    return render(request, "polls/trending.html", {
+        "polls": polls,
+        "category": cat,
+        "voted_ids": voted_ids(request),
+    })
 
 
 def about(request):
@@ -170,8 +354,8 @@ def category_list(request):
     List all code snippets, or create a new snippet.
     """
     if request.method == 'GET':
-        categories = Category.objects.all()
-        serializer = CategorySerializer(categories, many=True)
+        categories = sorted(category_registry.all(), key=lambda category: category.pk)
+        serializer = CategorySerializer(categories, many=True, context={"stats": category_stats()})
         return JsonResponse(serializer.data, safe=False)
 
     elif request.method == 'POST':
@@ -180,4 +364,27 @@ def category_list(request):
         if serializer.is_valid():
             serializer.save()
             return JsonResponse(serializer.data, status=201)
-        return JsonResponse(serializer.errors, status=400)
\ No newline at end of file
+        return JsonResponse(serializer.errors, status=400)
+
+
+def export(request):
+    """
+    Stream questions, choices and votes as NDJSON or CSV for analytics.
+    """
+    if not request.user.is_authenticated:
+        return HttpResponseRedirect(reverse("login:index"))
+    if not request.user.is_staff:
+        return HttpResponse("Permission denied", status=403)
+
+    output_format = request.GET.get("format", "ndjson")
+    try:
+        since_id = int(request.GET["since_id"]) if request.GET.get("since_id") else None
+        lines = export_lines(
+            request.GET.get("kind", "questions,choices,votes").split(","),
+            output_format,
+            since_id=since_id,
+            since=parse_since(request.GET.get("since")),
+        )
+    except (ValueError, ExportError) as error:
+        return HttpResponse(str(error), status=400)
+    return StreamingHttpResponse(lines, content_type=FORMATS[output_format])
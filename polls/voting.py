@@ -0,0 +1,91 @@
+import random
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .locking import lock_for_writing
+from .models import Question, Choice, ChoiceVoteShard, Vote
+from .signals import invalidate_question
+from .cache import mark_voted
+from .stats import add_to_category_stats, add_votes_by_question
+
+
+class AlreadyVoted(Exception):
+    """ user has already voted in this poll """
+
+
+def record_vote(question, choice, user):
+    """
+        Store `user`'s vote for `choice` and bump the vote counters.
+
+        The Vote insert and the counter increments commit together, and the
+        counters are incremented in SQL so concurrent voters never overwrite
+        each other's updates. A second vote by the same user violates the
+        unique (question, voted_by) constraint and raises AlreadyVoted.
+
+        Polls with more than one vote shard spread their increments over
+        ChoiceVoteShard rows instead of the single Choice row; the totals and
+        the trending score catch up in roll_up_vote_shards().
+    """
+    try:
+        with transaction.atomic():
+            Vote.objects.create(question=question, voted_on=choice, voted_by=user)
+            if question.vote_shards > 1:
+                increment_shard(choice, random.randrange(question.vote_shards))
+            else:
+                Choice.objects.filter(pk=choice.pk).update(votes=F("votes") + 1)
+                Question.objects.filter(pk=question.pk).update(
+                    total_votes=F("total_votes") + 1, trending_score=F("trending_score") + 1
+                )
+                add_to_category_stats(question.category_id, votes=1)
+    except IntegrityError:
+        mark_voted(user, question.pk)
+        raise AlreadyVoted(question.pk)
+    invalidate_question(question.pk)
+    mark_voted(user, question.pk)
+
+
+def increment_shard(choice, shard):
+    if ChoiceVoteShard.objects.filter(choice=choice, shard=shard).update(votes=F("votes") + 1):
+        return
+    try:
+        with transaction.atomic():
+            ChoiceVoteShard.objects.create(choice=choice, shard=shard, votes=1)
+    except IntegrityError:
+        # Another voter created the row first
+        ChoiceVoteShard.objects.filter(choice=choice, shard=shard).update(votes=F("votes") + 1)
+
+
+def roll_up_vote_shards():
+    """
+        Fold the votes held in shard rows into Choice.votes and
+        Question.total_votes. Returns the number of votes moved.
+    """
+    with transaction.atomic():
+        # select_for_update() is a no-op on SQLite, so take its write lock
+        # before reading the shards
+        lock_for_writing()
+        shards = list(
+            ChoiceVoteShard.objects.select_for_update()
+            .filter(votes__gt=0)
+            .values_list("pk", "choice_id", "choice__question_id", "votes")
+        )
+        per_choice = Counter()
+        per_question = Counter()
+        for pk, choice_id, question_id, votes in shards:
+            # Subtract what was read rather than zeroing, so increments that
+            # land after the read are kept for the next roll-up.
+            ChoiceVoteShard.objects.filter(pk=pk).update(votes=F("votes") - votes)
+            per_choice[choice_id] += votes
+            per_question[question_id] += votes
+        for choice_id, votes in per_choice.items():
+            Choice.objects.filter(pk=choice_id).update(votes=F("votes") + votes)
+        for question_id, votes in per_question.items():
+            Question.objects.filter(pk=question_id).update(
+                total_votes=F("total_votes") + votes, trending_score=F("trending_score") + votes
+            )
+        add_votes_by_question(per_question)
+        for question_id in per_question:
+            invalidate_question(question_id)
+    return sum(per_choice.values())